@@ -1,24 +1,10 @@
 import os
-from flask import Flask, current_app
-from flask_login import LoginManager
-from flask_migrate import Migrate
-from flask_wtf.csrf import CSRFProtect
 import logging
 import threading
-from sqlalchemy import func
-from app.controllers.seller_controller import seller_bp 
-from app.controllers.amazon_controller import update_address,become_seller
-
-from app.model import db, User, ProductCategory
-from app.controllers.seller_controller import seller_bp
-from app.controllers.amazon_controller import amazon_bp, api_bp, admin_bp
-from app.controllers.webhook_controller import world_bp, ups_bp
-from app.controllers.cart_controller import bp as cart_bp
-from app.controllers.review_controller import bp as review_bp
-from app.services.amazon_exposed_api import ups_webhooks
-from app.services.world_simulator_service import WorldSimulatorService
-from flask_login import LoginManager, current_user 
-from app.model import db, User, ProductCategory, Cart, CartProduct
+from flask import Flask
+from app.utils.log_config import configure_logging
+
+logger = logging.getLogger(__name__)
 
 
 def create_app(test_config=None):
@@ -38,10 +24,53 @@ def create_app(test_config=None):
             MAX_CONTENT_LENGTH=16 * 1024 * 1024,
             WORLD_HOST=os.environ.get('WORLD_HOST', 'world-simulator'),
             WORLD_PORT=int(os.environ.get('WORLD_PORT', '23456')),
-            PORT=int(os.environ.get('PORT', 8080))
+            PORT=int(os.environ.get('PORT', 8080)),
+            USER_CACHE_SIZE=int(os.environ.get('USER_CACHE_SIZE', '1024')),
+            USER_CACHE_TTL=float(os.environ.get('USER_CACHE_TTL', '30')),
+            PRODUCT_VIEW_CACHE_SIZE=int(os.environ.get('PRODUCT_VIEW_CACHE_SIZE', '2048')),
+            PRODUCT_VIEW_CACHE_TTL=float(os.environ.get('PRODUCT_VIEW_CACHE_TTL', '60')),
+            WAREHOUSE_ROUTER_TTL=float(os.environ.get('WAREHOUSE_ROUTER_TTL', '30')),
+            WAREHOUSE_MAP_TTL=float(os.environ.get('WAREHOUSE_MAP_TTL', '60')),
+            INVENTORY_LOW_STOCK=int(os.environ.get('INVENTORY_LOW_STOCK', '5')),
+            INVENTORY_SNAPSHOT_TTL=float(os.environ.get('INVENTORY_SNAPSHOT_TTL', '300')),
+            REPLENISH_INTERVAL=float(os.environ.get('REPLENISH_INTERVAL', '0')),
+            REPLENISH_DRY_RUN=os.environ.get('REPLENISH_DRY_RUN', '0') == '1',
+            REPLENISH_DEFAULT_REORDER_POINT=int(os.environ.get('REPLENISH_DEFAULT_REORDER_POINT', '0')),
+            REPLENISH_DEFAULT_TARGET=int(os.environ.get('REPLENISH_DEFAULT_TARGET', '0')),
+            REPLENISH_MAX_UNITS=int(os.environ.get('REPLENISH_MAX_UNITS', '0')),
+            WORLD_REQUEST_TIMEOUT=float(os.environ.get('WORLD_REQUEST_TIMEOUT', '30')),
+            WORLD_RECONNECT_BASE_DELAY=float(os.environ.get('WORLD_RECONNECT_BASE_DELAY', '0.5')),
+            WORLD_RECONNECT_MAX_DELAY=float(os.environ.get('WORLD_RECONNECT_MAX_DELAY', '30')),
+            WORLD_RECONNECT_MAX_ATTEMPTS=int(os.environ.get('WORLD_RECONNECT_MAX_ATTEMPTS', '0')),
+            WORLD_QUEUE_POLICY=os.environ.get('WORLD_QUEUE_POLICY', 'block'),
+            WORLD_QUEUE_LIMITS=os.environ.get('WORLD_QUEUE_LIMITS', ''),
+            WORLD_QUEUE_PUT_TIMEOUT=float(os.environ.get('WORLD_QUEUE_PUT_TIMEOUT', '5')),
+            UPS_URL=os.environ.get('UPS_URL', 'http://host.docker.internal:8081/api'),
+            UPS_BATCH_MAX_EVENTS=int(os.environ.get('UPS_BATCH_MAX_EVENTS', '5000')),
+            SHIPMENT_EVENTS_FLUSH_INTERVAL=float(os.environ.get('SHIPMENT_EVENTS_FLUSH_INTERVAL', '1')),
+            SHIPMENT_EVENTS_BATCH_SIZE=int(os.environ.get('SHIPMENT_EVENTS_BATCH_SIZE', '500')),
+            PACK_BATCH_WINDOW=float(os.environ.get('PACK_BATCH_WINDOW', '0.01')),
+            PACK_BATCH_MAX=int(os.environ.get('PACK_BATCH_MAX', '200')),
+            PACK_RETRY_ATTEMPTS=int(os.environ.get('PACK_RETRY_ATTEMPTS', '5')),
+            PACK_RETRY_DELAY=float(os.environ.get('PACK_RETRY_DELAY', '1')),
+            METRICS_ENABLED=os.environ.get('METRICS_ENABLED', '1') != '0',
+            SQL_PROFILER_ENABLED=os.environ.get('SQL_PROFILER_ENABLED', '0') == '1',
+            SQL_PROFILER_SLOW_MS=float(os.environ.get('SQL_PROFILER_SLOW_MS', '100')),
+            SQL_PROFILER_MAX_SLOW=int(os.environ.get('SQL_PROFILER_MAX_SLOW', '100')),
+            SQL_PROFILER_SHOW_PARAMETERS=os.environ.get('SQL_PROFILER_SHOW_PARAMETERS', '0') == '1',
+            WORLD_GATEWAY_URL=os.environ.get('WORLD_GATEWAY_URL'),
+            WORLD_GATEWAY_HOST=os.environ.get('WORLD_GATEWAY_HOST', '127.0.0.1'),
+            WORLD_GATEWAY_PORT=int(os.environ.get('WORLD_GATEWAY_PORT', '8090')),
+            WORLD_GATEWAY_TOKEN=os.environ.get('WORLD_GATEWAY_TOKEN'),
+            WORLD_GATEWAY_THREADS=int(os.environ.get('WORLD_GATEWAY_THREADS', '16')),
+            LOG_LEVEL=os.environ.get('LOG_LEVEL', 'INFO'),
+            LOG_LEVELS=os.environ.get('LOG_LEVELS', 'alembic=WARNING'),
+            LOG_QUEUE=os.environ.get('LOG_QUEUE', '1') != '0',
+            LOG_SAMPLE_EVERY=int(os.environ.get('LOG_SAMPLE_EVERY', '100'))
         )
     else:
         app.config.from_mapping(test_config)
+    app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO'))
 
     try:
         os.makedirs(app.instance_path)
@@ -49,14 +78,36 @@ def create_app(test_config=None):
     except OSError:
         pass
 
-    logging.basicConfig(
-        level=logging.DEBUG,  # 设置为DEBUG可以显示所有级别的日志
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),  # 添加控制台输出处理器
-        ]
+    configure_logging(
+        level=app.config['LOG_LEVEL'],
+        levels=app.config.get('LOG_LEVELS'),
+        use_queue=app.config.get('LOG_QUEUE', True),
+        sample_every=app.config.get('LOG_SAMPLE_EVERY', 100)
     )
 
+    # Imported here rather than at module level so that `import app` (and
+    # `import app.model` from scripts) stays cheap and side-effect free.
+    import click
+    from flask_login import LoginManager, current_user
+    from flask_migrate import Migrate
+    from flask_wtf.csrf import CSRFProtect
+    from sqlalchemy import func
+    from app.model import db, Cart, CartProduct
+    from app.controllers.seller_controller import seller_bp
+    from app.controllers.amazon_controller import amazon_bp, api_bp, admin_bp, update_address, become_seller
+    from app.controllers.webhook_controller import world_bp, ups_bp
+    from app.controllers.cart_controller import bp as cart_bp
+    from app.controllers.review_controller import bp as review_bp
+    from app.controllers.metrics_controller import metrics_bp
+    from app.services.amazon_exposed_api import ups_webhooks
+    from app.services.user_cache import UserIdentityCache
+    from app.services.product_view_cache import ProductViewCache
+    from app.services.warehouse_router import WarehouseRouter
+    from app.services.warehouse_map import WarehouseMapCache
+    from app.services.inventory_snapshot import InventorySnapshot
+    from app.services.shipment_events import ShipmentEventLog
+    from app.services.sql_profiler import SQLProfiler
+
     db.init_app(app)
 
     app.register_blueprint(amazon_bp)
@@ -68,6 +119,9 @@ def create_app(test_config=None):
     app.register_blueprint(review_bp)
     app.register_blueprint(seller_bp)
     app.register_blueprint(ups_webhooks)
+    if app.config.get('METRICS_ENABLED', True):
+        # /metrics plus request and SQL timing hooks
+        app.register_blueprint(metrics_bp)
 
     migrate = Migrate(app, db)
     csrf = CSRFProtect(app)
@@ -79,12 +133,42 @@ def create_app(test_config=None):
     login_manager = LoginManager(app)
     login_manager.login_view = 'amazon.login'
 
+    user_cache = UserIdentityCache(
+        maxsize=app.config.get('USER_CACHE_SIZE', 1024),
+        ttl=app.config.get('USER_CACHE_TTL', 30)
+    )
+    app.config['USER_IDENTITY_CACHE'] = user_cache
+
+    app.config['PRODUCT_VIEW_CACHE'] = ProductViewCache(
+        maxsize=app.config.get('PRODUCT_VIEW_CACHE_SIZE', 2048),
+        ttl=app.config.get('PRODUCT_VIEW_CACHE_TTL', 60)
+    )
+
+    app.config['WAREHOUSE_ROUTER'] = WarehouseRouter(ttl=app.config.get('WAREHOUSE_ROUTER_TTL', 30))
+    app.config['WAREHOUSE_MAP_CACHE'] = WarehouseMapCache(ttl=app.config.get('WAREHOUSE_MAP_TTL', 60))
+    app.config['INVENTORY_SNAPSHOT'] = InventorySnapshot(
+        low_stock_threshold=app.config.get('INVENTORY_LOW_STOCK', 5),
+        ttl=app.config.get('INVENTORY_SNAPSHOT_TTL', 300)
+    )
+    app.config['SHIPMENT_EVENT_LOG'] = ShipmentEventLog(
+        app,
+        flush_interval=app.config.get('SHIPMENT_EVENTS_FLUSH_INTERVAL', 1.0),
+        batch_size=app.config.get('SHIPMENT_EVENTS_BATCH_SIZE', 500)
+    )
+
+    # Off by default; toggled at runtime from /admin/sql-profile
+    app.config['SQL_PROFILER'] = SQLProfiler(
+        app,
+        enabled=app.config.get('SQL_PROFILER_ENABLED', False),
+        slow_threshold=app.config.get('SQL_PROFILER_SLOW_MS', 100) / 1e3,
+        max_slow=app.config.get('SQL_PROFILER_MAX_SLOW', 100),
+        show_parameters=app.config.get('SQL_PROFILER_SHOW_PARAMETERS', False)
+    )
+
     @login_manager.user_loader
     def load_user(user_id):
-         # Use a temporary app context if needed for the query
-         # Although login_manager callbacks usually run within a request context
-         with app.app_context():
-              return User.query.get(int(user_id))
+        # Served from the identity cache; falls back to a single column query on a miss
+        return user_cache.load(int(user_id))
     @app.context_processor
     def inject_cart_count():
         cart_item_count = 0
@@ -96,49 +180,117 @@ def create_app(test_config=None):
                                   .scalar()
                 cart_item_count = count if count is not None else 0
         return dict(cart_item_count=cart_item_count)
-    with app.app_context():
-        db.create_all()
-
-        admin = User.query.filter_by(email='admin@example.com').first()
-        if not admin:
-            admin = User(
-                email='admin@example.com',
-                first_name='Admin',
-                last_name='User',
-                is_seller=True
-            )
-            admin.set_password('admin')
-            db.session.add(admin)
 
-            category = ProductCategory.query.filter_by(category_name='General').first()
-            if not category:
-                category = ProductCategory(category_name='General')
-                db.session.add(category)
-
-            try:
-                 db.session.commit()
-            except Exception as e:
-                 db.session.rollback()
-                 app.logger.error(f"Error committing default admin/category: {e}")
-
-
-        try:
+    try:
+        if app.config.get('WORLD_GATEWAY_URL'):
+            # Web worker in the multi-process profile: the world connection lives in the gateway process
+            from app.services.world_gateway import WorldGatewayClient
+            world_simulator_service = WorldGatewayClient(app.config['WORLD_GATEWAY_URL'],
+                                                         token=app.config.get('WORLD_GATEWAY_TOKEN'))
+            app.logger.info(f"Using world gateway at {app.config['WORLD_GATEWAY_URL']}")
+        else:
+            from app.services.world_simulator_service import WorldSimulatorService
             world_simulator_service = WorldSimulatorService(
                 app=app,
                 host=app.config.get('WORLD_HOST'),
-                port=app.config.get('WORLD_PORT')
+                port=app.config.get('WORLD_PORT'),
+                request_timeout=app.config.get('WORLD_REQUEST_TIMEOUT', 30),
+                reconnect_base_delay=app.config.get('WORLD_RECONNECT_BASE_DELAY', 0.5),
+                reconnect_max_delay=app.config.get('WORLD_RECONNECT_MAX_DELAY', 30),
+                reconnect_max_attempts=app.config.get('WORLD_RECONNECT_MAX_ATTEMPTS', 0),
+                queue_limits=app.config.get('WORLD_QUEUE_LIMITS'),
+                queue_policy=app.config.get('WORLD_QUEUE_POLICY', 'block'),
+                queue_put_timeout=app.config.get('WORLD_QUEUE_PUT_TIMEOUT', 5.0)
             )
-            app.config['DEFAULT_SIM_SPEED'] = 3001 #sp  eed
-            app.config['WORLD_SIMULATOR_SERVICE'] = world_simulator_service
             app.logger.info(f"WorldSimulatorService initialized and stored (Host: {app.config.get('WORLD_HOST')}, Port: {app.config.get('WORLD_PORT')})")
-            app.config['ARRIVED_LOCK'] = threading.Lock()
-            # Initialize the blocking queue for waiting trucks
-            waiting_products = dict()
-            app.config['WAITING_PRODUCTS'] = waiting_products
-        except Exception as e:
-            app.logger.error(f"Failed to initialize WorldSimulatorService: {e}", exc_info=True)
-            app.config['WORLD_SIMULATOR_SERVICE'] = None # Ensure it's None if failed
+            # Concurrent packs for one warehouse leave as one ACommands; see pack_batcher
+            from app.services.pack_batcher import PackBatcher
+            app.config['PACK_BATCHER'] = PackBatcher(
+                app,
+                world_simulator_service,
+                window=app.config.get('PACK_BATCH_WINDOW', 0.01),
+                max_batch=app.config.get('PACK_BATCH_MAX', 200)
+            )
+            # Started on world connect when REPLENISH_INTERVAL > 0; lives next to the world connection
+            from app.services.replenishment_service import ReplenishmentEngine
+            app.config['REPLENISHMENT_ENGINE'] = ReplenishmentEngine(
+                app,
+                interval=app.config.get('REPLENISH_INTERVAL', 0),
+                dry_run=app.config.get('REPLENISH_DRY_RUN', False),
+                default_reorder_point=app.config.get('REPLENISH_DEFAULT_REORDER_POINT', 0),
+                default_target_level=app.config.get('REPLENISH_DEFAULT_TARGET', 0),
+                max_units_per_cycle=app.config.get('REPLENISH_MAX_UNITS', 0)
+            )
+        app.config['DEFAULT_SIM_SPEED'] = 3001 #sp  eed
+        app.config['WORLD_SIMULATOR_SERVICE'] = world_simulator_service
+        app.config['ARRIVED_LOCK'] = threading.Lock()
+        # Initialize the blocking queue for waiting trucks
+        waiting_products = dict()
+        app.config['WAITING_PRODUCTS'] = waiting_products
+    except Exception as e:
+        app.logger.error(f"Failed to initialize WorldSimulatorService: {e}", exc_info=True)
+        app.config['WORLD_SIMULATOR_SERVICE'] = None # Ensure it's None if failed
+
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Create tables plus the default admin user and product category."""
+        bootstrap_database()
+
+    @app.cli.command('replenish')
+    @click.option('--send', is_flag=True, help='Send the purchases instead of only printing the plan.')
+    def replenish_command(send):
+        """Run one replenishment cycle (dry run unless --send)."""
+        engine = app.config.get('REPLENISHMENT_ENGINE')
+        if engine is None:
+            raise SystemExit("Replenishment runs in the process that owns the world connection.")
+        success, report = engine.run_cycle(dry_run=not send)
+        for item in report['plan']:
+            click.echo(f"warehouse {item['warehouse_id']:>5}  product {item['product_id']:>7}  "
+                       f"on hand {item['on_hand']:>6}  on order {item['on_order']:>6}  buy {item['quantity']:>6}")
+        click.echo(f"{report['shortfalls']} shortfalls, {report['units']} units across {report['warehouses']} warehouses"
+                   f"{'' if report['sent'] else ' (not sent)'}")
+        if not success:
+            raise SystemExit(report.get('error', 'Replenishment failed'))
+
+    @app.cli.command('world-gateway')
+    def world_gateway_command():
+        """Run the shared world connection as a standalone gateway process."""
+        from app.services.world_gateway import LOOPBACK_HOSTS, serve_world_gateway
+        if app.config.get('WORLD_GATEWAY_URL'):
+            raise SystemExit("Unset WORLD_GATEWAY_URL: the gateway process must own the world connection itself.")
+        if not app.config.get('WORLD_GATEWAY_TOKEN') and app.config['WORLD_GATEWAY_HOST'] not in LOOPBACK_HOSTS:
+            raise SystemExit("Set WORLD_GATEWAY_TOKEN to serve the world gateway on a non-loopback address.")
+        serve_world_gateway(host=app.config['WORLD_GATEWAY_HOST'], port=app.config['WORLD_GATEWAY_PORT'],
+                            threads=app.config.get('WORLD_GATEWAY_THREADS', 16))
 
-    return app 
+    return app
 
-app = create_app()
\ No newline at end of file
+
+def bootstrap_database():
+    """One-off setup (run via `flask bootstrap`); needs an app context."""
+    from app.model import db, User, ProductCategory
+
+    db.create_all()
+
+    admin = User.query.filter_by(email='admin@example.com').first()
+    if not admin:
+        admin = User(
+            email='admin@example.com',
+            first_name='Admin',
+            last_name='User',
+            is_seller=True
+        )
+        admin.set_password('admin')
+        db.session.add(admin)
+
+        category = ProductCategory.query.filter_by(category_name='General').first()
+        if not category:
+            category = ProductCategory(category_name='General')
+            db.session.add(category)
+
+        try:
+            db.session.commit()
+            logger.info("Created default admin user and category")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error committing default admin/category: {e}")
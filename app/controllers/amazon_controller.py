@@ -8,18 +8,21 @@ from app.services.shipment_service import ShipmentService
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import os
-from app.utils.mapping import convert_sim_coords_to_latlon
+from app.utils.mapping import project_point
 from flask_wtf.csrf import generate_csrf  # Add this import
 from flask_wtf import FlaskForm
 from sqlalchemy import func
 from app.model import db, Warehouse, WarehouseProduct 
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.models.review import ReviewService
 from app.forms import LoginForm, RegistrationForm, EditProfileForm 
 from flask import abort
 import logging
-from app.models.inventory import Inventory 
 from app.model import db, WorldMessage 
+from app.services.user_cache import invalidate_user
+from app.services.product_view_cache import build_product_view
+from app.services.warehouse_map import build_map_payload
+from app.services.shipment_analytics import latency_report
 
 logger = logging.getLogger(__name__)
 amazon_bp = Blueprint('amazon', __name__)
@@ -156,50 +159,18 @@ def product_list():
 
 @amazon_bp.route('/products/<int:product_id>')
 def product_detail(product_id):
-    warehouse_service = WarehouseService() 
-    
-    product = Product.query.get_or_404(product_id)
-    sellers_inventory_objects = Inventory.get_sellers_for_product(product_id)
-    product.inventory = sellers_inventory_objects 
-
-    inventory = warehouse_service.get_product_inventory(product_id) 
-    related_products = Product.query.filter(
-        Product.category_id == product.category_id,
-        Product.product_id != product.product_id
-    ).limit(4).all()
-
-    try:
-        avg_rating, review_count = ReviewService.get_avg_rating_product(product_id)
-        rating_distribution = ReviewService.get_rating_distribution(product_id)
-
-        product.avg_rating = avg_rating if avg_rating is not None else 0
-        product.review_count = review_count if review_count is not None else 0
-        product.rating_distribution = rating_distribution if rating_distribution else {}
-
-        if product.owner:
-            product.owner_name = f"{product.owner.first_name} {product.owner.last_name}"
-        else:
-            product.owner_name = "Unknown Seller"
-
-        if product.category:
-            product.category_name = product.category.category_name
-        else:
-            product.category_name = "Uncategorized"
-
-        product.warehouses = inventory
+    product_cache = current_app.config.get('PRODUCT_VIEW_CACHE')
+    if product_cache:
+        view = product_cache.get_or_build(product_id, build_product_view)
+    else:
+        view = build_product_view(product_id)
 
-    except Exception as e:
-        current_app.logger.error(f"Error fetching review/extra stats for product {product_id}: {e}")
-        product.avg_rating = 0
-        product.review_count = 0
-        product.rating_distribution = {}
-        product.owner_name = "Error fetching seller"
-        product.category_name = "Error fetching category"
-        product.warehouses = []
+    if view is None:
+        abort(404)
 
     return render_template('product_detail.html',
-                           product=product,
-                           related_products=related_products)
+                           product=view.product,
+                           related_products=view.related_products)
 
 
 @amazon_bp.route('/cart')
@@ -393,27 +364,12 @@ def shipment_detail(shipment_id):
          warehouse_x, warehouse_y = None, None
     else:
          warehouse_x, warehouse_y = warehouse.x, warehouse.y
-         # Convert warehouse coordinates
-         # Create a temporary object/dict structure expected by convert_sim_coords_to_latlon
-         temp_wh_for_mapping = type('obj', (object,), {'warehouse_id': warehouse.warehouse_id, 'x': warehouse.x, 'y': warehouse.y, 'active': warehouse.active})()
-         mapped_wh = convert_sim_coords_to_latlon([temp_wh_for_mapping])
-         if mapped_wh:
-             warehouse_lat = mapped_wh[0].get('lat')
-             warehouse_lon = mapped_wh[0].get('lon')
-         else:
-             warehouse_lat, warehouse_lon = None, None
+         warehouse_lat, warehouse_lon = project_point(warehouse.x, warehouse.y)
+         if warehouse_lat is None:
              logger.warning(f"Could not convert warehouse coordinates for WH ID {warehouse.warehouse_id}")
 
-
-    # Convert destination coordinates
-    # Create a temporary object/dict for the destination
-    temp_dest_for_mapping = type('obj', (object,), {'warehouse_id': 0, 'x': shipment.destination_x, 'y': shipment.destination_y, 'active': True})()
-    mapped_dest = convert_sim_coords_to_latlon([temp_dest_for_mapping])
-    if mapped_dest:
-        destination_lat = mapped_dest[0].get('lat')
-        destination_lon = mapped_dest[0].get('lon')
-    else:
-        destination_lat, destination_lon = None, None
+    destination_lat, destination_lon = project_point(shipment.destination_x, shipment.destination_y)
+    if destination_lat is None:
         logger.warning(f"Could not convert destination coordinates ({shipment.destination_x}, {shipment.destination_y}) for shipment {shipment_id}")
 
 
@@ -516,18 +472,19 @@ def warehouses():
         return redirect(url_for('amazon.index'))
     
     all_warehouses = warehouse_service.get_all_warehouses() 
-    for wh in all_warehouses:
-        wh.product_count = wh.products.count() 
-    
+
+    map_cache = current_app.config.get('WAREHOUSE_MAP_CACHE')
     try:
-        from app.utils.mapping import convert_sim_coords_to_latlon 
-        warehouses_latlon_data = convert_sim_coords_to_latlon(all_warehouses)
-    except ImportError:
-        warehouses_latlon_data = [] 
-        flash("Mapping utility not found, Google Map may not display correctly.", "warning")
+        payload = map_cache.payload() if map_cache else build_map_payload()
+        warehouses_latlon_data = payload['markers']
     except Exception as map_e:
-         warehouses_latlon_data = []
-         flash(f"Error generating map data: {map_e}", "warning")
+        logger.error(f"Error generating map data: {map_e}")
+        warehouses_latlon_data = []
+        flash(f"Error generating map data: {map_e}", "warning")
+
+    product_counts = warehouse_service.get_inventory_summaries(counts_only=True)
+    for wh in all_warehouses:
+        wh.product_count = product_counts.get(wh.warehouse_id, 0)
 
     world_simulator = current_app.config.get('WORLD_SIMULATOR_SERVICE')
     world_connected = world_simulator.connected if world_simulator else False
@@ -715,6 +672,45 @@ def api_warehouses():
         'y': w.y
     } for w in warehouses])
 
+@api_bp.route('/warehouses/inventory')
+@login_required
+def api_warehouse_inventory():
+    if not current_user.is_seller:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    warehouse_service = WarehouseService()
+    return jsonify(warehouse_service.get_inventory_summaries())
+
+@api_bp.route('/warehouses/<int:warehouse_id>/inventory')
+@login_required
+def api_warehouse_inventory_detail(warehouse_id):
+    if not current_user.is_seller:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    warehouse_service = WarehouseService()
+    if not warehouse_service.get_warehouse(warehouse_id):
+        return jsonify({'error': 'Warehouse not found'}), 404
+
+    return jsonify({
+        'summary': warehouse_service.get_inventory_summary(warehouse_id),
+        'items': warehouse_service.get_warehouse_inventory(warehouse_id)
+    })
+
+@api_bp.route('/world/status')
+@login_required
+def api_world_status():
+    if not current_user.is_seller:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    world_simulator = current_app.config.get('WORLD_SIMULATOR_SERVICE')
+    if not world_simulator:
+        return jsonify({'error': 'World simulator service not configured'}), 503
+    return jsonify({
+        'connected': world_simulator.connected,
+        'world_id': world_simulator.world_id,
+        'connection': world_simulator.connection_stats()
+    })
+
 @api_bp.route('/shipments/<int:shipment_id>/status')
 @login_required
 def api_shipment_status(shipment_id):
@@ -807,6 +803,7 @@ def edit_profile():
 
         try:
             db.session.commit()
+            invalidate_user(user.user_id)
             flash('Profile updated successfully!', 'success')
             return redirect(url_for('amazon.profile')) 
         except Exception as e:
@@ -836,11 +833,13 @@ def view_warehouse(warehouse_id):
         abort(404, description="Warehouse not found") 
 
     inventory = warehouse_service.get_warehouse_inventory(warehouse_id) 
+    inventory_summary = warehouse_service.get_inventory_summary(warehouse_id)
 
     return render_template(
         'admin/view_warehouse.html', 
         warehouse=warehouse,
-        inventory=inventory
+        inventory=inventory,
+        inventory_summary=inventory_summary
     )
 
 @admin_bp.route('/warehouses/edit/<int:warehouse_id>', methods=['GET', 'POST'])
@@ -880,6 +879,68 @@ def delete_warehouse(warehouse_id):
          flash('Warehouse not found.', 'warning')
      return redirect(url_for('admin.warehouses'))
 
+@admin_bp.route('/shipment-latency')
+@login_required
+def shipment_latency():
+    """Stage latency percentiles (seconds) from the shipment event log, overall and per warehouse."""
+    if not current_user.is_seller:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    hours = request.args.get('hours', 24, type=float)
+    warehouse_id = request.args.get('warehouse_id', type=int)
+    try:
+        percentiles = tuple(float(p) for p in request.args.get('percentiles', '50,90,95,99').split(',') if p.strip())
+    except ValueError:
+        return jsonify({'error': 'percentiles must be a comma-separated list of numbers'}), 400
+    if not percentiles or not all(0 <= p <= 100 for p in percentiles):
+        return jsonify({'error': 'percentiles must be between 0 and 100'}), 400
+
+    # Include events still waiting in this process's write buffer
+    event_log = current_app.config.get('SHIPMENT_EVENT_LOG')
+    if event_log:
+        event_log.flush()
+
+    since = datetime.utcnow() - timedelta(hours=hours) if hours and hours > 0 else None
+    report = latency_report(since=since, warehouse_id=warehouse_id, percentiles=percentiles)
+    if event_log:
+        report['writer'] = event_log.stats()
+    return jsonify(report)
+
+@admin_bp.route('/sql-profile', methods=['GET', 'POST'])
+@login_required
+def sql_profile():
+    """Per-endpoint SQL statement counts, DB time, query fingerprints and slow queries; POST toggles the profiler."""
+    if not current_user.is_seller:
+        flash('Access denied', 'error')
+        return redirect(url_for('amazon.index'))
+
+    profiler = current_app.config.get('SQL_PROFILER')
+    if not profiler:
+        flash('SQL profiler not initialized.', 'danger')
+        return redirect(url_for('admin.warehouses'))
+
+    if request.method == 'POST':
+        action = request.form.get('action')
+        if action == 'enable':
+            profiler.enable()
+            flash('SQL profiler enabled.', 'success')
+        elif action == 'disable':
+            profiler.disable()
+            flash('SQL profiler disabled.', 'info')
+        elif action == 'reset':
+            profiler.reset()
+            flash('SQL profile cleared.', 'info')
+        else:
+            flash('Invalid action.', 'danger')
+        return redirect(url_for('admin.sql_profile'))
+
+    top = request.args.get('top', 20, type=int)
+    explain = request.args.get('explain', '1') != '0'
+    report = profiler.report(top=top, explain=explain)
+    if request.args.get('format') == 'json':
+        return jsonify(report)
+    return render_template('admin/sql_profile.html', report=report)
+
 @admin_bp.route('/world-messages')
 @login_required
 def world_messages():
@@ -1049,6 +1110,7 @@ def become_seller():
         try:
             user.is_seller = True
             db.session.commit()
+            invalidate_user(user.user_id)
             flash('Congratulations! You are now registered as a seller.', 'success')
         except Exception as e:
             db.session.rollback()
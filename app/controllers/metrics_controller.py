@@ -0,0 +1,63 @@
+"""
+/metrics (Prometheus text format) plus the per-request metrics: latency,
+status counts and time spent in the database during each request.
+
+The metrics themselves live in app.utils.metrics; the services record
+theirs directly. Registering this blueprint turns on the request hooks and
+the SQL statement timing for the app's engines.
+"""
+import time
+from contextvars import ContextVar
+from flask import Blueprint, Response, g, request
+from app.utils.metrics import CONTENT_TYPE, counter, histogram, render, time_statements
+
+metrics_bp = Blueprint('metrics', __name__)
+
+HTTP_REQUESTS = counter('http_requests_total', 'HTTP requests handled', ('endpoint', 'method', 'status'))
+HTTP_REQUEST_SECONDS = histogram('http_request_seconds', 'HTTP request duration', ('endpoint',))
+HTTP_REQUEST_DB_SECONDS = histogram('http_request_db_seconds', 'Time spent in SQL statements per HTTP request',
+                                    ('endpoint',))
+DB_STATEMENT_SECONDS = histogram('db_statement_seconds', 'SQL statement execution time, all threads')
+
+# [seconds] spent in SQL by the current request; None outside a request (world receiver, batchers)
+_request_db_seconds = ContextVar('request_db_seconds', default=None)
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    return Response(render(), content_type=CONTENT_TYPE)
+
+
+@metrics_bp.before_app_request
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_db_token = _request_db_seconds.set([0.0])
+
+
+@metrics_bp.after_app_request
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        db_seconds = _request_db_seconds.get()
+        _request_db_seconds.reset(g.pop('metrics_db_token'))
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+        HTTP_REQUEST_DB_SECONDS.labels(endpoint).observe(db_seconds[0] if db_seconds else 0.0)
+        HTTP_REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+
+def _observe_statement(conn, statement, parameters, executemany, seconds):
+    DB_STATEMENT_SECONDS.observe(seconds)
+    request_total = _request_db_seconds.get()
+    if request_total is not None:
+        request_total[0] += seconds
+
+
+@metrics_bp.record_once
+def _time_statements(state):
+    from app.model import db
+    with state.app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        time_statements(engine, _observe_statement)
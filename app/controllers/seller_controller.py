@@ -8,6 +8,7 @@ from sqlalchemy import func, cast, Date
 from flask import request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from app.services.warehouse_service import WarehouseService
+from app.services.order_fulfillment import roll_up_order_items
 from app.model import Product, Warehouse 
 from app.model import db, User, Product, ProductCategory, Inventory, Order, OrderProduct, WarehouseProduct
 from sqlalchemy.orm import joinedload
@@ -510,11 +511,9 @@ def fulfill_item(order_item_id):
         order_item.fulfillment_date = datetime.utcnow()
 
 
-        order = order_item.order # Access via relationship
-        all_items = order.items # Access via relationship
-        all_fulfilled = all(item.status == 'Fulfilled' for item in all_items)
-        if all_fulfilled:
-            order.order_status = 'Fulfilled'
+        db.session.flush()
+        # Order is fulfilled once none of its lines is open
+        roll_up_order_items([order_item.order_id])
 
         db.session.commit()
         flash(f'Item "{order_item.product.product_name}" marked as fulfilled.', 'success')
@@ -572,27 +571,37 @@ def add_stock_to_warehouse():
 @seller_bp.route('/inventory/replenish', methods=['POST'])
 @seller_required
 def replenish_inventory():
-    """Handles request to replenish stock for a product."""
-    product_id = request.form.get('product_id', type=int)
-    quantity = request.form.get('quantity', type=int)
-    warehouse_id = request.form.get('warehouse_id', type=int)
+    """Handles request to replenish stock for one product, or several via parallel form lists."""
+    product_ids = request.form.getlist('product_id', type=int)
+    quantities = request.form.getlist('quantity', type=int)
+    warehouse_ids = request.form.getlist('warehouse_id', type=int)
     referrer = request.form.get('referrer', url_for('seller.inventory_list'))
 
     # Validation
-    if not product_id or not quantity or quantity <= 0 or not warehouse_id:
+    if not product_ids or not (len(product_ids) == len(quantities) == len(warehouse_ids)) \
+            or any(not pid or not wid or not qty or qty <= 0
+                   for pid, wid, qty in zip(product_ids, warehouse_ids, quantities)):
         flash('Invalid parameters specified.', 'danger')
         return redirect(referrer)
 
     # Call the service
     warehouse_service = WarehouseService(current_app.config.get('WORLD_SIMULATOR_SERVICE'))
-    success, message = warehouse_service.replenish_product(
-        warehouse_id=warehouse_id,
-        product_id=product_id,
-        quantity=quantity
-    )
+    if len(product_ids) == 1:
+        product_id, quantity, warehouse_id = product_ids[0], quantities[0], warehouse_ids[0]
+        success, message = warehouse_service.replenish_product(
+            warehouse_id=warehouse_id,
+            product_id=product_id,
+            quantity=quantity
+        )
+        if success:
+            flash(f'Replenishment request for {quantity} of Product ID {product_id} sent to Warehouse ID {warehouse_id}. Status: {message}', 'success')
+        else:
+            flash(f'Failed to send replenishment request: {message}', 'danger')
+        return redirect(referrer)
 
+    success, message = warehouse_service.replenish_products(list(zip(warehouse_ids, product_ids, quantities)))
     if success:
-        flash(f'Replenishment request for {quantity} of Product ID {product_id} sent to Warehouse ID {warehouse_id}. Status: {message}', 'success')
+        flash(f'Replenishment request for {sum(quantities)} units across {len(product_ids)} lines sent. Status: {message}', 'success')
     else:
         flash(f'Failed to send replenishment request: {message}', 'danger')
 
@@ -4,6 +4,7 @@ from flask import Blueprint, request, jsonify, current_app
 from app.services.world_event_handler import WorldEventHandler
 from app.services.ups_integration_service import UPSIntegrationService
 from app.services.shipment_service import ShipmentService
+from app.services.shipment_transitions import current_status, transition
 from app.model import db, UPSMessage, Shipment
 import json
 from datetime import datetime
@@ -15,19 +16,21 @@ world_bp = Blueprint('world', __name__, url_prefix='/api/world')
 ups_bp = Blueprint('ups', __name__, url_prefix='/api/ups')
 
 
+def parse_ups_timestamp(timestamp):
+    try:
+        if isinstance(timestamp, str):
+             timestamp = timestamp.replace('Z', '+00:00')
+             return datetime.fromisoformat(timestamp)
+        elif isinstance(timestamp, (int, float)):
+             return datetime.utcfromtimestamp(timestamp)
+    except (ValueError, TypeError):
+        pass
+    return datetime.utcnow()
+
+
 def log_incoming_ups_message(message_type, payload):
     try:
-        timestamp = payload.get('timestamp', datetime.utcnow().isoformat())
-        try:
-            if isinstance(timestamp, str):
-                 timestamp = timestamp.replace('Z', '+00:00')
-                 timestamp_dt = datetime.fromisoformat(timestamp)
-            elif isinstance(timestamp, (int, float)):
-                 timestamp_dt = datetime.utcfromtimestamp(timestamp)
-            else:
-                 timestamp_dt = datetime.utcnow()
-        except (ValueError, TypeError):
-             timestamp_dt = datetime.utcnow()
+        timestamp_dt = parse_ups_timestamp(payload.get('timestamp', datetime.utcnow().isoformat()))
 
         log_entry = UPSMessage(
             message_type=f"UPS_{message_type}_Received",
@@ -174,30 +177,22 @@ def handle_status_update():
         acks.append(data['seqnum'])
 
     try:
-        shipment = Shipment.query.filter_by(shipment_id=data['shipment_id']).first()
-        if shipment:
-            valid_statuses = ['delivering', 'delivered']
-            received_status = data['status'].lower()
-
-            if received_status in valid_statuses:
-                if received_status == 'delivering':
-                    shipment.status = 'delivering'
-                    db.session.commit()
-                    success = True
-                    message = "Status updated to delivering"
-                elif received_status == 'delivered':
-                    success, message = shipment_service.handle_package_delivered(data['shipment_id'])
-                else:
-                     success = False
-                     message = f"Unhandled valid status: {received_status}"
-
-            else:
-                success = False
-                message = f"Received unknown or invalid status from UPS: {data['status']}"
-                logger.warning(f"Received invalid status '{data['status']}' for shipment {data['shipment_id']}")
+        received_status = str(data['status']).lower()
+
+        if received_status == 'delivering':
+            # Never moves a delivered shipment back to delivering
+            moved = transition(data['shipment_id'], 'delivering')
+            db.session.commit()
+            status = 'delivering' if moved else current_status(data['shipment_id'])
+            success = status is not None
+            message = "Status updated to delivering" if moved else \
+                (f"Shipment already {status}" if success else "Shipment not found")
+        elif received_status == 'delivered':
+            success, message = shipment_service.handle_package_delivered(data['shipment_id'])
         else:
             success = False
-            message = "Shipment not found"
+            message = f"Received unknown or invalid status from UPS: {data['status']}"
+            logger.warning(f"Received invalid status '{data['status']}' for shipment {data['shipment_id']}")
     except Exception as e:
         db.session.rollback()
         success = False
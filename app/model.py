@@ -3,12 +3,16 @@ from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from flask import current_app
+import time
 import logging
 from sqlalchemy import text
+from app.utils.metrics import histogram
 
 db = SQLAlchemy()
 logger = logging.getLogger(__name__)
 
+CHECKOUT_SECONDS = histogram('checkout_seconds', 'Cart checkout duration, orders and shipments included', ('outcome',))
+
 
 class User(UserMixin, db.Model):
     __tablename__ = 'accounts'
@@ -82,22 +86,33 @@ class Cart(db.Model):
     items = db.relationship('CartProduct', back_populates='cart', cascade='all, delete-orphan')
     
     @classmethod
-    def checkout_cart(cls, user_id,destination_x,destination_y,ups_account):
+    def checkout_cart(cls, user_id, destination_x, destination_y, ups_account):
         """Process cart checkout and create an order"""
-        logger.info(f"Begin Checkout cart")
+        started = time.perf_counter()
+        success, checkout_count = cls._checkout_cart(user_id, destination_x, destination_y, ups_account)
+        CHECKOUT_SECONDS.labels('ok' if success else 'failed').observe(time.perf_counter() - started)
+        return success, checkout_count
+
+    @classmethod
+    def _checkout_cart(cls, user_id,destination_x,destination_y,ups_account):
         from app.services.shipment_service import ShipmentService
+        from app.services.fulfillment_planner import FulfillmentPlanner
         shipment_service = ShipmentService(current_app.config.get('WORLD_SIMULATOR_SERVICE'))
         try:
             # Get the user's cart
-            logger.info(f"Checking out cart for user {user_id}")
+            logger.info("Checking out cart for user %s", user_id)
             cart = Cart.query.filter_by(user_id=user_id).first()
             if not cart or not cart.items:
                 return False, -1
 
+            planner = FulfillmentPlanner.from_database([item.product_id for item in cart.items],
+                                                       router=current_app.config.get('WAREHOUSE_ROUTER'))
+            user = User.query.filter_by(user_id=user_id).first()
+
             checkout_count = 0
             # Create orders
             for cart_item in cart.items:
-                logger.info(f"Processing cart item {cart_item.product_id} for user {user_id}")
+                logger.debug("Processing cart item %s for user %s", cart_item.product_id, user_id)
                 # Create new order
                 order = Order(
                     buyer_id=user_id,
@@ -108,15 +123,18 @@ class Cart(db.Model):
                 db.session.add(order)
                 db.session.flush()  # Get the order ID
 
-                logger.info("getting warehouse id")
-
-                logger.info(f"Getting warehouse id for product {cart_item.product_id} and seller {cart_item.seller_id}")
-                warehouse_id = Inventory.get_warehouse_id_by_productId_sellerId(cart_item.product_id,
-                                                                                cart_item.seller_id)
-
-                if not warehouse_id:
-                    db.session.rollback()
-                    return False, checkout_count
+                # Ship from the closest warehouse that can cover the line, or split it over
+                # several; the listing's own warehouse is the fallback when stock is short
+                allocations = planner.plan_line(cart_item.product_id, cart_item.quantity,
+                                                destination_x, destination_y)
+                if not allocations:
+                    logger.debug("Getting warehouse id for product %s and seller %s", cart_item.product_id, cart_item.seller_id)
+                    warehouse_id = Inventory.get_warehouse_id_by_productId_sellerId(cart_item.product_id,
+                                                                                    cart_item.seller_id)
+                    if not warehouse_id:
+                        db.session.rollback()
+                        return False, checkout_count
+                    allocations = [(warehouse_id, cart_item.quantity)]
 
                 order_item = OrderProduct(
                     order_id=order.order_id,
@@ -131,39 +149,36 @@ class Cart(db.Model):
                 db.session.delete(cart_item)
 
                 # subtract from inventory
-
-                logger.info("subtracting from inventory")
-
-
-                inventory_item = WarehouseProduct.query.filter_by(
-                    warehouse_id=warehouse_id,
-                    product_id=cart_item.product_id
-                ).first()
-
-                if inventory_item:
-                    inventory_item.quantity -= cart_item.quantity
-                    if inventory_item.quantity < 0:
+                for warehouse_id, quantity in allocations:
+                    inventory_item = WarehouseProduct.query.filter_by(
+                        warehouse_id=warehouse_id,
+                        product_id=cart_item.product_id
+                    ).first()
+
+                    if inventory_item:
+                        inventory_item.quantity -= quantity
+                        if inventory_item.quantity < 0:
+                            db.session.rollback()
+                            return False, checkout_count
+
+                # one shipment per warehouse; a split line ships its share from each
+                split = len(allocations) > 1
+                for warehouse_id, quantity in allocations:
+                    logger.debug("Creating shipment for product %s in warehouse %s", cart_item.product_id, warehouse_id)
+                    shipment_success, shipment_id_or_error = shipment_service.create_shipment(
+                        user_id=user_id,
+                        email= user.email,
+                        order_id=order.order_id,
+                        warehouse_id=warehouse_id,
+                        destination_x=destination_x,
+                        destination_y=destination_y,
+                        ups_account=ups_account,
+                        items=[(cart_item.product_id, quantity)] if split else None
+                    )
+
+                    if not shipment_success:
                         db.session.rollback()
                         return False, checkout_count
-                    
-                logger.info(f"Send Request of creating shipment for product {cart_item.product_id} in warehouse {warehouse_id}")
-
-                # get user email
-                user = User.query.filter_by(user_id=user_id).first()
-
-                shipment_success, shipment_id_or_error = shipment_service.create_shipment(
-                    user_id=user_id,
-                    email= user.email,
-                    order_id=order.order_id,
-                    warehouse_id=warehouse_id,
-                    destination_x=destination_x,
-                    destination_y=destination_y,
-                    ups_account=ups_account
-                )
-
-                if not shipment_success:
-                    db.session.rollback()
-                    return False, checkout_count
 
                 db.session.commit()
                 checkout_count+=1
@@ -171,7 +186,7 @@ class Cart(db.Model):
             return True, checkout_count
         except Exception as e:
             db.session.rollback()
-            logger.error(f"Error during checkout: {e}")
+            logger.error("Error during checkout: %s", e)
             return False, -1
 
 class CartProduct(db.Model):
@@ -272,6 +287,23 @@ class WarehouseProduct(db.Model):
         db.UniqueConstraint('warehouse_id', 'product_id', name='uc_warehouse_product'),
     )
 
+class ReorderPoint(db.Model):
+    __tablename__ = 'reorder_points'
+
+    id = db.Column(db.Integer, primary_key=True)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.warehouse_id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.product_id'), nullable=False)
+    reorder_point = db.Column(db.Integer, nullable=False)  # Reorder when stock falls below this
+    target_level = db.Column(db.Integer, nullable=False)  # Order up to this level
+    active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('warehouse_id', 'product_id', name='uc_reorder_warehouse_product'),
+        db.CheckConstraint('reorder_point >= 0 AND target_level >= reorder_point', name='reorder_levels_check'),
+    )
+
 class Shipment(db.Model):
     __tablename__ = 'shipments'
     
@@ -297,6 +329,8 @@ class Shipment(db.Model):
             "status IN ('packing', 'packed', 'loading', 'loaded', 'delivering', 'delivered')",
             name='shipments_status_check'
         ),
+        # Order roll-ups look for undelivered shipments of an order
+        db.Index('idx_shipments_order_status', 'order_id', 'status'),
     )
 
 class ShipmentItem(db.Model):
@@ -316,6 +350,20 @@ class ShipmentItem(db.Model):
         db.UniqueConstraint('shipment_id', 'product_id', name='uc_shipment_product'),
     )
 
+class ShipmentEvent(db.Model):
+    __tablename__ = 'shipment_events'
+
+    # Append-only: one row each time a shipment reaches a state (or a truck arrives for it)
+    id = db.Column(db.Integer, primary_key=True)
+    shipment_id = db.Column(db.Integer, db.ForeignKey('shipments.shipment_id'), nullable=False)
+    event = db.Column(db.String(20), nullable=False)  # created, packed, truck_arrived, loading, loaded, delivering, delivered
+    truck_id = db.Column(db.BigInteger, nullable=True)
+    occurred_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_shipment_events_shipment', 'shipment_id', 'occurred_at'),
+    )
+
 class WorldMessage(db.Model):
     __tablename__ = 'world_messages'
 
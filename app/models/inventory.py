@@ -1,6 +1,10 @@
 from sqlalchemy import text
 from app.model import db             
+from app.services.product_view_cache import invalidate_product
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class Inventory:
@@ -27,7 +31,7 @@ class Inventory:
         rows = db.session.execute(
             text('''
                 SELECT i.inventory_id, i.seller_id, i.product_id, i.quantity, i.unit_price,
-                       i.created_at, i.updated_at, i.owner_id, p.product_name, CONCAT(a.first_name, ' ', a.last_name) AS seller_name,
+                       i.created_at, i.updated_at, i.owner_id, p.product_name, a.first_name || ' ' || a.last_name AS seller_name,
                        p.category_id, pc.category_name, p.image
                 FROM Inventory i
                 JOIN Products p ON i.product_id = p.product_id
@@ -45,7 +49,7 @@ class Inventory:
         rows = db.session.execute(
             text('''
                 SELECT i.inventory_id, i.seller_id, i.product_id, i.quantity, i.unit_price,
-                       i.created_at, i.updated_at, p.product_name, CONCAT(a.first_name, ' ', a.last_name) AS seller_name,
+                       i.created_at, i.updated_at, p.product_name, a.first_name || ' ' || a.last_name AS seller_name,
                        p.category_id, pc.category_name, p.image
                 FROM Inventory i
                 JOIN Products p ON i.product_id = p.product_id
@@ -63,7 +67,7 @@ class Inventory:
     def get_for_seller(seller_id, limit=20, offset=0, search_query=None, category_id=None):
         query = '''
             SELECT i.inventory_id, i.seller_id, i.product_id, i.quantity, i.unit_price,
-                   i.created_at, i.updated_at, i.owner_id, p.product_name, CONCAT(a.first_name, ' ', a.last_name) AS seller_name,
+                   i.created_at, i.updated_at, i.owner_id, p.product_name, a.first_name || ' ' || a.last_name AS seller_name,
                    p.category_id, pc.category_name, p.image
             FROM Inventory i
             JOIN Products p ON i.product_id = p.product_id
@@ -120,7 +124,7 @@ class Inventory:
             ).fetchall()
 
             if not owner_rows:
-                 print(f"Error: Product with ID {product_id} not found to get owner_id.")
+                 logger.error(f"Product with ID {product_id} not found to get owner_id.")
                  return None # Product must exist
 
             owner_id = owner_rows[0][0]
@@ -140,10 +144,11 @@ class Inventory:
                 }
             ).fetchone() 
 
+            invalidate_product(product_id)
             return inventory_id_result[0] if inventory_id_result else None
         except Exception as e:
 
-            print(f"Error creating inventory: {e}")
+            logger.error(f"Error creating inventory: {e}")
             return None
 
     def to_dict(self):
@@ -170,12 +175,12 @@ class Inventory:
             params = {'inventory_id': inventory_id, 'seller_id': seller_id}
 
             if quantity is None and unit_price is None:
-                 print("Warning: Inventory.update called without quantity or unit_price.")
+                 logger.warning("Inventory.update called without quantity or unit_price.")
                  return None 
 
             if quantity is not None:
                 if not isinstance(quantity, int) or quantity < 0:
-                     print(f"Error: Invalid quantity '{quantity}' for Inventory update.")
+                     logger.error(f"Invalid quantity '{quantity}' for Inventory update.")
                      return None # Invalid quantity
                 update_parts.append("quantity = :quantity")
                 params['quantity'] = quantity
@@ -187,7 +192,7 @@ class Inventory:
                      update_parts.append("unit_price = :unit_price")
                      params['unit_price'] = price_val
                  except (ValueError, TypeError) as price_err:
-                      print(f"Error: Invalid unit_price '{unit_price}' for Inventory update: {price_err}")
+                      logger.error(f"Invalid unit_price '{unit_price}' for Inventory update: {price_err}")
                       return None
 
             if update_parts:
@@ -198,16 +203,18 @@ class Inventory:
                     UPDATE Inventory
                     SET {", ".join(update_parts)}
                     WHERE inventory_id = :inventory_id AND seller_id = :seller_id
-                    RETURNING inventory_id
+                    RETURNING inventory_id, product_id
                 '''
                 result = db.session.execute(text(query), params).fetchone() 
 
+                if result:
+                    invalidate_product(result[1])
                 return result[0] if result else None
             else:
                  return None
 
         except Exception as e:
-            print(f"Error updating inventory {inventory_id} for seller {seller_id}: {e}")
+            logger.error(f"Error updating inventory {inventory_id} for seller {seller_id}: {e}")
             return None
 
     @staticmethod
@@ -217,16 +224,17 @@ class Inventory:
                 text('''
                     DELETE FROM Inventory
                     WHERE inventory_id = :inventory_id AND seller_id = :seller_id
-                    RETURNING inventory_id
+                    RETURNING inventory_id, product_id
                 '''),
                 {"inventory_id": inventory_id, "seller_id": seller_id}
             ).fetchone() # Use fetchone()
 
-
+            if result:
+                invalidate_product(result[1])
             return result[0] if result else None
         except Exception as e:
        
-            print(f"Error deleting inventory {inventory_id} for seller {seller_id}: {e}")
+            logger.error(f"Error deleting inventory {inventory_id} for seller {seller_id}: {e}")
             return None
 
     @staticmethod
@@ -236,7 +244,7 @@ class Inventory:
             rows = db.session.execute(
                 text('''
                     SELECT i.inventory_id, i.seller_id, i.product_id, i.quantity, i.unit_price,
-                           i.created_at, i.updated_at, i.owner_id, p.product_name, CONCAT(a.first_name, ' ', a.last_name) AS seller_name,
+                           i.created_at, i.updated_at, i.owner_id, p.product_name, a.first_name || ' ' || a.last_name AS seller_name,
                            p.category_id, pc.category_name, p.image
                     FROM Inventory i
                     JOIN Products p ON i.product_id = p.product_id
@@ -250,7 +258,7 @@ class Inventory:
 
             return [Inventory(*row) for row in rows]
         except Exception as e:
-             print(f"Error in get_sellers_for_product for product {product_id}: {e}")
+             logger.error(f"Error in get_sellers_for_product for product {product_id}: {e}")
              return [] 
 
     @staticmethod
@@ -266,14 +274,14 @@ class Inventory:
             ).fetchone() # Use fetchone()
 
             if not current:
-                print(f"Warning: Inventory record not found for seller {seller_id}, product {product_id} during update_quantity.")
+                logger.warning(f"Inventory record not found for seller {seller_id}, product {product_id} during update_quantity.")
                 return False # Inventory record doesn't exist
 
             current_quantity = current[0]
             new_quantity = current_quantity + quantity_change
 
             if new_quantity < 0:
-                print(f"Error: Insufficient stock for seller {seller_id}, product {product_id}. Required change: {quantity_change}, Available: {current_quantity}")
+                logger.error(f"Insufficient stock for seller {seller_id}, product {product_id}. Required change: {quantity_change}, Available: {current_quantity}")
                 return False # Not enough stock
 
             # CORRECTED: Use db.session
@@ -290,9 +298,10 @@ class Inventory:
                     "product_id": product_id
                 }
             )
+            invalidate_product(product_id)
             return True
         except Exception as e:
-            print(f"Error updating inventory quantity for seller {seller_id}, product {product_id}: {e}")
+            logger.error(f"Error updating inventory quantity for seller {seller_id}, product {product_id}: {e}")
             return False
 
     @staticmethod
@@ -309,5 +318,5 @@ class Inventory:
 
             return rows[0][0] if rows else None
         except Exception as e:
-            print(f"Error getting warehouse ID for product {product_id} and seller {seller_id}: {e}")
+            logger.error(f"Error getting warehouse ID for product {product_id} and seller {seller_id}: {e}")
             return None
\ No newline at end of file
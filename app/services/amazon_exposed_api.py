@@ -1,10 +1,14 @@
 from flask import Blueprint, request, jsonify
 
 from app.controllers.amazon_controller import warehouses
-from app.model import db, Shipment, Order, Warehouse, Product, ShipmentItem
+from app.controllers.webhook_controller import parse_ups_timestamp
+from app.model import db, Shipment, Warehouse, Product, ShipmentItem, UPSMessage
 from datetime import datetime
+from sqlalchemy import insert, update
+import json
 import logging
 from app.services.shipment_service import ShipmentService
+from app.services.shipment_events import queue_event
 from app.services.world_simulator_service import WorldSimulatorService
 from flask import current_app
 
@@ -170,56 +174,44 @@ def truck_arrived():
             }), 500
 
 
-        lock = current_app.config.get('ARRIVED_LOCK')
-
-        with lock:
-
-        # Update shipment status
-            shipment = Shipment.query.filter_by(shipment_id=shipment_id).first()
-            if not shipment:
-                return jsonify({
-                    'message_type': 'Error',
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'payload': {
-                        'status': 'fail',
-                        'code': 2000,
-                        'message': f'Shipment {shipment_id} not found'
-                    }
-                }), 500
-
-            shipment.truck_id = truck_id
-            shipment.updated_at = datetime.utcnow().isoformat()
-
-            db.session.commit()
-
-            logger.info(f"Truck {truck_id} arrived at warehouse {warehouse_id} for shipment {shipment_id}")
-
-            if shipment.status == 'packed':
-                logger.info(f"The shipment {shipment_id} has been packed and is ready to be loaded.")
-                shipment.status = 'loading'
-                db.session.commit()
-                # load to truck
-                world_similator_service = current_app.config.get('WORLD_SIMULATOR_SERVICE')
-                res,response  =  world_similator_service.load_shipment(warehouse_id = warehouse_id,truck_id = truck_id, shipment_id = shipment_id)
-
-                if res:
-                    logger.info(f"Shipment {shipment_id} Loading info are sent to world")
-
-            else:
-                logger.info(f"The shipment {shipment_id} is not packed yet. Waiting for products to arrive. Add to map!")
-                waiting_products_map = current_app.config.get('WAITING_PRODUCTS')
-                waiting_products_map[shipment_id] = (truck_id,warehouse_id)
-                current_app.config['WAITING_PRODUCTS'] = waiting_products_map
-
+        # Record the truck in one UPDATE; the status change is load_when_ready's compare-and-set
+        assigned = db.session.execute(
+            update(Shipment)
+            .where(Shipment.shipment_id == shipment_id)
+            .values(truck_id=truck_id, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not assigned:
+            db.session.rollback()
             return jsonify({
-                'message_type': 'TruckArrived',
+                'message_type': 'Error',
                 'timestamp': datetime.utcnow().isoformat(),
                 'payload': {
-                    'status': 'success',
-                    'code': 200,
-                    'message': ''
+                    'status': 'fail',
+                    'code': 2000,
+                    'message': f'Shipment {shipment_id} not found'
                 }
-            })
+            }), 500
+
+        queue_event(shipment_id, 'truck_arrived', truck_id=truck_id)
+        db.session.commit()
+
+        logger.info(f"Truck {truck_id} arrived at warehouse {warehouse_id} for shipment {shipment_id}")
+
+        # The packed/waiting decision happens where world events are received
+        # (in-process or in the world gateway) so it cannot race package_ready.
+        world_similator_service = current_app.config.get('WORLD_SIMULATOR_SERVICE')
+        world_similator_service.load_when_ready(shipment_id=shipment_id, truck_id=truck_id, warehouse_id=warehouse_id)
+
+        return jsonify({
+            'message_type': 'TruckArrived',
+            'timestamp': datetime.utcnow().isoformat(),
+            'payload': {
+                'status': 'success',
+                'code': 200,
+                'message': ''
+            }
+        })
 
     except Exception as e:
         logger.error(f"Error processing truck arrival notification: {str(e)}")
@@ -256,35 +248,21 @@ def shipment_delivered():
         shipment_id = payload.get('shipment_id')
         sequence_number = message.get('sequence_number')
 
-        # Update shipment status
-        shipment = Shipment.query.filter_by(shipment_id=shipment_id).first()
-        if not shipment:
+        # Update shipment status and roll the order up
+        shipment_service = ShipmentService()
+        success, result = shipment_service.handle_package_delivered(shipment_id)
+        if not success:
+            not_found = result == "Shipment not found"
             return jsonify({
                 'message_type': 'Error',
                 'timestamp': datetime.utcnow().isoformat(),
                 'payload': {
                     'status': 'fail',
-                    'code': 2000,
-                    'message': f'Shipment {shipment_id} not found'
+                    'code': 2000 if not_found else 3000,
+                    'message': f'Shipment {shipment_id} not found' if not_found else result
                 }
             }), 500
 
-        shipment.status = 'delivered'
-        shipment.delivery_time = datetime.utcnow()
-        shipment.updated_at = datetime.utcnow()
-
-        # Update order status if all shipments delivered
-        order = Order.query.filter_by(order_id=shipment.order_id).first()
-        if order:
-            all_shipments = Shipment.query.filter_by(order_id=order.order_id).all()
-            all_delivered = all(s.status == 'delivered' for s in all_shipments)
-
-            if all_delivered:
-                order.order_status = 'Fulfilled'
-                order.updated_at = datetime.utcnow()
-
-        db.session.commit()
-
         logger.info(f"Shipment {shipment_id} delivered")
 
         return jsonify({
@@ -384,6 +362,133 @@ def shipment_detail_request():
         }), 500
 
 
+BATCH_EVENT_TYPES = ('TruckDispatched', 'TruckArrived', 'ShipmentDelivered', 'PackageDelivered',
+                     'StatusUpdate', 'TrackingInfo')
+BATCH_ID_FIELDS = ('shipment_id', 'truck_id', 'warehouse_id')
+
+
+@ups_webhooks.route('/api/webhooks/batch', methods=['POST'])
+def ups_event_batch():
+    """
+    UPS sends many events in one request: a JSON array of messages, or
+    {"message_type": "Batch", "timestamp": ..., "events": [...]}. Each event
+    is validated like its single-event webhook; valid ones are applied in
+    one transaction and every event gets its own result.
+    """
+    try:
+        message = request.get_json(silent=True)
+        events = message.get('events') if isinstance(message, dict) else message
+        if not isinstance(events, list):
+            return jsonify({
+                'message_type': 'Error',
+                'timestamp': datetime.utcnow().isoformat(),
+                'payload': {
+                    'status': 'fail',
+                    'code': 1000,
+                    'message': 'Expected a list of events'
+                }
+            }), 400
+
+        max_events = current_app.config.get('UPS_BATCH_MAX_EVENTS', 5000)
+        if len(events) > max_events:
+            return jsonify({
+                'message_type': 'Error',
+                'timestamp': datetime.utcnow().isoformat(),
+                'payload': {
+                    'status': 'fail',
+                    'code': 1003,
+                    'message': f'Batch of {len(events)} events exceeds the limit of {max_events}'
+                }
+            }), 413
+
+        results = [None] * len(events)
+        valid, positions, log_rows = [], [], []
+        for index, event in enumerate(events):
+            event_type = event.get('message_type') if isinstance(event, dict) else None
+            if isinstance(event, dict):
+                log_rows.append({
+                    'message_type': f"UPS_{event_type}_Received"[:50],
+                    'timestamp': parse_ups_timestamp(event.get('timestamp')),
+                    'payload': json.dumps(event),
+                    'status': 'received',
+                    'seqnum': event.get('sequence_number', -1)
+                })
+            if event_type not in BATCH_EVENT_TYPES:
+                results[index] = (False, 1001, f'Unsupported message type {event_type!r}')
+                continue
+            if not validate_message_structure(event, event_type):
+                results[index] = (False, 1000, 'Invalid message structure')
+                continue
+            payload = dict(event['payload'])
+            try:
+                for field in BATCH_ID_FIELDS:
+                    if field in payload:
+                        payload[field] = int(payload[field])
+            except (TypeError, ValueError):
+                results[index] = (False, 1000, 'Invalid message structure')
+                continue
+            valid.append({'message_type': event_type, 'payload': payload})
+            positions.append(index)
+
+        if log_rows:
+            db.session.execute(insert(UPSMessage), log_rows)
+
+        shipment_service = ShipmentService(world_simulator_service=current_app.config.get('WORLD_SIMULATOR_SERVICE'))
+        applied, arrivals = shipment_service.apply_ups_events(valid)
+        for index, result in zip(positions, applied):
+            results[index] = result
+        if not valid:
+            db.session.commit()
+
+        # Same follow-up as /api/webhooks/truck-arrived, once the batch is committed
+        world_simulator_service = current_app.config.get('WORLD_SIMULATOR_SERVICE')
+        for shipment_id, truck_id, warehouse_id in arrivals:
+            try:
+                world_simulator_service.load_when_ready(shipment_id=shipment_id, truck_id=truck_id,
+                                                        warehouse_id=warehouse_id)
+            except Exception as e:
+                logger.error(f"Error starting load for shipment {shipment_id} from batch: {str(e)}")
+
+        items = []
+        for index, (success, code, text) in enumerate(results):
+            event = events[index] if isinstance(events[index], dict) else {}
+            items.append({
+                'index': index,
+                'sequence_number': event.get('sequence_number'),
+                'message_type': event.get('message_type'),
+                'status': 'success' if success else 'fail',
+                'code': code,
+                'message': text
+            })
+        succeeded = sum(1 for item in items if item['status'] == 'success')
+        logger.info(f"UPS batch: {succeeded}/{len(items)} events applied")
+
+        return jsonify({
+            'message_type': 'BatchAcknowledgement',
+            'timestamp': datetime.utcnow().isoformat(),
+            'payload': {
+                'acks': [item['sequence_number'] for item in items
+                         if item['status'] == 'success' and item['sequence_number'] is not None],
+                'succeeded': succeeded,
+                'failed': len(items) - succeeded,
+                'results': items
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"Error processing UPS event batch: {str(e)}")
+        db.session.rollback()
+        return jsonify({
+            'message_type': 'Error',
+            'timestamp': datetime.utcnow().isoformat(),
+            'payload': {
+                'status': 'fail',
+                'code': 3000,
+                'message': str(e)
+            }
+        }), 500
+
+
 def validate_message_structure(message, expected_type):
     if not isinstance(message, dict):
         return False
@@ -414,5 +519,14 @@ def validate_message_structure(message, expected_type):
     elif expected_type == 'PackageDetailRequest':
         return 'shipment_id' in payload
 
+    elif expected_type == 'PackageDelivered':
+        return 'shipment_id' in payload
+
+    elif expected_type == 'StatusUpdate':
+        return 'shipment_id' in payload and 'status' in payload
+
+    elif expected_type == 'TrackingInfo':
+        return 'shipment_id' in payload and 'tracking_id' in payload
+
     return True
 
@@ -0,0 +1,170 @@
+import logging
+from itertools import combinations
+import numpy as np
+from app.model import db, Warehouse, WarehouseProduct
+
+logger = logging.getLogger(__name__)
+
+# Up to this many stocked warehouses the split is solved exactly; above it greedily
+EXACT_SOLVER_LIMIT = 12
+
+
+class ProductStock:
+    """Warehouses holding one product: parallel arrays of ids, coordinates and free units."""
+    __slots__ = ('warehouse_ids', 'xy', 'quantity')
+
+    def __init__(self, warehouse_ids, xy, quantity):
+        self.warehouse_ids = np.asarray(warehouse_ids, dtype=np.int64)
+        self.xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        self.quantity = np.asarray(quantity, dtype=np.int64)
+
+
+class FulfillmentPlanner:
+    """
+    Decides which warehouse(s) ship each order line.
+
+    A line is shipped from the nearest warehouse that can cover it alone.
+    Otherwise it is split over as few warehouses as possible (fewest
+    shipments first), and among those the set with the smallest total
+    distance to the destination. Planned units are reserved in the
+    planner's stock snapshot so later lines cannot double-book them.
+
+    Allocations are lists of (warehouse_id, quantity); an empty list means
+    the known stock cannot cover the line.
+
+    With a WarehouseRouter, plan_line finds the nearest single warehouse
+    with the router's k-d tree, restricted to the warehouses that cover
+    the line; the distance scan here is left for splits.
+    """
+
+    def __init__(self, stock=None, exact_limit=EXACT_SOLVER_LIMIT, router=None):
+        self.stock = stock or {}
+        self.exact_limit = exact_limit
+        self.router = router
+
+    @classmethod
+    def from_database(cls, product_ids, **kwargs):
+        """Snapshot stock and coordinates of active warehouses for the given products in one query."""
+        rows = db.session.query(
+            WarehouseProduct.product_id,
+            WarehouseProduct.warehouse_id,
+            WarehouseProduct.quantity,
+            Warehouse.x,
+            Warehouse.y
+        ).join(Warehouse, Warehouse.warehouse_id == WarehouseProduct.warehouse_id)\
+         .filter(WarehouseProduct.product_id.in_(set(product_ids)),
+                 WarehouseProduct.quantity > 0,
+                 Warehouse.active == True).all()
+
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row.product_id, []).append(row)
+        stock = {
+            product_id: ProductStock(
+                [row.warehouse_id for row in product_rows],
+                [(row.x, row.y) for row in product_rows],
+                [row.quantity for row in product_rows]
+            )
+            for product_id, product_rows in grouped.items()
+        }
+        return cls(stock, **kwargs)
+
+    def plan_line(self, product_id, quantity, x, y):
+        stock = self.stock.get(product_id)
+        if stock is None or quantity <= 0:
+            return []
+        if self.router is not None:
+            covering = stock.warehouse_ids[stock.quantity >= quantity]
+            # None when the router's index does not know any of them yet; the scan below still does
+            warehouse_id = self.router.nearest(x, y, covering) if covering.size else None
+            if warehouse_id is not None:
+                position = int(np.flatnonzero(stock.warehouse_ids == warehouse_id)[0])
+                stock.quantity[position] -= quantity
+                return [(int(warehouse_id), quantity)]
+        distance = np.hypot(stock.xy[:, 0] - x, stock.xy[:, 1] - y)
+        return self._allocate(stock, distance, quantity)
+
+    def plan_cart(self, lines, x, y):
+        """lines: iterable of (key, product_id, quantity) sharing one destination -> {key: allocations}."""
+        return {key: self.plan_line(product_id, quantity, x, y) for key, product_id, quantity in lines}
+
+    def plan_batch(self, orders):
+        """
+        Plan many single-line orders at once (flash-sale bursts).
+
+        orders: iterable of (key, product_id, quantity, x, y). Distances for
+        every order of a product are computed in one vectorized step; orders
+        are then assigned in the given sequence against the shared stock.
+        """
+        by_product = {}
+        for order in orders:
+            by_product.setdefault(order[1], []).append(order)
+
+        plans = {}
+        for product_id, product_orders in by_product.items():
+            stock = self.stock.get(product_id)
+            if stock is None:
+                for key, *_ in product_orders:
+                    plans[key] = []
+                continue
+
+            destinations = np.array([(o[3], o[4]) for o in product_orders], dtype=np.float64)
+            # (orders x warehouses) distance matrix
+            distances = np.hypot(destinations[:, None, 0] - stock.xy[None, :, 0],
+                                 destinations[:, None, 1] - stock.xy[None, :, 1])
+            available = stock.quantity
+            remaining = int(available.sum())
+            for i, (key, _, quantity, _, _) in enumerate(product_orders):
+                if quantity <= 0 or quantity > remaining:
+                    plans[key] = []
+                    continue
+                # Fast path: nearest warehouse that covers the order alone, one masked argmin
+                row = np.where(available >= quantity, distances[i], np.inf)
+                position = int(row.argmin())
+                if row[position] != np.inf:
+                    available[position] -= quantity
+                    plans[key] = [(int(stock.warehouse_ids[position]), quantity)]
+                else:
+                    plans[key] = self._allocate(stock, distances[i], quantity)
+                remaining -= quantity
+        return plans
+
+    def _allocate(self, stock, distance, quantity):
+        available = stock.quantity
+        if available.sum() < quantity:
+            return []
+
+        single = np.flatnonzero(available >= quantity)
+        if single.size:
+            chosen = [int(single[np.argmin(distance[single])])]
+        else:
+            chosen = self._split(available, distance, quantity)
+
+        allocations = []
+        remaining = quantity
+        for position in sorted(chosen, key=lambda p: distance[p]):
+            take = int(min(available[position], remaining))
+            if take <= 0:
+                continue
+            available[position] -= take
+            remaining -= take
+            allocations.append((int(stock.warehouse_ids[position]), take))
+        return allocations
+
+    def _split(self, available, distance, quantity):
+        # Taking the largest stocks first gives the minimum number of warehouses
+        by_size = np.argsort(-available, kind='stable')
+        needed = int(np.searchsorted(np.cumsum(available[by_size]), quantity)) + 1
+        candidates = np.flatnonzero(available > 0)
+
+        if len(candidates) > self.exact_limit:
+            return [int(p) for p in by_size[:needed]]
+
+        best, best_distance = None, None
+        for combo in combinations(candidates.tolist(), needed):
+            if available[list(combo)].sum() < quantity:
+                continue
+            total = distance[list(combo)].sum()
+            if best is None or total < best_distance:
+                best, best_distance = combo, total
+        return list(best)
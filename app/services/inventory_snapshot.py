@@ -0,0 +1,237 @@
+import threading
+import time
+import logging
+from flask import current_app
+from sqlalchemy import event, func, case, inspect
+from sqlalchemy.orm import Session
+from app.model import db, Warehouse, WarehouseProduct
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_CHANGES_KEY = 'inventory_snapshot_changes'
+COMMIT_STARTED_KEY = 'inventory_snapshot_commit_started'
+# Marker queued when a change cannot be expressed as a delta (bulk statements, warehouse add/remove)
+REFRESH = object()
+
+
+class InventorySnapshot:
+    """
+    Per-warehouse inventory totals for active warehouses: SKU count, unit
+    total and the number of SKUs below the low-stock threshold.
+
+    Built with one grouped query, then kept current by applying the
+    quantity deltas of committed WarehouseProduct changes (arrivals,
+    checkouts, manual adjustments) in this process. Changes that cannot be
+    applied as deltas trigger a rebuild on the next read, and a rebuild
+    also happens every `ttl` seconds to pick up other processes' writes.
+    """
+
+    def __init__(self, low_stock_threshold=5, ttl=300):
+        self.low_stock_threshold = low_stock_threshold
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # warehouse_id -> [skus, units, low_stock_skus]
+        self.totals = None
+        self.query_started = 0.0
+        self.built_at = 0.0
+        self.stale = True
+        self.rebuilds = 0
+        self.deltas_applied = 0
+
+    def invalidate(self):
+        self.stale = True
+
+    def _fresh(self):
+        return self.totals is not None and not self.stale and time.monotonic() - self.built_at < self.ttl
+
+    def _current(self):
+        if self._fresh():
+            return self.totals
+        with self.lock:
+            if self._fresh():
+                return self.totals
+            self.stale = False
+            self.query_started = time.monotonic()
+            low = case((WarehouseProduct.quantity < self.low_stock_threshold, 1), else_=0)
+            rows = db.session.query(
+                Warehouse.warehouse_id,
+                func.count(WarehouseProduct.id),
+                func.coalesce(func.sum(WarehouseProduct.quantity), 0),
+                func.coalesce(func.sum(low), 0)
+            ).outerjoin(WarehouseProduct, WarehouseProduct.warehouse_id == Warehouse.warehouse_id)\
+             .filter(Warehouse.active == True)\
+             .group_by(Warehouse.warehouse_id).all()
+            self.totals = {warehouse_id: [skus, int(units), int(low_skus)]
+                           for warehouse_id, skus, units, low_skus in rows}
+            self.built_at = time.monotonic()
+            self.rebuilds += 1
+            logger.debug("Rebuilt inventory snapshot for %d warehouses", len(rows))
+            return self.totals
+
+    def apply(self, changes, commit_started, committed_at):
+        """
+        Fold committed (warehouse_id, old_quantity, new_quantity) changes into
+        the totals. old is None for a new listing, new is None for a removed one.
+        The commit ran somewhere between commit_started and committed_at.
+        """
+        with self.lock:
+            if self.totals is None or self.stale:
+                return
+            if self.query_started >= committed_at:
+                # The last rebuild already read this commit
+                return
+            if self.built_at > commit_started:
+                # The rebuild query overlapped the commit: it may or may not include it
+                self.stale = True
+                return
+            threshold = self.low_stock_threshold
+            for warehouse_id, old, new in changes:
+                row = self.totals.get(warehouse_id)
+                if row is None:
+                    continue
+                if old is not None:
+                    row[0] -= 1
+                    row[1] -= old
+                    row[2] -= old < threshold
+                if new is not None:
+                    row[0] += 1
+                    row[1] += new
+                    row[2] += new < threshold
+            self.deltas_applied += len(changes)
+
+    def _entry(self, warehouse_id, row):
+        skus, units, low_skus = row
+        return {
+            'warehouse_id': warehouse_id,
+            'skus': skus,
+            'units': units,
+            'low_stock_skus': low_skus,
+            'low_stock': low_skus > 0
+        }
+
+    def summary(self, warehouse_id):
+        """Totals for one warehouse; zeros if it holds nothing or is unknown."""
+        return self._entry(warehouse_id, list(self._current().get(warehouse_id, (0, 0, 0))))
+
+    def all(self):
+        totals = self._current()
+        return [self._entry(warehouse_id, list(totals[warehouse_id])) for warehouse_id in sorted(totals)]
+
+    def product_counts(self):
+        return {warehouse_id: row[0] for warehouse_id, row in self._current().items()}
+
+    def stats(self):
+        totals = self.totals
+        return {
+            'warehouses': len(totals) if totals is not None else 0,
+            'stale': self.stale,
+            'rebuilds': self.rebuilds,
+            'deltas_applied': self.deltas_applied,
+            'low_stock_threshold': self.low_stock_threshold,
+            'ttl': self.ttl
+        }
+
+
+def _get_snapshot():
+    try:
+        return current_app.config.get('INVENTORY_SNAPSHOT')
+    except RuntimeError:
+        return None
+
+
+def _queue(session, change):
+    session.info.setdefault(INVENTORY_CHANGES_KEY, []).append(change)
+
+
+def _old_value(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        # Overwritten without the previous value being loaded
+        return REFRESH
+    return getattr(state.obj(), key)
+
+
+def _on_listing_insert(mapper, connection, target):
+    _queue(inspect(target).session, (target.warehouse_id, None, target.quantity or 0))
+
+
+def _on_listing_update(mapper, connection, target):
+    state = inspect(target)
+    old_warehouse = _old_value(state, 'warehouse_id')
+    old_quantity = _old_value(state, 'quantity')
+    if old_warehouse is REFRESH or old_quantity is REFRESH:
+        _queue(state.session, REFRESH)
+        return
+    if old_warehouse == target.warehouse_id and old_quantity == target.quantity:
+        return
+    _queue(state.session, (old_warehouse, old_quantity or 0, None))
+    _queue(state.session, (target.warehouse_id, None, target.quantity or 0))
+
+
+def _on_listing_delete(mapper, connection, target):
+    state = inspect(target)
+    old_warehouse = _old_value(state, 'warehouse_id')
+    old_quantity = _old_value(state, 'quantity')
+    if old_warehouse is REFRESH or old_quantity is REFRESH:
+        _queue(state.session, REFRESH)
+        return
+    _queue(state.session, (old_warehouse, old_quantity or 0, None))
+
+
+def _on_warehouse_change(mapper, connection, target):
+    _queue(inspect(target).session, REFRESH)
+
+
+def _on_warehouse_update(mapper, connection, target):
+    # Only activation changes affect which warehouses are listed
+    if inspect(target).attrs.active.history.has_changes():
+        _queue(inspect(target).session, REFRESH)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+def _on_bulk_update(update_context):
+    if update_context.mapper.class_ in (Warehouse, WarehouseProduct):
+        _queue(update_context.session, REFRESH)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def _on_bulk_delete(delete_context):
+    if delete_context.mapper.class_ in (Warehouse, WarehouseProduct):
+        _queue(delete_context.session, REFRESH)
+
+
+@event.listens_for(Session, 'before_commit')
+def _mark_commit_started(session):
+    # after_commit runs once the database commit is done; a rebuild may have read it by then
+    session.info[COMMIT_STARTED_KEY] = time.monotonic()
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_after_commit(session):
+    commit_started = session.info.pop(COMMIT_STARTED_KEY, 0.0)
+    changes = session.info.pop(INVENTORY_CHANGES_KEY, None)
+    if not changes:
+        return
+    snapshot = _get_snapshot()
+    if not snapshot:
+        return
+    if any(change is REFRESH for change in changes):
+        snapshot.invalidate()
+    else:
+        snapshot.apply(changes, commit_started, time.monotonic())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop(COMMIT_STARTED_KEY, None)
+    session.info.pop(INVENTORY_CHANGES_KEY, None)
+
+
+event.listen(WarehouseProduct, 'after_insert', _on_listing_insert)
+event.listen(WarehouseProduct, 'after_update', _on_listing_update)
+event.listen(WarehouseProduct, 'after_delete', _on_listing_delete)
+for _event_name in ('after_insert', 'after_delete'):
+    event.listen(Warehouse, _event_name, _on_warehouse_change)
+event.listen(Warehouse, 'after_update', _on_warehouse_update)
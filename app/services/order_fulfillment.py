@@ -0,0 +1,94 @@
+"""
+Set-based order fulfillment roll-up.
+
+An order is fulfilled once none of its shipments is still undelivered.
+Instead of loading every shipment and order line, these helpers issue:
+
+- one UPDATE marking the delivered shipments (a shipment_transitions CAS)
+- one conditional UPDATE on orders (... WHERE NOT EXISTS an undelivered shipment)
+- one bulk UPDATE on orders_products for the orders that just became fulfilled
+
+They only execute statements on the current session; the caller commits.
+The same functions serve one shipment (webhooks) and thousands (batches).
+"""
+from datetime import datetime, timezone
+from sqlalchemy import and_, exists, select, update
+from app.model import db, Shipment, Order, OrderProduct
+from app.services.shipment_transitions import transition_many
+
+FULFILLED = 'Fulfilled'
+
+
+def _ids(values):
+    return list({int(value) for value in values})
+
+
+def mark_shipments_delivered(shipment_ids, now=None):
+    """Set shipments to delivered. Returns how many changed."""
+    return len(transition_many(shipment_ids, 'delivered', now=now))
+
+
+def _fulfill_items(order_filter, now):
+    # Lines of orders that are now fulfilled and not yet marked themselves
+    return db.session.execute(
+        update(OrderProduct)
+        .where(order_filter(OrderProduct.order_id),
+               OrderProduct.status != FULFILLED,
+               exists().where(and_(Order.order_id == OrderProduct.order_id, Order.order_status == FULFILLED)))
+        .values(status=FULFILLED, fulfillment_date=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def roll_up_orders(order_ids=None, shipment_ids=None, now=None):
+    """
+    Fulfill the orders (given directly, or as the orders of `shipment_ids`)
+    that have no undelivered shipment left, and their order lines.
+    Returns (orders fulfilled, order lines fulfilled).
+    """
+    if order_ids is not None:
+        order_ids = _ids(order_ids)
+        if not order_ids:
+            return 0, 0
+        order_filter = lambda column: column.in_(order_ids)
+    elif shipment_ids is not None:
+        shipment_ids = _ids(shipment_ids)
+        if not shipment_ids:
+            return 0, 0
+        owning_orders = select(Shipment.order_id).where(Shipment.shipment_id.in_(shipment_ids)).scalar_subquery()
+        order_filter = lambda column: column.in_(owning_orders)
+    else:
+        raise ValueError("roll_up_orders needs order_ids or shipment_ids")
+
+    now = now or datetime.now(timezone.utc)
+    undelivered = exists().where(and_(Shipment.order_id == Order.order_id, Shipment.status != 'delivered'))
+    orders = db.session.execute(
+        update(Order)
+        .where(order_filter(Order.order_id), Order.order_status != FULFILLED, ~undelivered)
+        .values(order_status=FULFILLED)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    items = _fulfill_items(order_filter, now) if orders else 0
+    return orders, items
+
+
+def deliver_shipments(shipment_ids, now=None):
+    """Mark shipments delivered and roll their orders up. Returns (shipments, orders, order lines) changed."""
+    now = now or datetime.now(timezone.utc)
+    shipments = mark_shipments_delivered(shipment_ids, now)
+    orders, items = roll_up_orders(shipment_ids=shipment_ids, now=now)
+    return shipments, orders, items
+
+
+def roll_up_order_items(order_ids):
+    """Fulfill orders whose order lines are all fulfilled (seller-side fulfillment). Returns orders changed."""
+    order_ids = _ids(order_ids)
+    if not order_ids:
+        return 0
+    open_lines = exists().where(and_(OrderProduct.order_id == Order.order_id, OrderProduct.status != FULFILLED))
+    return db.session.execute(
+        update(Order)
+        .where(Order.order_id.in_(order_ids), Order.order_status != FULFILLED, ~open_lines)
+        .values(order_status=FULFILLED)
+        .execution_options(synchronize_session=False)
+    ).rowcount
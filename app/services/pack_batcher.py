@@ -0,0 +1,143 @@
+"""
+Groups APack requests per warehouse into one ACommands.
+
+During a checkout burst many shipments from the same warehouse are created
+within milliseconds of each other. Instead of one command (and one
+WorldMessage commit) per shipment, PackBatcher holds each warehouse's packs
+for up to `window` seconds after the first one arrives, or until
+`max_batch` are waiting, and sends them with one pack_shipments_async call
+from a background thread.
+
+pack_shipment_async has the same signature and result as the world
+service's, so callers do not change: the Future resolves to "ACK" once the
+world acks that shipment's APack, or fails with WorldRequestError. With a
+window of 0 requests go straight to the world service.
+"""
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def _relay(target, source):
+    error = source.exception()
+    if error is not None:
+        target.set_exception(error)
+    else:
+        target.set_result(source.result())
+
+
+class PackBatcher:
+    def __init__(self, app, world, window=0.01, max_batch=200):
+        self.app = app
+        self.world = world
+        self.window = window
+        self.max_batch = max_batch
+        # warehouse_id -> [(shipment_id, items, future)], and when that warehouse's batch is due
+        self.pending = {}
+        self.deadlines = {}
+        self.condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.submitted = 0
+        self.batches = 0
+        self.largest_batch = 0
+        atexit.register(self.close)
+
+    def pack_shipment_async(self, warehouse_id, shipment_id, items):
+        if self.window <= 0:
+            return self.world.pack_shipment_async(warehouse_id, shipment_id, items)
+
+        future = Future()
+        with self.condition:
+            batch = self.pending.setdefault(warehouse_id, [])
+            if not batch:
+                # The sender may be asleep with no deadline at all; give it this one
+                self.deadlines[warehouse_id] = time.monotonic() + self.window
+                self.condition.notify()
+            batch.append((shipment_id, items, future))
+            self.submitted += 1
+            if len(batch) >= self.max_batch:
+                self.deadlines[warehouse_id] = 0
+                self.condition.notify()
+        self._ensure_started()
+        return future
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self.condition:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name='pack-batcher', daemon=True)
+            self._thread.start()
+
+    def _take_due(self, now):
+        # Caller holds self.condition
+        due = [warehouse_id for warehouse_id, deadline in self.deadlines.items() if deadline <= now]
+        batches = [(warehouse_id, self.pending.pop(warehouse_id)) for warehouse_id in due]
+        for warehouse_id in due:
+            del self.deadlines[warehouse_id]
+        return batches
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self._stop:
+                    now = time.monotonic()
+                    if self.deadlines and min(self.deadlines.values()) <= now:
+                        break
+                    timeout = min(self.deadlines.values()) - now if self.deadlines else None
+                    self.condition.wait(timeout)
+                if self._stop:
+                    return
+                batches = self._take_due(time.monotonic())
+            for warehouse_id, batch in batches:
+                self._send(warehouse_id, batch)
+
+    def _send(self, warehouse_id, batch):
+        try:
+            with self.app.app_context():
+                futures = self.world.pack_shipments_async(warehouse_id, [(sid, items) for sid, items, _ in batch])
+        except Exception as e:
+            logger.error(f"Error sending {len(batch)} packs for warehouse {warehouse_id}: {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, _, future), world_future in zip(batch, futures):
+            world_future.add_done_callback(lambda f, future=future: _relay(future, f))
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        logger.debug("Sent %d packs for warehouse %s in one command", len(batch), warehouse_id)
+
+    def flush(self):
+        """Send everything waiting now, whatever its deadline. Returns the number of packs sent."""
+        with self.condition:
+            batches = self._take_due(float('inf'))
+        for warehouse_id, batch in batches:
+            self._send(warehouse_id, batch)
+        return sum(len(batch) for _, batch in batches)
+
+    def close(self):
+        with self.condition:
+            self._stop = True
+            self.condition.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self.condition:
+            waiting = sum(len(batch) for batch in self.pending.values())
+        return {
+            'window_ms': self.window * 1e3,
+            'submitted': self.submitted,
+            'batches': self.batches,
+            'largest_batch': self.largest_batch,
+            'waiting': waiting
+        }
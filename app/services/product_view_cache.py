@@ -0,0 +1,219 @@
+import threading
+import time
+import logging
+from types import SimpleNamespace
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload, object_session
+from app.model import db, Product, Inventory as InventoryListing, WarehouseProduct, Warehouse, Review, User
+
+logger = logging.getLogger(__name__)
+
+DIRTY_PRODUCTS_KEY = 'product_view_dirty'
+DIRTY_ALL = object()  # marker: something every product view depends on changed
+
+
+class ProductViewCache:
+    """
+    Per-product cache of the fully assembled product detail view model.
+
+    Every product has a version number and the cache as a whole has an epoch.
+    Writes bump the version (or the epoch for catalog-wide changes) once their
+    transaction commits; an entry is served only while both still match the
+    values captured before it was built, so a rebuild racing with a write can
+    never be stored as current.
+    """
+
+    def __init__(self, maxsize=2048, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # product_id -> (epoch, version, expires_at, view)
+        self.versions = {}
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def bump(self, product_id):
+        with self.lock:
+            self.versions[product_id] = self.versions.get(product_id, 0) + 1
+            self.entries.pop(product_id, None)
+
+    def bump_all(self):
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+
+    def get_or_build(self, product_id, builder):
+        if not self.enabled:
+            return builder(product_id)
+
+        now = time.monotonic()
+        with self.lock:
+            epoch = self.epoch
+            version = self.versions.get(product_id, 0)
+            entry = self.entries.get(product_id)
+            if entry and entry[0] == epoch and entry[1] == version and entry[2] >= now:
+                self.entries.move_to_end(product_id)
+                self.hits += 1
+                return entry[3]
+            self.misses += 1
+
+        view = builder(product_id)
+        if view is None:
+            return None
+
+        with self.lock:
+            # Only store if no write landed while we were building
+            if self.epoch == epoch and self.versions.get(product_id, 0) == version:
+                self.entries[product_id] = (epoch, version, time.monotonic() + self.ttl, view)
+                self.entries.move_to_end(product_id)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return view
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'epoch': self.epoch,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def build_product_view(product_id):
+    """Assemble everything product_detail.html needs for one product."""
+    from app.models.inventory import Inventory
+    from app.models.review import ReviewService
+    from app.services.warehouse_service import WarehouseService
+
+    product = Product.query.options(
+        joinedload(Product.category),
+        joinedload(Product.owner)
+    ).filter(Product.product_id == product_id).first()
+    if not product:
+        return None
+
+    view = SimpleNamespace(
+        product_id=product.product_id,
+        product_name=product.product_name,
+        description=product.description,
+        image=product.image,
+        price=product.price,
+        category_id=product.category_id,
+        owner_id=product.owner_id,
+        created_at=product.created_at,
+        updated_at=product.updated_at,
+        inventory=Inventory.get_sellers_for_product(product_id),
+        owner_name="Unknown Seller",
+        category_name="Uncategorized",
+        avg_rating=0,
+        review_count=0,
+        rating_distribution={},
+        warehouses=[]
+    )
+
+    try:
+        avg_rating, review_count = ReviewService.get_avg_rating_product(product_id)
+        rating_distribution = ReviewService.get_rating_distribution(product_id)
+
+        view.avg_rating = avg_rating if avg_rating is not None else 0
+        view.review_count = review_count if review_count is not None else 0
+        view.rating_distribution = rating_distribution if rating_distribution else {}
+
+        if product.owner:
+            view.owner_name = f"{product.owner.first_name} {product.owner.last_name}"
+        if product.category:
+            view.category_name = product.category.category_name
+
+        view.warehouses = WarehouseService().get_product_inventory(product_id)
+    except Exception as e:
+        logger.error(f"Error fetching review/extra stats for product {product_id}: {e}")
+        view.owner_name = "Error fetching seller"
+        view.category_name = "Error fetching category"
+
+    related_rows = db.session.query(
+        Product.product_id, Product.product_name, Product.image, Product.price
+    ).filter(
+        Product.category_id == product.category_id,
+        Product.product_id != product.product_id
+    ).limit(4).all()
+
+    return SimpleNamespace(
+        product=view,
+        related_products=[SimpleNamespace(**row._asdict()) for row in related_rows]
+    )
+
+
+def invalidate_product(product_id, session=None):
+    """Mark a product view stale once the current transaction commits (for raw SQL writes)."""
+    _mark_dirty(session or db.session(), product_id)
+
+
+def _mark_dirty(session, key):
+    if session is None:
+        return
+    session.info.setdefault(DIRTY_PRODUCTS_KEY, set()).add(key)
+
+
+def _get_cache():
+    try:
+        return current_app.config.get('PRODUCT_VIEW_CACHE')
+    except RuntimeError:
+        return None
+
+
+@event.listens_for(Session, 'after_commit')
+def _flush_dirty_products(session):
+    dirty = session.info.pop(DIRTY_PRODUCTS_KEY, None)
+    if not dirty:
+        return
+    product_cache = _get_cache()
+    if not product_cache:
+        return
+    if DIRTY_ALL in dirty:
+        product_cache.bump_all()
+        return
+    for product_id in dirty:
+        product_cache.bump(product_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dirty_products(session):
+    session.info.pop(DIRTY_PRODUCTS_KEY, None)
+
+
+def _on_product_scoped_write(mapper, connection, target):
+    if target.product_id is not None:
+        _mark_dirty(object_session(target), target.product_id)
+
+
+def _on_catalog_wide_write(mapper, connection, target):
+    # Products feed "related products" of their category; warehouses feed location labels
+    _mark_dirty(object_session(target), DIRTY_ALL)
+
+
+def _on_user_update(mapper, connection, target):
+    # Seller and owner names are embedded in cached views
+    state = inspect(target)
+    if state.attrs.first_name.history.has_changes() or state.attrs.last_name.history.has_changes():
+        _mark_dirty(object_session(target), DIRTY_ALL)
+
+
+for _model in (InventoryListing, WarehouseProduct, Review):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _on_product_scoped_write)
+
+for _model in (Product, Warehouse):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _on_catalog_wide_write)
+
+event.listen(User, 'after_update', _on_user_update)
@@ -0,0 +1,182 @@
+import threading
+import time
+import logging
+from collections import deque
+from sqlalchemy import and_, func
+from app.model import db, Product, ReorderPoint, WarehouseProduct
+
+logger = logging.getLogger(__name__)
+
+
+class ReplenishmentEngine:
+    """
+    Background restocking driven by reorder points.
+
+    Each cycle reads every (warehouse, product) whose stock plus units
+    already on order is below its reorder point, orders it back up to its
+    target level, and sends all of those purchases as one ACommands: one
+    APurchaseMore per warehouse carrying every product it needs. Explicit
+    ReorderPoint rows take precedence; `default_reorder_point` and
+    `default_target_level` (0 = off) apply to all other stocked listings.
+
+    In dry-run mode the plan is computed and reported but nothing is sent.
+    Units already bought but not yet arrived (WorldSimulatorService
+    purchase handles) count as stock, so a slow world does not cause the
+    same shortfall to be ordered again every cycle.
+    """
+
+    def __init__(self, app, interval=60, dry_run=False, default_reorder_point=0, default_target_level=0,
+                 max_units_per_cycle=0):
+        self.app = app
+        self.interval = interval
+        self.dry_run = dry_run
+        self.default_reorder_point = default_reorder_point
+        self.default_target_level = max(default_target_level, default_reorder_point)
+        self.max_units_per_cycle = max_units_per_cycle
+        self.history = deque(maxlen=50)
+        self.cycles = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='replenishment', daemon=True)
+        self._thread.start()
+        logger.info("Replenishment engine started (every %ss%s)", self.interval, ', dry run' if self.dry_run else '')
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.run_cycle()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Replenishment cycle failed: {e}", exc_info=True)
+
+    def _world(self):
+        world = self.app.config.get('WORLD_SIMULATOR_SERVICE')
+        # Needs the in-process service (purchase handles), not a gateway client
+        return world if hasattr(world, 'buy_products') and hasattr(world, 'units_on_order') else None
+
+    def plan(self):
+        """Shortfalls as dicts (warehouse_id, product_id, description, on_hand, on_order, quantity)."""
+        on_hand = func.coalesce(WarehouseProduct.quantity, 0)
+        rows = db.session.query(
+            ReorderPoint.warehouse_id,
+            ReorderPoint.product_id,
+            ReorderPoint.reorder_point,
+            ReorderPoint.target_level,
+            on_hand.label('on_hand'),
+            Product.product_name
+        ).join(Product, Product.product_id == ReorderPoint.product_id)\
+         .outerjoin(WarehouseProduct, and_(WarehouseProduct.warehouse_id == ReorderPoint.warehouse_id,
+                                           WarehouseProduct.product_id == ReorderPoint.product_id))\
+         .filter(ReorderPoint.active == True, on_hand < ReorderPoint.reorder_point).all()
+
+        candidates = [(r.warehouse_id, r.product_id, r.reorder_point, r.target_level, r.on_hand, r.product_name)
+                      for r in rows]
+
+        if self.default_reorder_point > 0:
+            default_rows = db.session.query(
+                WarehouseProduct.warehouse_id,
+                WarehouseProduct.product_id,
+                WarehouseProduct.quantity,
+                Product.product_name
+            ).join(Product, Product.product_id == WarehouseProduct.product_id)\
+             .outerjoin(ReorderPoint, and_(ReorderPoint.warehouse_id == WarehouseProduct.warehouse_id,
+                                           ReorderPoint.product_id == WarehouseProduct.product_id))\
+             .filter(ReorderPoint.id == None, WarehouseProduct.quantity < self.default_reorder_point).all()
+            candidates.extend((r.warehouse_id, r.product_id, self.default_reorder_point, self.default_target_level,
+                               r.quantity or 0, r.product_name) for r in default_rows)
+
+        world = self._world()
+        shortfalls = []
+        for warehouse_id, product_id, reorder_point, target_level, stock, name in candidates:
+            on_order = world.units_on_order(warehouse_id, product_id) if world else 0
+            if stock + on_order >= reorder_point:
+                continue
+            quantity = target_level - stock - on_order
+            if quantity > 0:
+                shortfalls.append({
+                    'warehouse_id': warehouse_id,
+                    'product_id': product_id,
+                    'description': (name or f"Product {product_id}")[:50],
+                    'on_hand': stock,
+                    'on_order': on_order,
+                    'quantity': quantity
+                })
+
+        # Emptiest first, so a per-cycle cap spends units where they matter most
+        shortfalls.sort(key=lambda s: (s['on_hand'] + s['on_order'], s['warehouse_id'], s['product_id']))
+        if self.max_units_per_cycle > 0:
+            capped, budget = [], self.max_units_per_cycle
+            for shortfall in shortfalls:
+                if budget <= 0:
+                    break
+                shortfall['quantity'] = min(shortfall['quantity'], budget)
+                budget -= shortfall['quantity']
+                capped.append(shortfall)
+            shortfalls = capped
+        return shortfalls
+
+    def run_cycle(self, dry_run=None):
+        """Plan and (unless dry run) send one replenishment batch. Returns (success, report)."""
+        dry_run = self.dry_run if dry_run is None else dry_run
+        started = time.perf_counter()
+        shortfalls = self.plan()
+        report = {
+            'at': time.time(),
+            'dry_run': dry_run,
+            'shortfalls': len(shortfalls),
+            'warehouses': len({s['warehouse_id'] for s in shortfalls}),
+            'units': sum(s['quantity'] for s in shortfalls),
+            'sent': False,
+            'plan': shortfalls
+        }
+        self.cycles += 1
+
+        if not shortfalls or dry_run:
+            report['duration_ms'] = (time.perf_counter() - started) * 1e3
+            self.history.append(report)
+            if shortfalls:
+                logger.info("Replenishment dry run: %d shortfalls, %d units across %d warehouses",
+                            report['shortfalls'], report['units'], report['warehouses'])
+            return True, report
+
+        world = self._world()
+        if not world or not world.connected:
+            report['error'] = "Not connected to World Simulator"
+            self.history.append(report)
+            return False, report
+
+        success, handle = world.buy_products(shortfalls)
+        if not success:
+            report['error'] = handle
+            self.history.append(report)
+            return False, report
+
+        report['sent'] = True
+        report['seqnums'] = handle.seqnums
+        report['duration_ms'] = (time.perf_counter() - started) * 1e3
+        self.history.append(report)
+        logger.info("Replenishment sent %d purchases (%d products, %d units) in one command",
+                    len(handle.seqnums), report['shortfalls'], report['units'])
+        return True, report
+
+    def stats(self):
+        last = self.history[-1] if self.history else None
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'interval': self.interval,
+            'dry_run': self.dry_run,
+            'cycles': self.cycles,
+            'last_cycle': {k: v for k, v in last.items() if k != 'plan'} if last else None
+        }
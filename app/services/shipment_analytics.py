@@ -0,0 +1,147 @@
+"""
+Shipment stage latencies from the shipment_events log.
+
+Events are exported as flat columns (shipment, warehouse, event, epoch
+seconds) and everything after that is array operations: one scatter-min
+gives the first time each shipment reached each event, a stage is the
+difference of two columns of that matrix, and percentiles per warehouse
+come from one sort over (warehouse, duration).
+"""
+import logging
+import numpy as np
+from sqlalchemy import select
+from app.model import db, Shipment, ShipmentEvent
+
+logger = logging.getLogger(__name__)
+
+# stage -> (start event, end event)
+STAGES = {
+    'pack': ('created', 'packed'),
+    'truck_wait': ('truck_arrived', 'loaded'),
+    'load': ('loading', 'loaded'),
+    'load_to_delivery': ('loaded', 'delivered'),
+    'end_to_end': ('created', 'delivered'),
+}
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+
+EVENTS = ('created', 'packed', 'truck_arrived', 'loading', 'loaded', 'delivering', 'delivered')
+EVENT_CODES = {event: code for code, event in enumerate(EVENTS)}
+
+
+class EventColumns:
+    """Parallel arrays of shipment_events rows; events as indexes into EVENTS (-1 if unknown)."""
+    __slots__ = ('shipment_ids', 'warehouse_ids', 'events', 'times')
+
+    def __init__(self, shipment_ids, warehouse_ids, events, times):
+        self.shipment_ids = np.asarray(shipment_ids, dtype=np.int64)
+        self.warehouse_ids = np.asarray(warehouse_ids, dtype=np.int64)
+        self.events = np.fromiter((EVENT_CODES.get(event, -1) for event in events), dtype=np.int8,
+                                  count=len(self.shipment_ids))
+        self.times = np.asarray(times, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.shipment_ids)
+
+
+def export_events(since=None, warehouse_id=None):
+    """Events of shipments created since `since` (a datetime, UTC), optionally one warehouse only."""
+    query = select(ShipmentEvent.shipment_id, Shipment.warehouse_id, ShipmentEvent.event, ShipmentEvent.occurred_at)\
+        .join(Shipment, Shipment.shipment_id == ShipmentEvent.shipment_id)
+    if since is not None:
+        query = query.where(Shipment.created_at >= since)
+    if warehouse_id is not None:
+        query = query.where(Shipment.warehouse_id == warehouse_id)
+    rows = db.session.execute(query).all()
+    if not rows:
+        return EventColumns([], [], [], [])
+    shipment_ids, warehouse_ids, events, occurred = zip(*rows)
+    times = np.array(occurred, dtype='datetime64[us]').astype(np.int64) / 1e6
+    return EventColumns(shipment_ids, warehouse_ids, events, times)
+
+
+class Timeline:
+    """
+    First time each shipment reached each event: a (shipments x EVENTS)
+    matrix of epoch seconds, NaN where the event never happened.
+    """
+
+    def __init__(self, columns):
+        self.shipment_ids, first_row, shipment_index = np.unique(columns.shipment_ids, return_index=True,
+                                                                 return_inverse=True)
+        self.warehouse_ids = columns.warehouse_ids[first_row]
+        known = columns.events >= 0
+        cells = shipment_index[known] * len(EVENTS) + columns.events[known]
+        reached = np.full(len(self.shipment_ids) * len(EVENTS), np.inf)
+        np.minimum.at(reached, cells, columns.times[known])
+        reached[np.isinf(reached)] = np.nan
+        self.reached = reached.reshape(len(self.shipment_ids), len(EVENTS))
+
+    def column(self, event):
+        return self.reached[:, EVENT_CODES[event]]
+
+
+def stage_durations(timeline, start, end):
+    """(warehouse ids, durations in seconds) of shipments that reached both events, end not before start."""
+    durations = timeline.column(end) - timeline.column(start)
+    # NaN (a missing event) compares False, so those shipments drop out too
+    valid = durations >= 0
+    return timeline.warehouse_ids[valid], durations[valid]
+
+
+def grouped_percentiles(groups, values, percentiles=DEFAULT_PERCENTILES):
+    """
+    Percentiles (linear interpolation, as np.percentile) of `values` per
+    group in one pass. Returns (group keys, counts, means, matrix of
+    shape (groups, percentiles)).
+    """
+    groups = np.asarray(groups)
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return groups[:0], np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros((0, len(percentiles)))
+    order = np.argsort(values)
+    order = order[np.argsort(groups[order], kind='stable')]
+    groups, values = groups[order], values[order]
+    keys, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+    quantiles = np.asarray(percentiles, dtype=np.float64) / 100.0
+    positions = starts[:, None] + quantiles[None, :] * (counts[:, None] - 1)
+    low = np.floor(positions).astype(np.int64)
+    high = np.ceil(positions).astype(np.int64)
+    fraction = positions - low
+    matrix = values[low] + (values[high] - values[low]) * fraction
+    means = np.add.reduceat(values, starts) / counts
+    return keys, counts, means, matrix
+
+
+def _summaries(keys, counts, means, matrix, percentiles):
+    return {
+        key: dict({'count': int(count), 'mean': round(float(mean), 3)},
+                  **{f'p{p:g}': round(float(value), 3) for p, value in zip(percentiles, row)})
+        for key, count, mean, row in zip(keys.tolist(), counts, means, matrix)
+    }
+
+
+def latency_report(since=None, warehouse_id=None, percentiles=DEFAULT_PERCENTILES, columns=None):
+    """Per-stage latency percentiles (seconds), overall and per warehouse."""
+    columns = export_events(since, warehouse_id) if columns is None else columns
+    timeline = Timeline(columns)
+    stages = {}
+    for stage, (start, end) in STAGES.items():
+        warehouse_ids, durations = stage_durations(timeline, start, end)
+        overall = _summaries(*grouped_percentiles(np.zeros(len(durations), dtype=np.int64), durations, percentiles),
+                             percentiles)
+        stages[stage] = {
+            'from': start,
+            'to': end,
+            'all': overall.get(0, {'count': 0}),
+            'warehouses': _summaries(*grouped_percentiles(warehouse_ids, durations, percentiles), percentiles)
+        }
+    return {
+        'since': since.isoformat() if since else None,
+        'warehouse_id': warehouse_id,
+        'events': len(columns),
+        'shipments': len(timeline.shipment_ids),
+        'percentiles': list(percentiles),
+        'stages': stages
+    }
+
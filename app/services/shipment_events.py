@@ -0,0 +1,159 @@
+"""
+Append-only shipment lifecycle log (shipment_events).
+
+Handlers do not write events themselves. shipment_transitions queues one
+event per shipment that actually moved, and handlers queue the events that
+are not status changes (created, truck_arrived) with queue_event(). Queued
+events live in session.info until the handler's commit: after_commit hands
+them to the process-wide ShipmentEventLog, after_rollback drops them, so a
+rolled-back transition never shows up in the log.
+
+ShipmentEventLog buffers events and inserts them with one bulk INSERT per
+flush from a background thread, every `flush_interval` seconds or as soon
+as `batch_size` events are waiting. The buffer is bounded; when the
+database falls far behind, the oldest events are dropped and counted.
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from app.model import db, ShipmentEvent
+
+logger = logging.getLogger(__name__)
+
+SHIPMENT_EVENTS_KEY = 'shipment_events_pending'
+
+
+def _naive_utc(at):
+    if at is None:
+        return datetime.utcnow()
+    return at.astimezone(timezone.utc).replace(tzinfo=None) if at.tzinfo else at
+
+
+class ShipmentEventLog:
+    def __init__(self, app, flush_interval=1.0, batch_size=500, max_buffer=100000):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.buffer = deque(maxlen=max_buffer)
+        self.lock = threading.Lock()
+        # Serializes flushes between the writer thread and explicit flush() calls
+        self.flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        atexit.register(self.close)
+
+    def record(self, rows):
+        """Buffer event dicts (shipment_id, event, truck_id, occurred_at)."""
+        with self.lock:
+            overflow = max(len(self.buffer) + len(rows) - self.buffer.maxlen, 0)
+            self.buffer.extend(rows)
+            self.recorded += len(rows)
+            self.dropped += overflow
+            pending = len(self.buffer)
+        if overflow:
+            logger.warning("Shipment event buffer full; dropped %d oldest events", overflow)
+        self._ensure_started()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self.lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='shipment-events', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of events written."""
+        with self.flush_lock:
+            with self.lock:
+                rows = list(self.buffer)
+                self.buffer.clear()
+            if not rows:
+                return 0
+            with self.app.app_context():
+                try:
+                    db.session.execute(insert(ShipmentEvent), rows)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self.failed += len(rows)
+                    logger.error(f"Failed to write {len(rows)} shipment events: {e}")
+                    return 0
+            self.written += len(rows)
+            self.flushes += 1
+            return len(rows)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        return {
+            'pending': len(self.buffer),
+            'recorded': self.recorded,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'flushes': self.flushes,
+            'flush_interval': self.flush_interval,
+            'batch_size': self.batch_size
+        }
+
+
+def queue_event(shipment_ids, name, truck_id=None, at=None, session=None):
+    """Queue an event for each shipment; written only if the current transaction commits."""
+    if not isinstance(shipment_ids, (list, tuple, set)):
+        shipment_ids = [shipment_ids]
+    occurred_at = _naive_utc(at)
+    session = session or db.session()
+    session.info.setdefault(SHIPMENT_EVENTS_KEY, []).extend(
+        {'shipment_id': int(shipment_id), 'event': name, 'truck_id': truck_id, 'occurred_at': occurred_at}
+        for shipment_id in shipment_ids
+    )
+
+
+def _get_log():
+    try:
+        return current_app.config.get('SHIPMENT_EVENT_LOG')
+    except RuntimeError:
+        return None
+
+
+@event.listens_for(Session, 'after_commit')
+def _record_after_commit(session):
+    rows = session.info.pop(SHIPMENT_EVENTS_KEY, None)
+    if not rows:
+        return
+    log = _get_log()
+    if log:
+        log.record(rows)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop(SHIPMENT_EVENTS_KEY, None)
@@ -1,10 +1,16 @@
 from datetime import datetime
 import logging
+import threading
 from flask import current_app
+from sqlalchemy import update
 from sqlalchemy.exc import SQLAlchemyError
 from app.model import db, Shipment, ShipmentItem, Order, OrderProduct, Product, Warehouse
-from app.services.world_simulator_service import WorldSimulatorService
+from app.services.world_simulator_service import WorldSimulatorService, warn_on_failure
 from app.services.ups_integration_service import UPSIntegrationService
+from app.services.order_fulfillment import deliver_shipments, roll_up_orders
+from app.services.shipment_events import queue_event
+from app.services.truck_loading import TruckLoadingCoordinator
+from app.services.shipment_transitions import RANK, current_status, is_forward, transition, transition_many
 from datetime import datetime, timezone
 
 
@@ -15,7 +21,13 @@ class ShipmentService:
         self.world_simulator = world_simulator_service
         self.ups_integration = UPSIntegrationService()
     
-    def create_shipment(self, user_id, email, order_id, warehouse_id, destination_x, destination_y, ups_account=None):
+    def create_shipment(self, user_id, email, order_id, warehouse_id, destination_x, destination_y, ups_account=None,
+                        items=None):
+        """
+        Create and announce one shipment for an order. By default it carries every
+        order line; pass items=[(product_id, quantity), ...] to ship part of an
+        order split across warehouses (several shipments per order are then allowed).
+        """
         try:
             # Get the order
             order = Order.query.filter_by(order_id=order_id).first()
@@ -28,9 +40,10 @@ class ShipmentService:
                 return False, "Warehouse not found"
             
             # check if a shipment done for this order
-            existing_shipment = Shipment.query.filter_by(order_id=order_id).first()
-            if existing_shipment:
-                return False, "A shipment already exists for this order"
+            if items is None:
+                existing_shipment = Shipment.query.filter_by(order_id=order_id).first()
+                if existing_shipment:
+                    return False, "A shipment already exists for this order"
             
             # Create the shipment
             shipment = Shipment(
@@ -47,17 +60,19 @@ class ShipmentService:
             db.session.flush()  # without commit
             
             # Get order items
-            order_items = OrderProduct.query.filter_by(order_id=order_id).all()
-            if not order_items:
+            if items is None:
+                items = [(order_item.product_id, order_item.quantity)
+                         for order_item in OrderProduct.query.filter_by(order_id=order_id).all()]
+            if not items:
                 return False, "Order has no items"
             
             # Create shipment items
             logger.info("Save Shipment Items")
-            for order_item in order_items:
+            for product_id, quantity in items:
                 shipment_item = ShipmentItem(
                     shipment_id=shipment.shipment_id,
-                    product_id=order_item.product_id,
-                    quantity=order_item.quantity
+                    product_id=product_id,
+                    quantity=quantity
                 )
                 db.session.add(shipment_item)
 
@@ -79,29 +94,26 @@ class ShipmentService:
                 db.session.rollback()
                 return False, msg
 
+            queue_event(shipment.shipment_id, 'created')
             db.session.commit()
             
             logger.info(f"Send Shipment ID Successfully: {shipment.shipment_id}")
             
             # adding shipment items
-            items = []
-            for order_item in order_items:
-                product = Product.query.filter_by(product_id=order_item.product_id).first()
+            pack_items = []
+            for product_id, quantity in items:
+                product = Product.query.filter_by(product_id=product_id).first()
                 if product:
-                    items.append({
-                        'product_id': order_item.product_id,
+                    pack_items.append({
+                        'product_id': product_id,
                         'description': product.product_name,
-                        'quantity': order_item.quantity
+                        'quantity': quantity
                     })
 
             logger.info(f"Send package info: {shipment.shipment_id}")
             # request packing from world simulator
-            if items:
-                self.world_simulator.pack_shipment(
-                    warehouse_id=warehouse_id,
-                    shipment_id=shipment.shipment_id,
-                    items=items
-                )
+            if pack_items:
+                self._pack(warehouse_id, shipment.shipment_id, pack_items)
             
             
             return True, shipment.shipment_id
@@ -115,6 +127,47 @@ class ShipmentService:
             logger.error(f"Error creating shipment: {str(e)}")
             return False, f"Error: {str(e)}"
     
+    def _pack(self, warehouse_id, shipment_id, pack_items, attempt=0):
+        """Request packing; a refused, dropped or failed pack is retried with backoff while the shipment is packing."""
+        future = warn_on_failure(self._packer().pack_shipment_async(
+            warehouse_id=warehouse_id,
+            shipment_id=shipment_id,
+            items=pack_items
+        ), f"Packing shipment {shipment_id}")
+        app = current_app._get_current_object()
+        future.add_done_callback(lambda f: self._retry_pack(app, f, warehouse_id, shipment_id, pack_items, attempt))
+        return future
+
+    def _retry_pack(self, app, future, warehouse_id, shipment_id, pack_items, attempt):
+        if future.exception() is None:
+            return
+        if attempt >= app.config.get('PACK_RETRY_ATTEMPTS', 5):
+            logger.error(f"Giving up on packing shipment {shipment_id} after {attempt + 1} attempts; "
+                         f"it stays in packing")
+            return
+
+        def retry():
+            with app.app_context():
+                try:
+                    # Packed or further along by now (a late ack, a replay after reconnect): nothing to redo
+                    if current_status(shipment_id) != 'packing':
+                        return
+                    logger.info(f"Retrying pack of shipment {shipment_id} (attempt {attempt + 2})")
+                    self._pack(warehouse_id, shipment_id, pack_items, attempt + 1)
+                except Exception as e:
+                    logger.error(f"Error retrying pack of shipment {shipment_id}: {e}")
+
+        timer = threading.Timer(app.config.get('PACK_RETRY_DELAY', 1.0) * 2 ** attempt, retry)
+        timer.daemon = True
+        timer.start()
+
+    def _packer(self):
+        # The app's PackBatcher groups packs per warehouse; it only stands in for the world service it wraps
+        batcher = current_app.config.get('PACK_BATCHER')
+        if batcher is not None and batcher.world is self.world_simulator:
+            return batcher
+        return self.world_simulator
+
     # Get shipment by ID
     def get_shipment(self, shipment_id):
         return Shipment.query.filter_by(shipment_id=shipment_id).first()
@@ -126,14 +179,14 @@ class ShipmentService:
     # handle package packed event
     def handle_package_packed(self, shipment_id):
         try:
-            shipment = Shipment.query.filter_by(shipment_id=shipment_id).first()
-            if not shipment:
-                return False, "Shipment not found"
-            
-            # Update shipment status
-            shipment.status = 'packed'
-            shipment.updated_at = datetime.now(timezone.utc)
+            # Only a packing shipment becomes packed; one already loading stays there
+            moved = transition(shipment_id, 'packed')
             db.session.commit()
+            if not moved:
+                status = current_status(shipment_id)
+                if status is None:
+                    return False, "Shipment not found"
+                return True, f"Shipment already {status}"
             
             # Notify UPS that the package is packed and ready for pickup
             # self.ups_integration.notify_package_packed(shipment_id)
@@ -147,33 +200,10 @@ class ShipmentService:
     # truck arrived event
     def handle_truck_arrived(self, truck_id, warehouse_id):
         try:
-            # Find packed shipments
-            shipments = Shipment.query.filter_by(
-                warehouse_id=warehouse_id,
-                status='packed'
-            ).all()
-            
-            if not shipments:
-                logger.info(f"No packed shipments found at warehouse {warehouse_id} for truck {truck_id}")
-                return True
-            
-            waiting_products = current_app.config.get('WAITING_PRODUCTS')
-
-            # update loading
-            for shipment in shipments:
-                shipment.truck_id = truck_id
-                shipment.status = 'loading'
-                shipment.updated_at = datetime.now(timezone.utc)
-                
-                # Request loading from world simulator
-                self.world_simulator.load_shipment(
-                    shipment_id=shipment.shipment_id,
-                    truck_id=truck_id,
-                    warehouse_id=warehouse_id
-                )
-            
-            db.session.commit()
-            return True
+            # Everything packed goes onto the truck in one world command (see truck_loading)
+            world_simulator = self.world_simulator or current_app.config.get('WORLD_SIMULATOR_SERVICE')
+            success, _ = TruckLoadingCoordinator(world_simulator).load_truck(truck_id, warehouse_id)
+            return success
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error handling truck arrival: {str(e)}")
@@ -182,13 +212,14 @@ class ShipmentService:
     # handle package loaded event    
     def handle_package_loaded(self, shipment_id, truck_id):
         try:
-            shipment = Shipment.query.filter_by(shipment_id=shipment_id).first()
-            if not shipment:
-                return False, "Shipment not found"
-            
-            shipment.status = 'loaded'
-            shipment.updated_at = datetime.now(timezone.utc)
+            moved = transition(shipment_id, 'loaded')
             db.session.commit()
+            if not moved:
+                status = current_status(shipment_id)
+                if status is None:
+                    return False, "Shipment not found"
+                # Duplicate or late event: UPS has already been told
+                return True, f"Shipment already {status}"
             
             # notify UPS that the package is loaded
             self.ups_integration.notify_package_loaded(shipment_id)
@@ -199,37 +230,132 @@ class ShipmentService:
             logger.error(f"Error handling package loaded: {str(e)}")
             return False, str(e)
     
+    # handle all packages of one world response being loaded
+    def handle_packages_loaded(self, shipment_ids):
+        try:
+            shipment_ids = transition_many(shipment_ids, 'loaded')
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error handling packages loaded: {str(e)}")
+            return False, str(e)
+
+        # Duplicates and late events did not move; UPS hears about each shipment once
+        for shipment_id in shipment_ids:
+            self.ups_integration.notify_package_loaded(shipment_id)
+        return True, {'loaded': len(shipment_ids)}
+
     # handle package delivered event
     def handle_package_delivered(self, shipment_id):
         try:
-            shipment = Shipment.query.filter_by(shipment_id=shipment_id).first()
-            if not shipment:
-                return False, "Shipment not found"
-            
-            shipment.status = 'delivered'
-            shipment.updated_at = datetime.now(timezone.utc)
-            
-            all_shipments = Shipment.query.filter_by(order_id=shipment.order_id).all()
-            all_delivered = all(s.status == 'delivered' for s in all_shipments)
-            
-            # If all delivered, mark as fulfilled
-            if all_delivered:
-                order = Order.query.filter_by(order_id=shipment.order_id).first()
-                if order:
-                    order.order_status = 'Fulfilled'
-                    
-                    order_items = OrderProduct.query.filter_by(order_id=order.order_id).all()
-                    for item in order_items:
-                        item.status = 'Fulfilled'
-                        item.fulfillment_date = datetime.now(timezone.utc)
-            
+            # Order is fulfilled once no shipment of it is undelivered (set-based, see order_fulfillment)
+            shipments, _, _ = deliver_shipments([shipment_id])
             db.session.commit()
+            if not shipments and current_status(shipment_id) is None:
+                return False, "Shipment not found"
             return True, "Package delivery processed successfully"
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error handling package delivery: {str(e)}")
             return False, str(e)
+
+    # handle many delivered packages at once
+    def handle_packages_delivered(self, shipment_ids):
+        try:
+            shipments, orders, items = deliver_shipments(shipment_ids)
+            db.session.commit()
+            logger.info(f"Delivered {shipments} shipments; {orders} orders ({items} lines) fulfilled")
+            return True, {'shipments': shipments, 'orders': orders, 'items': items}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error handling package deliveries: {str(e)}")
+            return False, str(e)
     
+    # apply a batch of validated UPS events in one transaction
+    def apply_ups_events(self, events):
+        """
+        events: dicts with message_type and payload, already validated.
+        Supported: TruckDispatched, TruckArrived, ShipmentDelivered,
+        PackageDelivered, StatusUpdate (delivering/delivered), TrackingInfo.
+
+        Events apply in order and the last value per shipment wins, except
+        that status only moves forward. Truck and tracking changes are
+        written with one bulk UPDATE per kind of change, status changes with
+        one compare-and-set transition per target status. Orders whose
+        shipments are now all delivered are fulfilled with set-based updates,
+        and everything is committed once. Returns
+        (results, arrivals): one (success, code, message) per event, and the
+        (shipment_id, truck_id, warehouse_id) of applied TruckArrived events.
+        """
+        shipment_ids = {event['payload']['shipment_id'] for event in events}
+        warehouse_ids = {event['payload']['warehouse_id'] for event in events
+                         if event['message_type'] == 'TruckArrived'}
+        statuses = dict(db.session.query(Shipment.shipment_id, Shipment.status)
+                                  .filter(Shipment.shipment_id.in_(shipment_ids)).all()) if shipment_ids else {}
+        known_warehouses = {row.warehouse_id for row in db.session.query(Warehouse.warehouse_id)
+                                                              .filter(Warehouse.warehouse_id.in_(warehouse_ids))} \
+            if warehouse_ids else set()
+
+        changes = {}
+        targets = {}
+        results = []
+        arrivals = []
+        for event in events:
+            kind = event['message_type']
+            payload = event['payload']
+            shipment_id = payload['shipment_id']
+            if shipment_id not in statuses:
+                results.append((False, 2000, f'Shipment {shipment_id} not found'))
+                continue
+            change = changes.setdefault(shipment_id, {})
+
+            if kind in ('TruckDispatched', 'TruckArrived'):
+                if kind == 'TruckArrived' and payload['warehouse_id'] not in known_warehouses:
+                    results.append((False, 2001, f"Warehouse {payload['warehouse_id']} not found"))
+                    continue
+                change['truck_id'] = payload['truck_id']
+                if kind == 'TruckArrived':
+                    arrivals.append((shipment_id, payload['truck_id'], payload['warehouse_id']))
+            elif kind == 'TrackingInfo':
+                change['ups_tracking_id'] = payload['tracking_id']
+            else:
+                status = 'delivered' if kind in ('ShipmentDelivered', 'PackageDelivered') \
+                    else str(payload['status']).lower()
+                if status not in ('delivering', 'delivered'):
+                    results.append((False, 1002, f"Received unknown or invalid status from UPS: {payload['status']}"))
+                    continue
+                if is_forward(statuses[shipment_id], status):
+                    statuses[shipment_id] = status
+                    targets[shipment_id] = status
+            results.append((True, 200, ''))
+
+        try:
+            now = datetime.now(timezone.utc)
+            rows = [dict(change, shipment_id=shipment_id, updated_at=now)
+                    for shipment_id, change in changes.items() if change]
+            # Bulk UPDATE by primary key, grouped by the set of columns changed
+            by_columns = {}
+            for row in rows:
+                by_columns.setdefault(tuple(sorted(row)), []).append(row)
+            for group in by_columns.values():
+                db.session.execute(update(Shipment), group)
+
+            by_status = {}
+            for shipment_id, status in targets.items():
+                by_status.setdefault(status, []).append(shipment_id)
+            moved = {status: transition_many(ids, status, now=now) for status, ids in by_status.items()}
+            for shipment_id, truck_id, _ in arrivals:
+                queue_event(shipment_id, 'truck_arrived', truck_id=truck_id, at=now)
+            fulfilled, _ = roll_up_orders(shipment_ids=moved.get('delivered', []), now=now)
+            db.session.commit()
+            logger.info(f"Applied {sum(1 for ok, _, _ in results if ok)} UPS events to {len(changes)} shipments; "
+                        f"{fulfilled} orders fulfilled")
+            return results, arrivals
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error applying UPS event batch: {str(e)}")
+            return [(False, 3000, str(e)) for _ in events], []
+
     # Get shipment status
     def get_shipment_status(self, shipment_id):
         try:
@@ -322,13 +448,12 @@ class ShipmentService:
                 success, result = self.world_simulator.query_package(shipment_id)
 
                 if success:
-                    valid_statuses = ['packing', 'packed', 'loading', 'loaded', 'delivering', 'delivered']
-                    if result in valid_statuses:
+                    if result in RANK:
                         logger.info(f"Live query successful for shipment {shipment_id}. Simulator status: '{result}'. Updating DB.")
-                        shipment.status = result
-                        shipment.updated_at = datetime.now(timezone.utc)
+                        # Forward only: a stale reply never undoes a newer event
+                        transition(shipment_id, result)
                         db.session.commit()
-                        return True, result
+                        return True, current_status(shipment_id)
                     else:
                         # logger.warning(f"Live query for shipment {shipment_id} returned non-status result: '{result}'. DB not updated.")
                         # return False, f"Query succeeded but returned invalid status: {result}"
@@ -0,0 +1,84 @@
+"""
+Shipment status transitions as compare-and-set UPDATEs.
+
+A shipment only moves forward through STATES. Every transition is one
+statement:
+
+    UPDATE shipments SET status = :to, updated_at = :now, ...
+    WHERE <criteria> AND status IN (:allowed_from)
+    RETURNING shipment_id
+
+so handlers never read the row first, two handlers racing on the same
+shipment cannot overwrite each other, and a late or duplicate event is a
+no-op instead of a regression. The ids returned are the shipments that
+actually moved; everything else was already at or past the target (or does
+not exist). updated_at is stamped in the same statement and is the
+transition time; the same time goes into the shipment_events log for each
+shipment that moved (written once the caller commits).
+
+Nothing here commits; the caller owns the transaction.
+"""
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import update
+from app.model import db, Shipment
+from app.services.shipment_events import queue_event
+
+logger = logging.getLogger(__name__)
+
+STATES = ('packing', 'packed', 'loading', 'loaded', 'delivering', 'delivered')
+RANK = {state: rank for rank, state in enumerate(STATES)}
+
+
+def allowed_from(to):
+    """States a shipment may move to `to` from: every earlier state."""
+    if to not in RANK:
+        raise ValueError(f"Unknown shipment status {to!r}")
+    return STATES[:RANK[to]]
+
+
+def is_forward(current, to):
+    return RANK.get(to, -1) > RANK.get(current, len(STATES))
+
+
+def transition_where(to, *criteria, from_states=None, now=None, **values):
+    """
+    Move every shipment matching `criteria` whose status is in `from_states`
+    (default: any earlier state) to `to`, setting `values` alongside.
+    Returns the ids that moved.
+    """
+    from_states = allowed_from(to) if from_states is None else tuple(from_states)
+    if not from_states:
+        return []
+    now = now or datetime.now(timezone.utc)
+    rows = db.session.execute(
+        update(Shipment)
+        .where(*criteria, Shipment.status.in_(from_states))
+        .values(status=to, updated_at=now, **values)
+        .returning(Shipment.shipment_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    moved = [shipment_id for (shipment_id,) in rows]
+    if moved:
+        queue_event(moved, to, truck_id=values.get('truck_id'), at=now)
+    logger.debug("Transitioned %d shipments to %s", len(moved), to)
+    return moved
+
+
+def transition_many(shipment_ids, to, from_states=None, now=None, **values):
+    """Batch transition by id. Returns the ids that moved."""
+    shipment_ids = list({int(shipment_id) for shipment_id in shipment_ids})
+    if not shipment_ids:
+        return []
+    return transition_where(to, Shipment.shipment_id.in_(shipment_ids), from_states=from_states, now=now, **values)
+
+
+def transition(shipment_id, to, from_states=None, now=None, **values):
+    """Single-shipment transition. Returns True if it moved."""
+    return bool(transition_where(to, Shipment.shipment_id == int(shipment_id),
+                                 from_states=from_states, now=now, **values))
+
+
+def current_status(shipment_id):
+    """Status after a transition did not apply (None if the shipment does not exist)."""
+    return db.session.query(Shipment.status).filter(Shipment.shipment_id == int(shipment_id)).scalar()
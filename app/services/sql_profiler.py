@@ -0,0 +1,288 @@
+"""
+Per-endpoint SQL profile and slow-query recorder.
+
+While enabled, every statement the app's engines run is timed and folded
+into two tables:
+- per endpoint: requests, statements, DB time, and the most statements seen
+  in a single request (an N+1 loop shows up as a large max);
+- per endpoint and fingerprint: count, DB time and the slowest run.
+
+A fingerprint is the statement with literals and bind parameters replaced
+by `?` and IN lists collapsed. Statements outside a request (the world
+receiver, batchers, CLI commands) are filed under BACKGROUND.
+
+Statements slower than `slow_threshold` seconds are kept, with their
+parameters, in a bounded list. Their EXPLAIN plans are fetched when the
+report asks for them, on a separate raw connection, so nothing extra runs
+inside the request's transaction.
+
+Bind parameters carry user data (emails, addresses, balances), so they
+stay in memory for EXPLAIN only: unless `show_parameters` is set, the
+report shows slow statements as fingerprints, with no parameters and with
+string literals in the plans replaced by `?`.
+
+Statements are timed by the shared hook in app.utils.metrics; the
+profiler's observer is added on the first enable() and stays. While
+disabled it returns after one attribute check. The profile covers only
+this process.
+"""
+import logging
+import re
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from flask import request
+from app.utils.metrics import time_statements
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND = '(background)'
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|(?<![:\w]):\w+|\$\d+|%s'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\bIN \((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'VALUES \([^()]*\)(?:\s*,\s*\([^()]*\))+', re.IGNORECASE), 'VALUES (...), ...'),
+]
+_STRING_LITERAL = _FINGERPRINT_RULES[0][0]
+_EXPLAIN_PREFIX = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN ', 'mysql': 'EXPLAIN '}
+_EXPLAINABLE = ('select', 'with', 'update', 'delete')
+
+
+def fingerprint(statement):
+    """The statement with literals and parameters replaced by `?`, IN lists and VALUES rows collapsed."""
+    text = statement.strip()
+    for pattern, replacement in _FINGERPRINT_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class _RequestProfile:
+    __slots__ = ('endpoint', 'statements')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.statements = 0
+
+
+# The profile of the request this context is serving; None outside a request
+_current_request = ContextVar('sql_profiler_request', default=None)
+
+
+class SQLProfiler:
+    def __init__(self, app, enabled=False, slow_threshold=0.1, max_slow=100, max_fingerprints=2000,
+                 show_parameters=False):
+        self.app = app
+        self.enabled = False
+        self.slow_threshold = slow_threshold
+        self.show_parameters = show_parameters
+        self.max_fingerprints = max_fingerprints
+        self.lock = threading.Lock()
+        # endpoint -> [requests, statements, seconds, max statements in one request]
+        self.endpoints = {}
+        # (endpoint, fingerprint) -> [count, seconds, max seconds]
+        self.queries = {}
+        self.slow = deque(maxlen=max_slow)
+        # statement text -> fingerprint; SQLAlchemy's compiled cache hands us the same strings over and over
+        self._fingerprints = {}
+        self.enabled_at = None
+        self._engines = []
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+        if enabled:
+            self.enable()
+
+    def enable(self):
+        with self.lock:
+            if not self._engines:
+                from app.model import db
+                with self.app.app_context():
+                    self._engines = list(db.engines.values())
+                for engine in self._engines:
+                    time_statements(engine, self._observe_statement)
+            if not self.enabled:
+                self.enabled_at = datetime.utcnow()
+            self.enabled = True
+        logger.info("SQL profiler enabled (slow threshold %.0f ms)", self.slow_threshold * 1e3)
+
+    def disable(self):
+        self.enabled = False
+        logger.info("SQL profiler disabled")
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+            self.queries = {}
+            self.slow.clear()
+            self.enabled_at = datetime.utcnow() if self.enabled else None
+
+    def _start_request(self):
+        if self.enabled:
+            _current_request.set(_RequestProfile(request.endpoint or 'unmatched'))
+
+    def _finish_request(self, exc):
+        profile = _current_request.get()
+        if profile is None:
+            return
+        _current_request.set(None)
+        with self.lock:
+            totals = self.endpoints.get(profile.endpoint)
+            if totals is None:
+                totals = self.endpoints[profile.endpoint] = [0, 0, 0.0, 0]
+            totals[0] += 1
+            if profile.statements > totals[3]:
+                totals[3] = profile.statements
+
+    def _observe_statement(self, conn, statement, parameters, executemany, elapsed):
+        if not self.enabled:
+            return
+
+        profile = _current_request.get()
+        if profile is not None:
+            profile.statements += 1
+            endpoint = profile.endpoint
+        else:
+            endpoint = BACKGROUND
+
+        shape = self._fingerprints.get(statement)
+        if shape is None:
+            shape = fingerprint(statement)
+            if len(self._fingerprints) >= self.max_fingerprints:
+                self._fingerprints.clear()
+            self._fingerprints[statement] = shape
+
+        with self.lock:
+            totals = self.endpoints.get(endpoint)
+            if totals is None:
+                totals = self.endpoints[endpoint] = [0, 0, 0.0, 0]
+            totals[1] += 1
+            totals[2] += elapsed
+            query = self.queries.get((endpoint, shape))
+            if query is None:
+                query = self.queries[(endpoint, shape)] = [0, 0.0, 0.0]
+            query[0] += 1
+            query[1] += elapsed
+            if elapsed > query[2]:
+                query[2] = elapsed
+
+        if elapsed >= self.slow_threshold:
+            self.slow.append({
+                'at': datetime.utcnow(),
+                'endpoint': endpoint,
+                'seconds': elapsed,
+                'fingerprint': shape,
+                'statement': statement,
+                'parameters': None if executemany else parameters,
+                'executemany': executemany,
+                'dialect': conn.dialect.name,
+                'plan': None
+            })
+            logger.warning("Slow SQL (%.1f ms) in %s: %s", elapsed * 1e3, endpoint, shape[:200])
+
+    def explain(self, entry):
+        """EXPLAIN plan lines for a recorded slow query; cached on the entry."""
+        if entry['plan'] is not None:
+            return entry['plan']
+        prefix = _EXPLAIN_PREFIX.get(entry['dialect'])
+        if entry['executemany'] or prefix is None:
+            entry['plan'] = []
+            return entry['plan']
+        if not entry['statement'].lstrip().lower().startswith(_EXPLAINABLE):
+            entry['plan'] = []
+            return entry['plan']
+        # A raw DBAPI connection of its own: no listeners, and the request's transaction is untouched
+        raw = self._engines[0].raw_connection()
+        try:
+            cursor = raw.cursor()
+            try:
+                if entry['parameters']:
+                    cursor.execute(prefix + entry['statement'], entry['parameters'])
+                else:
+                    cursor.execute(prefix + entry['statement'])
+                entry['plan'] = [' | '.join(str(column) for column in row) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as e:
+            logger.info(f"Could not explain slow query: {e}")
+            entry['plan'] = [f'EXPLAIN failed: {e}']
+        finally:
+            raw.close()
+        return entry['plan']
+
+    def report(self, top=20, explain=True):
+        """Endpoints by DB time, the costliest fingerprints overall and per endpoint, and the slow queries."""
+        with self.lock:
+            endpoints = {name: list(totals) for name, totals in self.endpoints.items()}
+            queries = {key: list(totals) for key, totals in self.queries.items()}
+            slow = list(self.slow)
+
+        per_endpoint = {}
+        for (endpoint, shape), (count, seconds, slowest) in queries.items():
+            per_endpoint.setdefault(endpoint, []).append({
+                'fingerprint': shape,
+                'count': count,
+                'seconds': seconds,
+                'avg_ms': seconds / count * 1e3,
+                'max_ms': slowest * 1e3
+            })
+
+        endpoint_rows = []
+        for endpoint, (requests, statements, seconds, most) in endpoints.items():
+            fingerprints = sorted(per_endpoint.get(endpoint, []), key=lambda row: row['seconds'], reverse=True)
+            endpoint_rows.append({
+                'endpoint': endpoint,
+                'requests': requests,
+                'statements': statements,
+                'seconds': seconds,
+                'statements_per_request': statements / requests if requests else None,
+                'ms_per_request': seconds / requests * 1e3 if requests else None,
+                'max_statements_per_request': most,
+                'fingerprints': fingerprints[:top]
+            })
+        endpoint_rows.sort(key=lambda row: row['seconds'], reverse=True)
+
+        overall = {}
+        for rows in per_endpoint.values():
+            for row in rows:
+                merged = overall.setdefault(row['fingerprint'], {'fingerprint': row['fingerprint'], 'count': 0,
+                                                                 'seconds': 0.0, 'max_ms': 0.0, 'endpoints': 0})
+                merged['count'] += row['count']
+                merged['seconds'] += row['seconds']
+                merged['max_ms'] = max(merged['max_ms'], row['max_ms'])
+                merged['endpoints'] += 1
+        overall_rows = sorted(overall.values(), key=lambda row: row['seconds'], reverse=True)[:top]
+        for row in overall_rows:
+            row['avg_ms'] = row['seconds'] / row['count'] * 1e3
+
+        slow_rows = []
+        for entry in reversed(slow):
+            plan = self.explain(entry) if explain else entry['plan']
+            if self.show_parameters:
+                statement, parameters = entry['statement'], repr(entry['parameters'])[:500]
+            else:
+                statement, parameters = entry['fingerprint'], None
+                plan = [_STRING_LITERAL.sub('?', line) for line in plan] if plan else plan
+            slow_rows.append({
+                'at': entry['at'],
+                'endpoint': entry['endpoint'],
+                'ms': entry['seconds'] * 1e3,
+                'fingerprint': entry['fingerprint'],
+                'statement': statement,
+                'parameters': parameters,
+                'plan': plan
+            })
+
+        return {
+            'enabled': self.enabled,
+            'enabled_at': self.enabled_at,
+            'slow_threshold_ms': self.slow_threshold * 1e3,
+            'show_parameters': self.show_parameters,
+            'statements': sum(row['statements'] for row in endpoint_rows),
+            'seconds': sum(row['seconds'] for row in endpoint_rows),
+            'endpoints': endpoint_rows,
+            'fingerprints': overall_rows,
+            'slow': slow_rows
+        }
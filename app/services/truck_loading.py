@@ -0,0 +1,91 @@
+import logging
+from flask import current_app
+from app.model import db, Shipment
+from app.services.shipment_events import queue_event
+from app.services.shipment_transitions import transition_many, transition_where
+from app.services.world_simulator_service import warn_on_failure
+
+logger = logging.getLogger(__name__)
+
+
+class TruckLoadingCoordinator:
+    """
+    Loads everything that is ready for an arrived truck as one batch.
+
+    The packed shipments of the warehouse are claimed for the truck with
+    one compare-and-set UPDATE (a second arrival cannot claim them too),
+    then all of them go to the world in a single ACommands through
+    load_shipments. The returned TruckLoad completes as acks and ALoaded
+    responses come in; the ALoaded of one world response are applied in
+    one transaction (WorldEventHandler 'packages_loaded').
+
+    If the command cannot be sent at all, the claimed shipments are put
+    back to packed so the next truck picks them up. So are the shipments
+    of a sent load that the world rejects or that time out.
+    """
+
+    def __init__(self, world_simulator):
+        self.world = world_simulator
+
+    def claim(self, truck_id, warehouse_id):
+        """Move the warehouse's packed shipments to loading on this truck. Returns their ids (committed)."""
+        shipment_ids = transition_where('loading', Shipment.warehouse_id == warehouse_id,
+                                        from_states=('packed',), truck_id=truck_id)
+        queue_event(shipment_ids, 'truck_arrived', truck_id=truck_id)
+        db.session.commit()
+        return shipment_ids
+
+    def release(self, shipment_ids):
+        """Undo a claim whose load was never sent."""
+        released = transition_many(shipment_ids, 'packed', from_states=('loading',), truck_id=None)
+        db.session.commit()
+        return released
+
+    def load_truck(self, truck_id, warehouse_id):
+        """
+        Claim and load. Returns (success, result): result is the TruckLoad
+        (or the gateway's summary dict), None when nothing was packed, or
+        an error message.
+        """
+        shipment_ids = self.claim(truck_id, warehouse_id)
+        if not shipment_ids:
+            logger.info(f"No packed shipments found at warehouse {warehouse_id} for truck {truck_id}")
+            return True, None
+
+        if not hasattr(self.world, 'load_shipments'):
+            # A world client without batch loads: one command per shipment, still without waiting on acks
+            for shipment_id in shipment_ids:
+                warn_on_failure(self.world.load_shipment_async(warehouse_id=warehouse_id, truck_id=truck_id,
+                                                               shipment_id=shipment_id),
+                                f"Loading shipment {shipment_id}")
+            return True, {'shipment_ids': shipment_ids}
+
+        success, result = self.world.load_shipments(warehouse_id, truck_id, shipment_ids)
+        if not success:
+            released = self.release(shipment_ids)
+            logger.error(f"Could not load truck {truck_id} at warehouse {warehouse_id}: {result}; "
+                         f"released {len(released)} shipments")
+            return False, result
+
+        if hasattr(result, 'add_done_callback'):
+            # Runs on the receiver or timeout thread, outside any app context
+            app = current_app._get_current_object()
+            result.add_done_callback(lambda load: self._report(app, load))
+        return True, result
+
+    def _report(self, app, load):
+        summary = load.summary()
+        if summary['failed']:
+            with app.app_context():
+                try:
+                    released = self.release(summary['failed'])
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Could not release failed loads of truck {summary['truck_id']}: {e}")
+                    released = []
+            logger.warning(f"Truck {summary['truck_id']} at warehouse {summary['warehouse_id']}: "
+                           f"{summary['loaded']}/{summary['shipments']} shipments loaded in {summary['elapsed_ms']} ms, "
+                           f"failed: {summary['failed']}; released {len(released)} shipments")
+        else:
+            logger.info(f"Truck {summary['truck_id']} at warehouse {summary['warehouse_id']}: all "
+                        f"{summary['shipments']} shipments loaded in {summary['elapsed_ms']} ms")
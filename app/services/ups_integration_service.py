@@ -2,17 +2,24 @@ from pyexpat.errors import messages
 
 import requests
 import json
+import time
 import logging
 from datetime import datetime
-from flask import current_app
+from flask import current_app, has_app_context
 from app.model import db, UPSMessage, Shipment, Order
 
 import json 
 from app.model import db, UPSMessage 
 from datetime import datetime 
 
+from app.utils.metrics import histogram
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_UPS_URL = 'http://host.docker.internal:8081/api'
+
+UPS_REQUEST_SECONDS = histogram('ups_request_seconds', 'UPS HTTP call duration', ('message_type', 'outcome'))
+
 uri_map = {
     'ShipmentCreated': 'shipment',
     'ShipmentLoaded': 'shipment_loaded',
@@ -22,8 +29,10 @@ uri_map = {
 }
 
 class UPSIntegrationService:
-    def __init__(self, ups_url='http://host.docker.internal:8081/api'):
-        self.ups_url = ups_url
+    def __init__(self, ups_url=None):
+        if ups_url is None:
+            ups_url = current_app.config.get('UPS_URL', DEFAULT_UPS_URL) if has_app_context() else DEFAULT_UPS_URL
+        self.ups_url = ups_url.rstrip('/')
         self.session = requests.Session()
 
 # In app/services/ups_integration_service.py
@@ -162,11 +171,17 @@ class UPSIntegrationService:
         try:
             endpoint = f"{self.ups_url}/{uri_map.get(message_type)}"
             logger.info(f"Sending message to UPS: {message_content} to {endpoint}")
-            response = self.session.post(
-                endpoint,
-                json=message_content,
-                timeout=10  # Increased timeout for blocking calls
-            )
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                response = self.session.post(
+                    endpoint,
+                    json=message_content,
+                    timeout=10  # Increased timeout for blocking calls
+                )
+                outcome = 'ok' if response.status_code == 200 else 'http_error'
+            finally:
+                UPS_REQUEST_SECONDS.labels(message_type, outcome).observe(time.perf_counter() - started)
 
             if response.status_code == 200:
                 return True, response.json()
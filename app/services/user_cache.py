@@ -0,0 +1,129 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event
+from app.model import db, User
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FIELDS = (
+    'user_id', 'email', 'first_name', 'last_name', 'address',
+    'current_balance', 'is_seller', 'created_at', 'updated_at'
+)
+
+
+class UserSnapshot(UserMixin):
+    """Detached, read-only copy of an account row used as Flask-Login's current_user."""
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, **fields):
+        for name in SNAPSHOT_FIELDS:
+            object.__setattr__(self, name, fields.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"UserSnapshot is read-only (tried to set '{name}')")
+
+    def get_id(self):
+        return str(self.user_id)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.user_id} {self.email}>'
+
+
+class UserIdentityCache:
+    """Short-TTL LRU of UserSnapshot objects keyed by user_id."""
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # user_id -> (expires_at, snapshot)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, user_id):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, snapshot = entry
+            if expires_at < now:
+                del self.entries[user_id]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return snapshot
+
+    def put(self, snapshot):
+        if not self.enabled or snapshot is None:
+            return
+        with self.lock:
+            self.entries[snapshot.user_id] = (time.monotonic() + self.ttl, snapshot)
+            self.entries.move_to_end(snapshot.user_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def load(self, user_id):
+        snapshot = self.get(user_id)
+        if snapshot is not None:
+            return snapshot
+
+        columns = [getattr(User, name) for name in SNAPSHOT_FIELDS]
+        row = db.session.query(*columns).filter(User.user_id == user_id).first()
+        if row is None:
+            return None
+
+        snapshot = UserSnapshot(**row._asdict())
+        self.put(snapshot)
+        return snapshot
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached snapshot; safe to call outside an app context."""
+    try:
+        user_cache = current_app.config.get('USER_IDENTITY_CACHE')
+    except RuntimeError:
+        return
+    if user_cache:
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_on_user_update(mapper, connection, target):
+    # Covers profile edits, seller upgrades and balance changes made through the ORM
+    invalidate_user(target.user_id)
+
+
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_user_delete(mapper, connection, target):
+    invalidate_user(target.user_id)
@@ -0,0 +1,108 @@
+import threading
+import time
+import logging
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app.model import db, Warehouse
+from app.utils.mapping import map_points
+
+logger = logging.getLogger(__name__)
+
+DIRTY_MAP_KEY = 'warehouse_map_dirty'
+
+
+class WarehouseMapCache:
+    """
+    Cached admin map payload: projected markers for active warehouses.
+
+    Built with one query and projected in one vectorized pass. It is
+    dropped when a warehouse is added, changed or removed in this process,
+    and rebuilt at most every `ttl` seconds otherwise. Per-warehouse stock
+    totals come from InventorySnapshot.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.cached = None
+        self.built_at = 0.0
+        self.stale = True
+        self.rebuilds = 0
+
+    def invalidate(self):
+        self.stale = True
+
+    def _fresh(self):
+        return self.cached is not None and not self.stale and time.monotonic() - self.built_at < self.ttl
+
+    def payload(self):
+        """{'markers': [...]}; treat as read-only."""
+        if self._fresh():
+            return self.cached
+        with self.lock:
+            if self._fresh():
+                return self.cached
+            self.stale = False
+            self.cached = build_map_payload()
+            self.built_at = time.monotonic()
+            self.rebuilds += 1
+            logger.debug("Rebuilt warehouse map with %d markers", len(self.cached['markers']))
+            return self.cached
+
+    def stats(self):
+        cached = self.cached
+        return {
+            'markers': len(cached['markers']) if cached else 0,
+            'stale': self.stale,
+            'rebuilds': self.rebuilds,
+            'ttl': self.ttl
+        }
+
+
+def build_map_payload():
+    rows = db.session.query(Warehouse.warehouse_id, Warehouse.x, Warehouse.y, Warehouse.active)\
+                     .filter(Warehouse.active == True).all()
+    markers = map_points(
+        [row.warehouse_id for row in rows],
+        [row.x for row in rows],
+        [row.y for row in rows],
+        active=[bool(row.active) for row in rows]
+    )
+    return {'markers': markers}
+
+
+def _get_map_cache():
+    try:
+        return current_app.config.get('WAREHOUSE_MAP_CACHE')
+    except RuntimeError:
+        return None
+
+
+def _mark_dirty(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[DIRTY_MAP_KEY] = True
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def _on_bulk_delete(delete_context):
+    if delete_context.mapper.class_ is Warehouse:
+        delete_context.session.info[DIRTY_MAP_KEY] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop(DIRTY_MAP_KEY, None):
+        map_cache = _get_map_cache()
+        if map_cache:
+            map_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop(DIRTY_MAP_KEY, None)
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Warehouse, _event_name, _mark_dirty)
@@ -0,0 +1,104 @@
+import threading
+import time
+import logging
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app.model import db, Warehouse
+from app.utils.kdtree import KDTree
+
+logger = logging.getLogger(__name__)
+
+DIRTY_WAREHOUSES_KEY = 'warehouse_router_dirty'
+
+
+class WarehouseRouter:
+    """
+    In-memory spatial index of active warehouses used to route fulfillment.
+
+    The k-d tree is rebuilt lazily on the first query after a warehouse
+    insert/update/delete commits in this process, and at most every `ttl`
+    seconds regardless, which covers changes made by other processes.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.tree = None
+        self.built_at = 0.0
+        self.stale = True
+        self.rebuilds = 0
+
+    def invalidate(self):
+        self.stale = True
+
+    def _index(self):
+        tree = self.tree
+        if tree is not None and not self.stale and time.monotonic() - self.built_at < self.ttl:
+            return tree
+
+        with self.lock:
+            if self.tree is not None and not self.stale and time.monotonic() - self.built_at < self.ttl:
+                return self.tree
+            # Clear the flag first: a commit landing during the rebuild re-marks it
+            self.stale = False
+            rows = db.session.query(Warehouse.warehouse_id, Warehouse.x, Warehouse.y)\
+                             .filter(Warehouse.active == True).all()
+            self.tree = KDTree([row.warehouse_id for row in rows], [(row.x, row.y) for row in rows])
+            self.built_at = time.monotonic()
+            self.rebuilds += 1
+            logger.debug("Rebuilt warehouse index with %d warehouses", len(rows))
+            return self.tree
+
+    def nearest(self, x, y, warehouse_ids=None):
+        """Closest active warehouse to (x, y), optionally restricted to `warehouse_ids`."""
+        tree = self._index()
+        positions = tree.positions_for(warehouse_ids) if warehouse_ids is not None else None
+        warehouse_id, _ = tree.nearest(float(x), float(y), positions)
+        return warehouse_id
+
+    def stats(self):
+        tree = self.tree
+        return {
+            'warehouses': len(tree) if tree is not None else 0,
+            'stale': self.stale,
+            'rebuilds': self.rebuilds,
+            'ttl': self.ttl
+        }
+
+
+def _get_router():
+    try:
+        return current_app.config.get('WAREHOUSE_ROUTER')
+    except RuntimeError:
+        return None
+
+
+def _on_warehouse_write(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[DIRTY_WAREHOUSES_KEY] = True
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def _on_bulk_delete(delete_context):
+    # connect()/disconnect() clear the warehouse table with Query.delete()
+    if delete_context.mapper.class_ is Warehouse:
+        delete_context.session.info[DIRTY_WAREHOUSES_KEY] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _rebuild_after_commit(session):
+    if session.info.pop(DIRTY_WAREHOUSES_KEY, None):
+        router = _get_router()
+        if router:
+            router.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop(DIRTY_WAREHOUSES_KEY, None)
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Warehouse, _event_name, _on_warehouse_write)
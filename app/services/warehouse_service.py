@@ -2,6 +2,7 @@ import logging
 from sqlalchemy.exc import SQLAlchemyError
 from app.model import db, Warehouse, WarehouseProduct, Product
 from app.services.world_simulator_service import WorldSimulatorService
+from app.services.inventory_snapshot import InventorySnapshot
 from datetime import datetime,timezone
 logger = logging.getLogger(__name__)
 from flask import current_app
@@ -40,6 +41,10 @@ class WarehouseService:
     
     #get all warehouses by distance
     def get_nearest_warehouse(self, x, y):
+        router = current_app.config.get('WAREHOUSE_ROUTER')
+        if router:
+            warehouse_id = router.nearest(x, y)
+            return db.session.get(Warehouse, warehouse_id) if warehouse_id is not None else None
         return Warehouse.query.filter_by(active=True).order_by(
             (Warehouse.x - x) * (Warehouse.x - x) + 
             (Warehouse.y - y) * (Warehouse.y - y)
@@ -170,7 +175,43 @@ class WarehouseService:
         except Exception as e:
             logger.error(f"Error requesting product replenishment: {str(e)}")
             return False, str(e)
-    
+
+    # replenish many (warehouse_id, product_id, quantity) lines with one world command
+    def replenish_products(self, items):
+        if not self.world_simulator or not self.world_simulator.connected:
+             logger.warning("WarehouseService: Attempted replenish_products but world_simulator is not connected.")
+             return False, "Not connected to World Simulator"
+        try:
+            items = [(wid, pid, qty) for wid, pid, qty in items if qty and qty > 0]
+            if not items:
+                return False, "Nothing to replenish"
+
+            warehouse_ids = {wid for wid, _, _ in items}
+            known = {row.warehouse_id for row in db.session.query(Warehouse.warehouse_id)
+                                                         .filter(Warehouse.warehouse_id.in_(warehouse_ids))}
+            missing = warehouse_ids - known
+            if missing:
+                return False, f"Warehouse not found: {', '.join(map(str, sorted(missing)))}"
+
+            product_ids = {pid for _, pid, _ in items}
+            names = dict(db.session.query(Product.product_id, Product.product_name)
+                                   .filter(Product.product_id.in_(product_ids)).all())
+            missing = product_ids - names.keys()
+            if missing:
+                return False, f"Product not found: {', '.join(map(str, sorted(missing)))}"
+
+            success, result = self.world_simulator.buy_products(
+                [(wid, pid, names[pid], qty) for wid, pid, qty in items]
+            )
+            if not success:
+                logger.error(f"World sim buy_products failed for {len(items)} lines. Result: {result}")
+                return False, result
+            logger.info(f"Batched replenishment request sent for {len(items)} lines across {len(warehouse_ids)} warehouses")
+            return True, f"Replenishment requested for {len(items)} products"
+        except Exception as e:
+            logger.error(f"Error requesting batched replenishment: {str(e)}")
+            return False, str(e)
+
     # check if a product is available in a warehouse
     def check_product_availability(self, warehouse_id, product_id, quantity_needed):
         warehouse_product = WarehouseProduct.query.filter_by(
@@ -184,22 +225,20 @@ class WarehouseService:
         return warehouse_product.quantity >= quantity_needed
     
     def get_product_inventory(self, product_id):
+        # single join instead of one warehouse lookup per stock row
+        rows = db.session.query(
+            WarehouseProduct.warehouse_id,
+            WarehouseProduct.quantity,
+            Warehouse.x,
+            Warehouse.y
+        ).join(Warehouse, Warehouse.warehouse_id == WarehouseProduct.warehouse_id)\
+         .filter(WarehouseProduct.product_id == product_id).all()
 
-        inventory = WarehouseProduct.query.filter_by(
-            product_id=product_id
-        ).all()
-        
-        result = []
-        for item in inventory:
-            warehouse = Warehouse.query.filter_by(warehouse_id=item.warehouse_id).first()
-            if warehouse:
-                result.append({
-                    'warehouse_id': item.warehouse_id,
-                    'warehouse_location': f"({warehouse.x}, {warehouse.y})",
-                    'quantity': item.quantity
-                })
-        
-        return result
+        return [{
+            'warehouse_id': row.warehouse_id,
+            'warehouse_location': f"({row.x}, {row.y})",
+            'quantity': row.quantity
+        } for row in rows]
     
     def handle_product_arrived(self, warehouse_id, product_id, description, quantity):
         try:
@@ -235,23 +274,41 @@ class WarehouseService:
     
     def get_warehouse_inventory(self, warehouse_id):
         try:
-            inventory = WarehouseProduct.query.filter_by(warehouse_id=warehouse_id).all()
-            
-            inventory_data = []
-            for item in inventory:
-                product = Product.query.filter_by(product_id=item.product_id).first()
-                inventory_data.append({
-                    'product_id': item.product_id,
-                    'product_name': product.product_name if product else 'Unknown Product',
-                    'quantity': item.quantity,
-                    'created_at': item.created_at.isoformat() if item.created_at else None,
-                    'updated_at': item.updated_at.isoformat() if item.updated_at else None
-                })
-            
-            return inventory_data
+            # product names come from the same query instead of one lookup per row
+            rows = db.session.query(
+                WarehouseProduct.product_id,
+                WarehouseProduct.quantity,
+                WarehouseProduct.created_at,
+                WarehouseProduct.updated_at,
+                Product.product_name
+            ).outerjoin(Product, Product.product_id == WarehouseProduct.product_id)\
+             .filter(WarehouseProduct.warehouse_id == warehouse_id).all()
+
+            return [{
+                'product_id': row.product_id,
+                'product_name': row.product_name or 'Unknown Product',
+                'quantity': row.quantity,
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+                'updated_at': row.updated_at.isoformat() if row.updated_at else None
+            } for row in rows]
         except Exception as e:
             logger.error(f"Error getting warehouse inventory: {str(e)}")
             return []
+
+    def get_inventory_summaries(self, counts_only=False):
+        """SKU count, units and low-stock flag per active warehouse, from the snapshot when configured."""
+        snapshot = current_app.config.get('INVENTORY_SNAPSHOT')
+        if snapshot is None:
+            snapshot = InventorySnapshot(low_stock_threshold=current_app.config.get('INVENTORY_LOW_STOCK', 5))
+        if counts_only:
+            return snapshot.product_counts()
+        return snapshot.all()
+
+    def get_inventory_summary(self, warehouse_id):
+        snapshot = current_app.config.get('INVENTORY_SNAPSHOT')
+        if snapshot is None:
+            snapshot = InventorySnapshot(low_stock_threshold=current_app.config.get('INVENTORY_LOW_STOCK', 5))
+        return snapshot.summary(warehouse_id)
         
     def add_product_to_warehouse(self, warehouse_id, product_id, quantity):
         try:
@@ -0,0 +1,195 @@
+"""
+Bounded, prioritized outbound queue for world commands.
+
+Each ACommands is classed by the most urgent thing it carries: acks (and
+control such as simspeed/disconnect) before loads, loads before packs,
+packs before buys, buys before queries. Each class has its own high-water
+mark (0 = unbounded; acks are never refused). When a class is full, put()
+applies the policy:
+
+- block: wait up to `put_timeout` seconds for room, then refuse
+- fail:  refuse at once
+- shed:  drop the oldest queued command of that class to make room
+
+Refusal raises QueueBackpressure. Shed commands are returned by put() so
+the caller can fail whatever was waiting on them. Depth, high-water and
+wait-time gauges per class come from stats().
+
+The interface is the subset of queue.Queue the world service uses
+(put, get, get_nowait, task_done, join, qsize).
+"""
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+CLASSES = ('ack', 'load', 'pack', 'buy', 'query')
+DEFAULT_LIMITS = {'ack': 0, 'load': 2000, 'pack': 2000, 'buy': 1000, 'query': 500}
+POLICIES = ('block', 'fail', 'shed')
+
+
+class QueueBackpressure(Exception):
+    """The world command queue is full for this class of command."""
+
+
+def command_class(command):
+    """Priority class of an ACommands (its most urgent content)."""
+    if command.acks or command.HasField('simspeed') or command.disconnect:
+        return 'ack'
+    if command.load:
+        return 'load'
+    if command.topack:
+        return 'pack'
+    if command.buy:
+        return 'buy'
+    return 'query'
+
+
+def parse_limits(spec):
+    """Accept a dict or a "load=2000,buy=1000" string; unspecified classes keep their defaults."""
+    limits = dict(DEFAULT_LIMITS)
+    if not spec:
+        return limits
+    if isinstance(spec, dict):
+        items = spec.items()
+    else:
+        items = (item.split('=', 1) for item in spec.split(',') if '=' in item)
+    for name, value in items:
+        name = name.strip()
+        if name in limits:
+            limits[name] = max(int(value), 0)
+    limits['ack'] = 0
+    return limits
+
+
+class CommandQueue:
+    def __init__(self, limits=None, policy='block', put_timeout=5.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.limits = parse_limits(limits)
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self.priority = {name: rank for rank, name in enumerate(CLASSES)}
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+        self.all_tasks_done = threading.Condition(self.mutex)
+        self.unfinished_tasks = 0
+        self.heap = []
+        self.counter = itertools.count()
+        # Entries removed by shedding are marked dead and skipped by get()
+        self.dead = set()
+        self.depth = dict.fromkeys(CLASSES, 0)
+        self.gauges = {name: {'enqueued': 0, 'sent': 0, 'rejected': 0, 'shed': 0, 'high_water': 0,
+                              'wait_ms_last': 0.0, 'wait_ms_max': 0.0, 'wait_ms_ewma': 0.0}
+                       for name in CLASSES}
+
+    def _full(self, cls):
+        limit = self.limits[cls]
+        return limit > 0 and self.depth[cls] >= limit
+
+    def _shed_oldest(self, cls):
+        oldest = min((entry for entry in self.heap if entry[3] == cls and entry[1] not in self.dead),
+                     key=lambda entry: entry[1], default=None)
+        if oldest is None:
+            return None
+        self.dead.add(oldest[1])
+        self.depth[cls] -= 1
+        self.unfinished_tasks -= 1
+        self.gauges[cls]['shed'] += 1
+        return oldest[4]
+
+    def put(self, command, block=None, timeout=None):
+        """Queue a command; returns the list of commands shed to make room. Raises QueueBackpressure."""
+        cls = command_class(command)
+        shed = []
+        with self.not_full:
+            if self._full(cls):
+                policy = self.policy if block is None else ('block' if block else 'fail')
+                if policy == 'shed':
+                    dropped = self._shed_oldest(cls)
+                    if dropped is not None:
+                        shed.append(dropped)
+                elif policy == 'block':
+                    deadline = time.monotonic() + (self.put_timeout if timeout is None else timeout)
+                    while self._full(cls):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.not_full.wait(remaining)
+                if self._full(cls):
+                    self.gauges[cls]['rejected'] += 1
+                    raise QueueBackpressure(f"World command queue full for {cls} "
+                                            f"({self.depth[cls]}/{self.limits[cls]} queued)")
+
+            heapq.heappush(self.heap, (self.priority[cls], next(self.counter), time.monotonic(), cls, command))
+            self.depth[cls] += 1
+            self.unfinished_tasks += 1
+            gauge = self.gauges[cls]
+            gauge['enqueued'] += 1
+            gauge['high_water'] = max(gauge['high_water'], self.depth[cls])
+            self.not_empty.notify()
+        return shed
+
+    def _pop(self):
+        while self.heap:
+            _, order, queued_at, cls, command = heapq.heappop(self.heap)
+            if order in self.dead:
+                self.dead.discard(order)
+                continue
+            self.depth[cls] -= 1
+            gauge = self.gauges[cls]
+            wait_ms = (time.monotonic() - queued_at) * 1e3
+            gauge['sent'] += 1
+            gauge['wait_ms_last'] = wait_ms
+            gauge['wait_ms_max'] = max(gauge['wait_ms_max'], wait_ms)
+            gauge['wait_ms_ewma'] += (wait_ms - gauge['wait_ms_ewma']) * 0.1
+            self.not_full.notify_all()
+            return command
+        return None
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                command = self._pop()
+                if command is not None:
+                    return command
+                if not block:
+                    raise queue.Empty
+                if deadline is None:
+                    self.not_empty.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        with self.all_tasks_done:
+            self.unfinished_tasks -= 1
+            if self.unfinished_tasks <= 0:
+                self.unfinished_tasks = 0
+                self.all_tasks_done.notify_all()
+
+    def join(self):
+        with self.all_tasks_done:
+            while self.unfinished_tasks:
+                self.all_tasks_done.wait()
+
+    def qsize(self):
+        with self.mutex:
+            return sum(self.depth.values())
+
+    def stats(self):
+        with self.mutex:
+            return {
+                'policy': self.policy,
+                'depth': sum(self.depth.values()),
+                'classes': {name: dict(self.gauges[name], depth=self.depth[name], limit=self.limits[name])
+                            for name in CLASSES}
+            }
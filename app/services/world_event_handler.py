@@ -1,12 +1,19 @@
 import threading
+import time
 import logging
 from app.services.warehouse_service import WarehouseService
 from app.services.shipment_service import ShipmentService
+from app.services.world_simulator_service import warn_on_failure
+from app.services.shipment_transitions import current_status, transition
 from flask import current_app
-from datetime import datetime, timezone
-from app import db
+from app.model import db
+from app.utils.metrics import counter, histogram
 logger = logging.getLogger(__name__)
-from app.model import Shipment
+
+WORLD_EVENTS = counter('world_events_total', 'World events handled', ('event', 'outcome'))
+WORLD_EVENT_SECONDS = histogram('world_event_seconds', 'World event handling time', ('event',))
+
+
 class WorldEventHandler:
     def __init__(self,app=None):
         self.app = app
@@ -15,6 +22,14 @@ class WorldEventHandler:
 
     # Handle world events    
     def handle_world_event(self, event_type, event_data):
+        started = time.perf_counter()
+        result = self._handle_world_event(event_type, event_data)
+        WORLD_EVENT_SECONDS.labels(event_type).observe(time.perf_counter() - started)
+        succeeded = result[0] if isinstance(result, tuple) else bool(result)
+        WORLD_EVENTS.labels(event_type, 'ok' if succeeded else 'failed').inc()
+        return result
+
+    def _handle_world_event(self, event_type, event_data):
         with current_app.app_context():
             try:
                 if event_type == 'product_arrived':
@@ -23,6 +38,8 @@ class WorldEventHandler:
                     return self.handle_package_ready(event_data)
                 elif event_type == 'package_loaded':
                     return self.handle_package_loaded(event_data)
+                elif event_type == 'packages_loaded':
+                    return self.handle_packages_loaded(event_data)
                 else:
                     logger.warning(f"Unknown event type: {event_type}")
                     return False, f"Unknown event type: {event_type}"
@@ -65,14 +82,13 @@ class WorldEventHandler:
                     logger.info(f"Processing package ready event: {event_data}")
                     logger.info(f"Shipment {shipment_id} is waiting for truck {truck_id} at warehouse {warehouse_id}")
                     
-                    shipment = Shipment.query.filter_by(shipment_id=shipment_id).first()
-                    if shipment:
-                        shipment.status = 'loading'
-                        shipment.truck_id = truck_id
-                        shipment.updated_at = datetime.now(timezone.utc)
-                        db.session.commit()
+                    # Through packed, so the pack stage is recorded for truck-first shipments too
+                    transition(shipment_id, 'packed', from_states=('packing',))
+                    moved = transition(shipment_id, 'loading', from_states=('packed',), truck_id=truck_id)
+                    db.session.commit()
+                    if moved:
                         logger.info(f"Updated shipment {shipment_id} status to 'loading'")
-                    else:
+                    elif current_status(shipment_id) is None:
                         logger.warning(f"Shipment {shipment_id} not found in database")
                 except Exception as e:
                     logger.error(f"Error updating shipment status: {e}")
@@ -82,13 +98,15 @@ class WorldEventHandler:
                     world_simulator_service = current_app.config.get('WORLD_SIMULATOR_SERVICE')
                     logger.info(f"Loading shipment {shipment_id} onto truck {truck_id} at warehouse {warehouse_id}")
                     
-                    load_success = world_simulator_service.load_shipment(
+                    # This runs on the receiver thread, so the ack cannot arrive while we block on it
+                    future = warn_on_failure(world_simulator_service.load_shipment_async(
                         shipment_id=shipment_id,
                         truck_id=truck_id,
                         warehouse_id=warehouse_id
-                    )
-                    
-                    if load_success:
+                    ), f"Loading shipment {shipment_id}")
+                    future.add_done_callback(lambda f: world_simulator_service._release_failed_load(f, shipment_id))
+
+                    if not (future.done() and future.exception()):
                         del waiting_products[shipment_id]
                         current_app.config['WAITING_PRODUCTS'] = waiting_products
                     
@@ -106,4 +124,10 @@ class WorldEventHandler:
             return False, "Missing required fields"
         
         # Use shipment service to handle the package being loaded
-        return self.shipment_service.handle_package_loaded(shipment_id, truck_id)
\ No newline at end of file
+        return self.shipment_service.handle_package_loaded(shipment_id, truck_id)
+
+    def handle_packages_loaded(self, event_data):
+        shipment_ids = event_data.get('shipment_ids')
+        if not shipment_ids:
+            return False, "Missing required fields"
+        return self.shipment_service.handle_packages_loaded(shipment_ids)
\ No newline at end of file
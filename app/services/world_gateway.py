@@ -0,0 +1,363 @@
+"""
+World gateway: runs the single WorldSimulatorService (socket, sender and
+receiver threads) in its own process and exposes it over a small local HTTP
+API, so any number of web workers can share one world connection.
+
+Web workers talk to it through WorldGatewayClient, which mirrors the parts of
+the WorldSimulatorService interface the controllers and services use.
+
+Every call must carry WORLD_GATEWAY_TOKEN in the X-World-Gateway-Token
+header. Without a token the gateway only serves on a loopback address. It
+runs under gunicorn as one worker process with threads: the world socket
+cannot be shared between processes.
+"""
+import hmac
+import time
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import Blueprint, request, jsonify, current_app
+from app.model import Warehouse
+from app.services.world_simulator_service import WorldRequestError
+
+logger = logging.getLogger(__name__)
+
+world_gateway_bp = Blueprint('world_gateway', __name__, url_prefix='/gateway')
+
+TOKEN_HEADER = 'X-World-Gateway-Token'
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+def _world_service():
+    return current_app.config.get('WORLD_SIMULATOR_SERVICE')
+
+
+def _result(success, result, status=200):
+    return jsonify({'success': success, 'result': result}), status
+
+
+@world_gateway_bp.before_request
+def _check_token():
+    token = current_app.config.get('WORLD_GATEWAY_TOKEN')
+    if not token:
+        return None
+    if not hmac.compare_digest(request.headers.get(TOKEN_HEADER, ''), token):
+        logger.warning(f"Rejected world gateway call to {request.path} from {request.remote_addr}")
+        return _result(False, 'Invalid or missing gateway token', 401)
+    return None
+
+
+@world_gateway_bp.route('/status', methods=['GET'])
+def gateway_status():
+    world_service = _world_service()
+    return jsonify({
+        'connected': bool(world_service and world_service.connected),
+        'world_id': world_service.world_id if world_service else None,
+        'connection': world_service.connection_stats() if world_service else None
+    })
+
+
+@world_gateway_bp.route('/connect', methods=['POST'])
+def gateway_connect():
+    data = request.get_json() or {}
+    warehouse_ids = data.get('warehouse_ids') or []
+    init_warehouses = []
+    if warehouse_ids:
+        init_warehouses = Warehouse.query.filter(Warehouse.warehouse_id.in_(warehouse_ids)).all()
+
+    world_id, result = _world_service().connect(world_id=data.get('world_id'), init_warehouses=init_warehouses)
+    return jsonify({'world_id': world_id, 'result': result})
+
+
+@world_gateway_bp.route('/disconnect', methods=['POST'])
+def gateway_disconnect():
+    _world_service().disconnect()
+    return _result(True, 'disconnected')
+
+
+@world_gateway_bp.route('/buy', methods=['POST'])
+def gateway_buy():
+    data = request.get_json() or {}
+    success, result = _world_service().buy_product(
+        warehouse_id=data['warehouse_id'],
+        product_id=data['product_id'],
+        description=data['description'],
+        quantity=data['quantity']
+    )
+    return _result(success, result)
+
+
+@world_gateway_bp.route('/buy-batch', methods=['POST'])
+def gateway_buy_batch():
+    data = request.get_json() or {}
+    success, result = _world_service().buy_products(data['items'])
+    if success:
+        # The purchase handle stays in the gateway; callers get what it tracks
+        result = {'seqnums': result.seqnums, 'units': result.outstanding_units()}
+    return _result(success, result)
+
+
+@world_gateway_bp.route('/pack', methods=['POST'])
+def gateway_pack():
+    data = request.get_json() or {}
+    batcher = current_app.config.get('PACK_BATCHER')
+    if batcher is None:
+        success, result = _world_service().pack_shipment(
+            warehouse_id=data['warehouse_id'],
+            shipment_id=data['shipment_id'],
+            items=data['items']
+        )
+        return _result(success, result)
+    # Packs from all web workers share the batcher, so a burst leaves as one command per warehouse
+    future = batcher.pack_shipment_async(data['warehouse_id'], data['shipment_id'], data['items'])
+    try:
+        return _result(True, future.result(timeout=10))
+    except FutureTimeout:
+        return _result(False, "Timeout waiting for response")
+    except WorldRequestError as e:
+        return _result(False, str(e))
+
+
+@world_gateway_bp.route('/load', methods=['POST'])
+def gateway_load():
+    data = request.get_json() or {}
+    success, result = _world_service().load_shipment(
+        warehouse_id=data['warehouse_id'],
+        truck_id=data['truck_id'],
+        shipment_id=data['shipment_id']
+    )
+    return _result(success, result)
+
+
+@world_gateway_bp.route('/load-batch', methods=['POST'])
+def gateway_load_batch():
+    data = request.get_json() or {}
+    success, result = _world_service().load_shipments(
+        warehouse_id=data['warehouse_id'],
+        truck_id=data['truck_id'],
+        shipment_ids=data['shipment_ids']
+    )
+    if success:
+        # The TruckLoad stays in the gateway; callers get what it tracks
+        result = {'seqnums': list(result.seqnums), 'shipment_ids': result.shipment_ids}
+    return _result(success, result)
+
+
+@world_gateway_bp.route('/load-when-ready', methods=['POST'])
+def gateway_load_when_ready():
+    data = request.get_json() or {}
+    success, result = _world_service().load_when_ready(
+        shipment_id=data['shipment_id'],
+        truck_id=data['truck_id'],
+        warehouse_id=data['warehouse_id']
+    )
+    return _result(success, result)
+
+
+@world_gateway_bp.route('/query', methods=['POST'])
+def gateway_query():
+    data = request.get_json() or {}
+    success, result = _world_service().query_package(data['package_id'])
+    return _result(success, result)
+
+
+@world_gateway_bp.route('/sim-speed', methods=['POST'])
+def gateway_sim_speed():
+    data = request.get_json() or {}
+    success = _world_service().set_sim_speed(data['speed'])
+    return _result(success, data['speed'])
+
+
+def create_gateway_app():
+    """The app the gateway serves: a normal app that owns the world connection, plus the gateway API."""
+    from app import create_app
+
+    app = create_app()
+    if app.config.get('WORLD_GATEWAY_URL'):
+        raise SystemExit("Unset WORLD_GATEWAY_URL: the gateway process must own the world connection itself.")
+    if not app.config.get('WORLD_GATEWAY_TOKEN') and app.config.get('WORLD_GATEWAY_HOST') not in LOOPBACK_HOSTS:
+        raise SystemExit("Set WORLD_GATEWAY_TOKEN to serve the world gateway on a non-loopback address.")
+    app.register_blueprint(world_gateway_bp)
+    csrf = app.extensions.get('csrf')
+    if csrf:
+        csrf.exempt(world_gateway_bp)
+    return app
+
+
+def serve_world_gateway(host='127.0.0.1', port=8090, threads=16, timeout=60):
+    """Serve the gateway under gunicorn (blocking): one worker, since it owns the world socket, with threads."""
+    from gunicorn.app.base import BaseApplication
+
+    class GatewayServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', 1)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', threads)
+            # Pack and load calls wait up to their own timeouts for the world
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('graceful_timeout', 30)
+
+        def load(self):
+            # Built in the worker after the fork, so its threads (log listener, batchers) live there
+            return create_gateway_app()
+
+    logger.info(f"World gateway listening on {host}:{port}")
+    GatewayServer().run()
+
+
+class WorldGatewayClient:
+    """Drop-in stand-in for WorldSimulatorService inside web workers."""
+
+    def __init__(self, base_url, token=None, timeout=15, status_ttl=1.0, max_workers=8):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self.status_ttl = status_ttl
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.local = threading.local()
+        self._status = {'connected': False, 'world_id': None}
+        self._status_expires = 0.0
+        self._status_lock = threading.Lock()
+
+    def _session(self):
+        # requests.Session is not thread-safe; keep one per thread
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            if self.token:
+                session.headers[TOKEN_HEADER] = self.token
+            self.local.session = session
+        return session
+
+    def _post(self, path, payload):
+        try:
+            response = self._session().post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"World gateway call {path} failed: {e}")
+            return {'success': False, 'result': f"World gateway unavailable: {e}"}
+
+    def _call(self, path, payload):
+        data = self._post(path, payload)
+        return data.get('success', False), data.get('result')
+
+    def _call_async(self, method, *args):
+        """Run a blocking (success, result) call on the pool; the Future mirrors WorldSimulatorService's."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='world-gateway')
+
+        def run():
+            success, result = method(*args)
+            if not success:
+                raise WorldRequestError(result)
+            return result
+        return self._executor.submit(run)
+
+    def _refresh_status(self):
+        now = time.monotonic()
+        with self._status_lock:
+            if now < self._status_expires:
+                return self._status
+        try:
+            response = self._session().get(f"{self.base_url}/status", timeout=self.timeout)
+            status = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"World gateway status check failed: {e}")
+            status = {'connected': False, 'world_id': None}
+        with self._status_lock:
+            self._status = status
+            self._status_expires = now + self.status_ttl
+        return status
+
+    def _expire_status(self):
+        with self._status_lock:
+            self._status_expires = 0.0
+
+    @property
+    def connected(self):
+        return bool(self._refresh_status().get('connected'))
+
+    @property
+    def world_id(self):
+        return self._refresh_status().get('world_id')
+
+    def connection_stats(self):
+        self._expire_status()
+        return self._refresh_status().get('connection')
+
+    def connect(self, world_id=None, init_warehouses=None):
+        data = self._post('/connect', {
+            'world_id': world_id,
+            'warehouse_ids': [wh.warehouse_id for wh in (init_warehouses or [])]
+        })
+        self._expire_status()
+        return data.get('world_id'), data.get('result')
+
+    def disconnect(self):
+        self._call('/disconnect', {})
+        self._expire_status()
+
+    def buy_product(self, warehouse_id, product_id, description, quantity):
+        return self._call('/buy', {
+            'warehouse_id': warehouse_id,
+            'product_id': product_id,
+            'description': description,
+            'quantity': quantity
+        })
+
+    def buy_products(self, items):
+        """Returns (success, {'seqnums': [...], 'units': n}); arrivals can't be awaited across processes."""
+        keys = ('warehouse_id', 'product_id', 'description', 'quantity')
+        items = [item if isinstance(item, dict) else dict(zip(keys, item)) for item in items]
+        return self._call('/buy-batch', {'items': items})
+
+    def pack_shipment(self, warehouse_id, shipment_id, items):
+        return self._call('/pack', {
+            'warehouse_id': warehouse_id,
+            'shipment_id': shipment_id,
+            'items': items
+        })
+
+    def load_shipment(self, warehouse_id, truck_id, shipment_id):
+        return self._call('/load', {
+            'warehouse_id': warehouse_id,
+            'truck_id': truck_id,
+            'shipment_id': shipment_id
+        })
+
+    def load_shipments(self, warehouse_id, truck_id, shipment_ids):
+        """Returns (success, {'seqnums': [...], 'shipment_ids': [...]}); loads can't be awaited across processes."""
+        return self._call('/load-batch', {
+            'warehouse_id': warehouse_id,
+            'truck_id': truck_id,
+            'shipment_ids': list(shipment_ids)
+        })
+
+    def load_when_ready(self, shipment_id, truck_id, warehouse_id):
+        return self._call('/load-when-ready', {
+            'shipment_id': shipment_id,
+            'truck_id': truck_id,
+            'warehouse_id': warehouse_id
+        })
+
+    def query_package(self, package_id):
+        return self._call('/query', {'package_id': package_id})
+
+    def pack_shipment_async(self, warehouse_id, shipment_id, items):
+        return self._call_async(self.pack_shipment, warehouse_id, shipment_id, items)
+
+    def load_shipment_async(self, warehouse_id, truck_id, shipment_id):
+        return self._call_async(self.load_shipment, warehouse_id, truck_id, shipment_id)
+
+    def query_package_async(self, package_id):
+        return self._call_async(self.query_package, package_id)
+
+    def set_sim_speed(self, speed):
+        success, _ = self._call('/sim-speed', {'speed': speed})
+        return success
@@ -1,25 +1,217 @@
 import socket
+import functools
 import threading
 import time
 import struct
 import logging
 import queue
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from datetime import datetime
-from google.protobuf.message import Message
+from google.protobuf.message import Message, DecodeError
 from flask import current_app
 import random
-from sqlalchemy import func
+from sqlalchemy import func, insert, select, update
 from app.model import db, User, ProductCategory, Cart, CartProduct,WarehouseProduct
 from app.model import db, WorldMessage, Warehouse
 from google.protobuf.internal.encoder import _VarintBytes
 from google.protobuf.internal.decoder import _DecodeVarint32
 from app.proto import world_amazon_1_pb2 as amazon_pb2
+from app.utils.log_config import LogSampler
+from app.utils.metrics import counter, gauge, histogram
+from app.services.world_command_queue import CommandQueue, QueueBackpressure
 
 
 logger = logging.getLogger(__name__)
+# Per-frame / per-ACK messages: log a sample instead of every one
+sampled_log = LogSampler(logger)
+
+WORLD_FRAMES_SENT = counter('world_frames_sent_total', 'Frames sent to the world')
+WORLD_FRAMES_RECEIVED = counter('world_frames_received_total', 'Frames received from the world')
+WORLD_REQUEST_SECONDS = histogram('world_request_seconds', 'Time from sending a world request to its ack (answer for '
+                                  'queries)', ('kind',))
+WORLD_REQUEST_FAILURES = counter('world_request_failures_total', 'World requests rejected, timed out or dropped',
+                                 ('kind',))
+WORLD_QUEUE_DEPTH = gauge('world_queue_depth', 'Commands waiting in the world command queue', ('class',))
+WORLD_UNACKED = gauge('world_unacked_commands', 'Commands sent to the world and not acked yet')
+WORLD_PENDING_REQUESTS = gauge('world_pending_requests', 'World requests waiting for an ack or answer')
+WORLD_LINK_UP = gauge('world_link_up', '1 while the world connection is up')
+
+# Open purchase handles are dropped after this long even if arrivals never came
+PURCHASE_HANDLE_TTL = 3600
+# Same for truck loads whose ALoaded responses never came
+TRUCK_LOAD_TTL = 3600
+
+
+class PurchaseHandle:
+    """
+    Tracks the arrivals of one buy_products batch.
+
+    `remaining` maps (warehouse_id, product_id) to units still expected;
+    wait() blocks until all of them have arrived or the timeout passes.
+    If the purchase is dropped before it is sent, `error` says why and
+    waiters are released.
+    """
+
+    def __init__(self, seqnums, expected):
+        self.seqnums = list(seqnums)
+        self.expected = dict(expected)
+        self.remaining = dict(expected)
+        self.created_at = time.monotonic()
+        self.event = threading.Event()
+        self.error = None
+        if not self.remaining:
+            self.event.set()
+
+    def _fail(self, reason):
+        self.error = reason
+        self.event.set()
+
+    def _credit(self, key, units):
+        """Apply up to `units` arrived units; returns how many this handle consumed."""
+        wanted = self.remaining.get(key, 0)
+        if wanted <= 0:
+            return 0
+        used = min(wanted, units)
+        if used == wanted:
+            del self.remaining[key]
+        else:
+            self.remaining[key] = wanted - used
+        if not self.remaining:
+            self.event.set()
+        return used
+
+    def done(self):
+        return self.event.is_set()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+    def outstanding_units(self):
+        return sum(self.remaining.values())
+
+
+class TruckLoad:
+    """
+    Tracks one load_shipments batch: every shipment put on one truck.
+
+    A shipment is finished when the world reports it loaded, or failed
+    when its APutOnTruck is rejected, times out or is dropped (`failed`
+    maps it to the reason). wait() blocks until every shipment is
+    finished; callbacks added with add_done_callback run once, then.
+    """
+
+    def __init__(self, truck_id, warehouse_id, seqnums):
+        self.truck_id = truck_id
+        self.warehouse_id = warehouse_id
+        # seqnum -> shipment_id
+        self.seqnums = dict(seqnums)
+        self.shipment_ids = list(self.seqnums.values())
+        self.acked = set()
+        self.loaded = set()
+        self.failed = {}
+        self.created_at = time.monotonic()
+        self.finished_at = None
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.callbacks = []
+
+    def _finish_if_complete(self):
+        # Caller holds self.lock; returns the callbacks to run once it is released
+        if self.event.is_set() or len(self.loaded) + len(self.failed) < len(self.shipment_ids):
+            return []
+        self.finished_at = time.monotonic()
+        self.event.set()
+        callbacks, self.callbacks = self.callbacks, []
+        return callbacks
+
+    def _run(self, callbacks):
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Truck load callback failed: {e}", exc_info=True)
+
+    def _acked(self, shipment_id, future):
+        error = future.exception()
+        with self.lock:
+            if error is None:
+                self.acked.add(shipment_id)
+                return
+            if shipment_id in self.loaded:
+                return
+            self.failed[shipment_id] = str(error)
+            callbacks = self._finish_if_complete()
+        self._run(callbacks)
+
+    def _loaded(self, shipment_id):
+        with self.lock:
+            self.failed.pop(shipment_id, None)
+            self.loaded.add(shipment_id)
+            callbacks = self._finish_if_complete()
+        self._run(callbacks)
+
+    def add_done_callback(self, callback):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        self._run([callback])
+
+    def done(self):
+        return self.event.is_set()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+    def pending(self):
+        with self.lock:
+            return [sid for sid in self.shipment_ids if sid not in self.loaded and sid not in self.failed]
+
+    def summary(self):
+        with self.lock:
+            finished = self.finished_at or time.monotonic()
+            return {
+                'truck_id': self.truck_id,
+                'warehouse_id': self.warehouse_id,
+                'shipments': len(self.shipment_ids),
+                'acked': len(self.acked),
+                'loaded': len(self.loaded),
+                'failed': dict(self.failed),
+                'done': self.event.is_set(),
+                'elapsed_ms': round((finished - self.created_at) * 1e3, 1)
+            }
+
+
+class WorldRequestError(Exception):
+    """A world request failed: the world reported an error, it timed out, or the connection went away."""
+
+
+def warn_on_failure(future, label):
+    """Log a *_async request that fails later, for callers that do not wait on it."""
+    def _done(f):
+        error = f.exception()
+        if error is not None:
+            logger.warning(f"{label} failed: {error}")
+    future.add_done_callback(_done)
+    return future
+
+
+class _PendingRequest:
+    __slots__ = ('future', 'kind', 'key', 'started', 'deadline')
+
+    def __init__(self, future, kind, key, started, deadline):
+        self.future = future
+        self.kind = kind
+        self.key = key
+        self.started = started
+        self.deadline = deadline
+
 
 class WorldSimulatorService:
-    def __init__(self, app=None, host='server', port=23456):
+    def __init__(self, app=None, host='server', port=23456, request_timeout=30,
+                 reconnect_base_delay=0.5, reconnect_max_delay=30, reconnect_max_attempts=0,
+                 queue_limits=None, queue_policy='block', queue_put_timeout=5.0):
         self.app = app
         self.host = host
         self.port = port
@@ -29,10 +221,41 @@ class WorldSimulatorService:
         self.seqnum = 0
         self.lock = threading.Lock()
         # self.acks = set()
-        self.pending_responses = {}
-        self.response_events = {}
-        self.message_queue = queue.Queue()
+        # seqnum -> _PendingRequest; queries are answered by packageid, not seqnum
+        self.requests = {}
+        self.queries = defaultdict(list)
+        self.request_timeout = request_timeout
+        self._next_sweep = 0.0
+        # Bounded and prioritized; see world_command_queue for the backpressure policies
+        self.message_queue = CommandQueue(limits=queue_limits, policy=queue_policy, put_timeout=queue_put_timeout)
         self.running = True
+        self.purchases = []
+        # shipment_id -> TruckLoad it is part of, until its ALoaded arrives
+        self.truck_loads = {}
+        # seqnum -> (ACommands field, sub-command) for everything sent but not yet acked; replayed on reconnect
+        self.unacked = {}
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnect_max_attempts = reconnect_max_attempts
+        self.state = 'disconnected'
+        self._link_up = threading.Event()
+        self._stopping = threading.Event()
+        self.link_stats = {
+            'connects': 0,
+            'disconnects': 0,
+            'reconnects': 0,
+            'failed_attempts': 0,
+            'replayed_commands': 0,
+            'downtime_s': 0.0,
+            'last_error': None,
+            'up_since': None,
+            'down_since': None
+        }
+        # Read at scrape time; the process has one world connection
+        WORLD_QUEUE_DEPTH.set_function(lambda: dict(self.message_queue.depth))
+        WORLD_UNACKED.set_function(lambda: len(self.unacked))
+        WORLD_PENDING_REQUESTS.set_function(lambda: len(self.requests))
+        WORLD_LINK_UP.set_function(lambda: int(self._link_up.is_set()))
         
     #     self._load_last_seqnum()
     
@@ -64,60 +287,42 @@ class WorldSimulatorService:
         
         try:
             self.cleanup_old_world_messages()
-            logger.info(f"Connecting to World Simulator at {self.host}:{self.port}...")
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect(('docker_deploy-server-1', self.port))
-            logger.info("Connected to World Simulator")
-            # Create connection message
-            connect_msg = amazon_pb2.AConnect()
-            connect_msg.isAmazon = True
-
-            default_init_warehouses = []
-            for i in range(1, 51):
-                one_warehouse = Warehouse()
-                one_warehouse.warehouse_id = i
-                one_warehouse.x = random.randint(10, 100)
-                one_warehouse.y = random.randint(10, 100)
-                default_init_warehouses.append(one_warehouse)
-
-            init_warehouses =  default_init_warehouses
+            # New worlds need at least one warehouse; fall back to random ones only when none were chosen
+            if not init_warehouses and not world_id:
+                init_warehouses = []
+                for i in range(1, 51):
+                    one_warehouse = Warehouse()
+                    one_warehouse.warehouse_id = i
+                    one_warehouse.x = random.randint(10, 100)
+                    one_warehouse.y = random.randint(10, 100)
+                    init_warehouses.append(one_warehouse)
+
             default_speed_command = amazon_pb2.ACommands()
             default_speed_command.simspeed = 1000
             self.queue_command(default_speed_command)
-            print(connect_msg)
-            if world_id:
-                connect_msg.worldid = world_id
-            
-            if init_warehouses:
-                for wh in init_warehouses:
-                    new_wh = connect_msg.initwh.add()
-                    new_wh.id = wh.warehouse_id
-                    new_wh.x = wh.x
-                    new_wh.y = wh.y
-            
-            # Send connection message
-            self.send_protobuf(connect_msg)
-            
-            # Receive 
-            data = self.receive_message()
-            # connect response
-            response = amazon_pb2.AConnected()
-            response.ParseFromString(data)
-            
-            self.world_id = response.worldid
-            self.connected = response.result == "connected!"
-            
-            if not self.connected:
-                logger.error(f"Failed to connect to World Simulator: {response.result}")
-                return None, response.result
+
+            connected_world_id, result = self._handshake(world_id, init_warehouses)
+            if connected_world_id is None:
+                logger.error(f"Failed to connect to World Simulator: {result}")
+                return None, result
+
+            self.world_id = connected_world_id
+            self.connected = True
+            self.running = True
+            self._stopping.clear()
+            with self.lock:
+                self.unacked.clear()
+            self._mark_up()
 
             # Initialize the database with the initial warehouses
             if init_warehouses:
-                # Clear existing warehouses
-                db.session.query(Warehouse).delete()
+                # Warehouses not part of this world are removed; the chosen ones are kept or created
+                keep_ids = [wh.warehouse_id for wh in init_warehouses]
+                db.session.query(Warehouse).filter(Warehouse.warehouse_id.notin_(keep_ids))\
+                                           .delete(synchronize_session=False)
                 for wh in init_warehouses:
                     wh.world_id = self.world_id
-                    db.session.add(wh)
+                    db.session.merge(wh)
                 db.session.commit()
             
             # receiver_thread
@@ -130,20 +335,92 @@ class WorldSimulatorService:
             self.sender_thread.start()
             
             logger.info(f"Connected to World Simulator with world_id {self.world_id}")
+
+            engine = self.app.config.get('REPLENISHMENT_ENGINE') if self.app else None
+            if engine:
+                engine.start()
             
-            return self.world_id, response.result
+            return self.world_id, result
         except Exception as e:
             logger.error(f"Error connecting to World Simulator: {e}")
             return None, str(e)
+
+    def _handshake(self, world_id=None, init_warehouses=None):
+        """Open a socket and exchange AConnect/AConnected. Returns (world_id, result) or (None, result)."""
+        logger.info(f"Connecting to World Simulator at {self.host}:{self.port}...")
+        sock = socket.create_connection((self.host, self.port), timeout=10)
+        sock.settimeout(None)
+        self.socket = sock
+
+        connect_msg = amazon_pb2.AConnect()
+        connect_msg.isAmazon = True
+        if world_id:
+            connect_msg.worldid = world_id
+        for wh in init_warehouses or ():
+            new_wh = connect_msg.initwh.add()
+            new_wh.id = wh.warehouse_id
+            new_wh.x = wh.x
+            new_wh.y = wh.y
+        try:
+            self.send_protobuf(connect_msg)
+            data = self.receive_message()
+        except OSError:
+            sock.close()
+            raise
+        if data is None:
+            sock.close()
+            return None, "Connection closed during handshake"
+        response = amazon_pb2.AConnected()
+        response.ParseFromString(data)
+        if response.result != "connected!":
+            sock.close()
+            return None, response.result
+        return response.worldid, response.result
+
+    def _mark_up(self):
+        now = time.monotonic()
+        with self.lock:
+            stats = self.link_stats
+            if stats['down_since'] is not None:
+                stats['downtime_s'] += now - stats['down_since']
+                stats['down_since'] = None
+            stats['up_since'] = now
+            stats['connects'] += 1
+            self.state = 'connected'
+        self._link_up.set()
+
+    def _on_link_lost(self, reason):
+        """Called by the receiver when the socket dies. Returns True once the session is back."""
+        if self._stopping.is_set() or not self.running:
+            return False
+        self._link_up.clear()
+        with self.lock:
+            self.state = 'reconnecting'
+            self.link_stats['disconnects'] += 1
+            self.link_stats['last_error'] = reason
+            self.link_stats['down_since'] = time.monotonic()
+            self.link_stats['up_since'] = None
+        logger.warning(f"Lost connection to World Simulator ({reason}); reconnecting to world {self.world_id}")
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+        return self._reconnect_with_backoff()
     
     def disconnect(self):
         try:
             if self.connected:
+                # The world closes the socket after this; it must not look like an outage
+                self._stopping.set()
                 # disconnect command
                 command = amazon_pb2.ACommands()
                 command.disconnect = True
                 self.queue_command(command)
                 
+                engine = self.app.config.get('REPLENISHMENT_ENGINE') if self.app else None
+                if engine:
+                    engine.stop()
+
                 # Wait for threads to finish
                 self.running = False
                 if self.sender_thread:
@@ -154,6 +431,11 @@ class WorldSimulatorService:
                 # Close socket
                 self.socket.close()
                 self.connected = False
+                self._link_up.clear()
+                with self.lock:
+                    self.state = 'disconnected'
+                    self.unacked.clear()
+                self._sweep_requests(reason="Disconnected from World Simulator")
 
                 # delete all warehouses
                 db.session.query(Warehouse).delete()
@@ -163,93 +445,226 @@ class WorldSimulatorService:
         except Exception as e:
             logger.error(f"Error disconnecting from World Simulator: {e}")
     
-    # Modify in app/services/world_simulator_service.py
     def buy_product(self, warehouse_id, product_id, description, quantity):
+        success, result = self.buy_products([(warehouse_id, product_id, description, quantity)])
+        if not success:
+            return False, result
+        # Return success immediately - we'll get notification later when products arrive
+        return True, "Replenishment request sent successfully"
+
+    def buy_products(self, items):
+        """
+        Buy many products with one ACommands.
+
+        items: (warehouse_id, product_id, description, quantity) tuples or
+        dicts with those keys. Lines for the same warehouse share a single
+        APurchaseMore (repeated products are summed), the WorldMessage rows
+        are written with one bulk insert, and the result is a PurchaseHandle
+        that completes once every unit has arrived.
+        """
         if not self.connected:
             return False, "Not connected to World Simulator"
-        
+
         try:
+            by_warehouse = {}
+            for item in items:
+                if isinstance(item, dict):
+                    item = (item['warehouse_id'], item['product_id'], item['description'], item['quantity'])
+                warehouse_id, product_id, description, quantity = item
+                if quantity <= 0:
+                    continue
+                lines = by_warehouse.setdefault(warehouse_id, {})
+                if product_id in lines:
+                    lines[product_id][1] += quantity
+                else:
+                    lines[product_id] = [description or f"Product {product_id}", quantity]
+            if not by_warehouse:
+                return False, "Nothing to buy"
+
             command = amazon_pb2.ACommands()
-            buy = command.buy.add()
-            buy.whnum = warehouse_id
-            buy.seqnum = self._get_next_seqnum()
-            
-            product = buy.things.add()
-            product.id = product_id
-            truncated_description = description[:50]
-            product.description = truncated_description
-            if len(description) > 50:
-                logger.warning(f"Truncated description for product {product_id} from '{description}' to '{truncated_description}' before sending buy command.")
-            product.count = quantity
-            
-            db_message = WorldMessage(
-                seqnum=buy.seqnum,
-                message_type='buy',
-                message_content=f"Warehouse: {warehouse_id}, Product: {product_id}, Quantity: {quantity}",
-                status='sent'
-            )
-            db.session.add(db_message)
+            rows = []
+            expected = {}
+            for warehouse_id, lines in by_warehouse.items():
+                buy = command.buy.add()
+                buy.whnum = warehouse_id
+                buy.seqnum = self._get_next_seqnum()
+                for product_id, (description, quantity) in lines.items():
+                    product = buy.things.add()
+                    product.id = product_id
+                    product.description = description[:50]
+                    if len(description) > 50:
+                        logger.warning(f"Truncated description for product {product_id} from '{description}' to '{description[:50]}' before sending buy command.")
+                    product.count = quantity
+                    expected[(warehouse_id, product_id)] = quantity
+                rows.append({
+                    'seqnum': buy.seqnum,
+                    'message_type': 'buy',
+                    'message_content': f"Warehouse: {warehouse_id}, Products: {len(lines)}, "
+                                       f"Quantity: {sum(q for _, q in lines.values())}",
+                    'status': 'sent'
+                })
+
+            db.session.execute(insert(WorldMessage), rows)
             db.session.commit()
-            
+
+            handle = PurchaseHandle([row['seqnum'] for row in rows], expected)
+            now = time.monotonic()
+            with self.lock:
+                self.purchases = [h for h in self.purchases
+                                  if not h.done() and now - h.created_at < PURCHASE_HANDLE_TTL]
+                self.purchases.append(handle)
+
             # Queue the command without waiting for response
-            self.queue_command(command)
-            
-            # Return success immediately - we'll get notification later when products arrive
-            return True, "Replenishment request sent successfully"
-            
+            try:
+                self.queue_command(command)
+            except QueueBackpressure:
+                # _forget has already dropped the handle; the rows were committed as sent but never will be
+                db.session.execute(update(WorldMessage)
+                                   .where(WorldMessage.seqnum.in_([row['seqnum'] for row in rows]),
+                                          WorldMessage.message_type == 'buy')
+                                   .values(status='failed'))
+                db.session.commit()
+                raise
+            return True, handle
+
         except Exception as e:
-            logger.error(f"Error buying product: {e}")
+            db.session.rollback()
+            logger.error(f"Error buying products: {e}")
             return False, str(e)
+
+    def units_on_order(self, warehouse_id, product_id):
+        """Units bought but not yet arrived for one listing, across open purchases."""
+        key = (warehouse_id, product_id)
+        now = time.monotonic()
+        with self.lock:
+            return sum(h.remaining.get(key, 0) for h in self.purchases
+                       if now - h.created_at < PURCHASE_HANDLE_TTL)
+
+    def _settle_arrival(self, warehouse_id, product_id, quantity):
+        # Oldest purchase first, so arrivals are matched in order
+        key = (warehouse_id, product_id)
+        with self.lock:
+            for handle in self.purchases:
+                if quantity <= 0:
+                    break
+                quantity -= handle._credit(key, quantity)
+            self.purchases = [h for h in self.purchases if not h.done()]
     
-    def pack_shipment(self, warehouse_id, shipment_id, items):
+    def _track(self, seqnum, kind, key=None):
+        future = Future()
+        now = time.monotonic()
+        pending = _PendingRequest(future, kind, key, now, now + self.request_timeout)
+        with self.lock:
+            self.requests[seqnum] = pending
+            if kind == 'query':
+                self.queries[key].append(seqnum)
+        return future
+
+    def _untrack(self, seqnum):
+        """Forget a request; caller holds self.lock. Returns the _PendingRequest or None."""
+        pending = self.requests.pop(seqnum, None)
+        if pending is not None and pending.kind == 'query':
+            waiting = self.queries.get(pending.key)
+            if waiting and seqnum in waiting:
+                waiting.remove(seqnum)
+                if not waiting:
+                    del self.queries[pending.key]
+        return pending
+
+    def _resolve(self, seqnum, result=None, error=None):
+        with self.lock:
+            pending = self._untrack(seqnum)
+        if pending is None or pending.future.done():
+            return False
+        if error is not None:
+            WORLD_REQUEST_FAILURES.labels(pending.kind).inc()
+            pending.future.set_exception(WorldRequestError(error))
+        else:
+            WORLD_REQUEST_SECONDS.labels(pending.kind).observe(time.monotonic() - pending.started)
+            pending.future.set_result(result)
+        return True
+
+    def _failed(self, message):
+        future = Future()
+        future.set_exception(WorldRequestError(message))
+        return future
+
+    def _sweep_requests(self, now=None, reason=None):
+        """Fail requests past their deadline (or all of them, with a reason) so nothing is left waiting."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            expired = [seqnum for seqnum, pending in self.requests.items() if reason or pending.deadline <= now]
+            expired = [(seqnum, self._untrack(seqnum)) for seqnum in expired]
+        for seqnum, pending in expired:
+            if not pending.future.done():
+                WORLD_REQUEST_FAILURES.labels(pending.kind).inc()
+                pending.future.set_exception(WorldRequestError(reason or f"Timeout waiting for response to {pending.kind} (seqnum {seqnum})"))
+        if expired:
+            logger.warning("Failed %d pending world requests: %s", len(expired), reason or 'timed out')
+        return len(expired)
+
+    def _wait(self, future, timeout):
+        # Blocking form of the *_async calls; on timeout the request stays tracked until swept
+        try:
+            return True, future.result(timeout=timeout)
+        except FutureTimeout:
+            return False, "Timeout waiting for response"
+        except WorldRequestError as e:
+            return False, str(e)
+
+    def pack_shipment_async(self, warehouse_id, shipment_id, items):
+        """Queue an APack; the Future resolves to "ACK" or fails with WorldRequestError."""
+        return self.pack_shipments_async(warehouse_id, [(shipment_id, items)])[0]
+
+    def pack_shipments_async(self, warehouse_id, packs):
+        """
+        Queue one ACommands with an APack (own seqnum) for each (shipment_id,
+        items) in `packs`, all from one warehouse. The WorldMessage rows go
+        in with one bulk insert. Returns one Future per pack, in order.
+        """
         if not self.connected:
-            return False, "Not connected to World Simulator"
-        
+            return [self._failed("Not connected to World Simulator") for _ in packs]
+
         try:
             command = amazon_pb2.ACommands()
-            pack = command.topack.add()
-            pack.whnum = warehouse_id
-            pack.shipid = shipment_id
-            pack.seqnum = self._get_next_seqnum()
-            
-            for item in items:
-                product = pack.things.add()
-                product.id = item['product_id']
-                product.description = item['description']
-                product.count = item['quantity']
-            
-            # save command to database
-            db_message = WorldMessage(
-                seqnum=pack.seqnum,
-                message_type='topack',
-                message_content=f"Warehouse: {warehouse_id}, Shipment: {shipment_id}, Items: {len(items)}",
-                status='sent'
-            )
-            db.session.add(db_message)
+            rows = []
+            for shipment_id, items in packs:
+                pack = command.topack.add()
+                pack.whnum = warehouse_id
+                pack.shipid = shipment_id
+                pack.seqnum = self._get_next_seqnum()
+
+                for item in items:
+                    product = pack.things.add()
+                    product.id = item['product_id']
+                    product.description = item['description']
+                    product.count = item['quantity']
+
+                rows.append({
+                    'seqnum': pack.seqnum,
+                    'message_type': 'topack',
+                    'message_content': f"Warehouse: {warehouse_id}, Shipment: {shipment_id}, Items: {len(items)}",
+                    'status': 'sent'
+                })
+
+            db.session.execute(insert(WorldMessage), rows)
             db.session.commit()
-            
-            event = threading.Event()
-            with self.lock:
-                self.response_events[pack.seqnum] = event
-            
-            self.queue_command(command)
-            
-            if event.wait(timeout=10):
-                with self.lock:
-                    if pack.seqnum in self.pending_responses:
-                        response = self.pending_responses[pack.seqnum]
-                        del self.pending_responses[pack.seqnum]
-                        del self.response_events[pack.seqnum]
-                        return True, response
-            
-            return False, "Timeout waiting for response"
+
+            futures = [self._track(pack.seqnum, 'topack', pack.shipid) for pack in command.topack]
+            self._queue_tracked(command)
+            return futures
         except Exception as e:
-            logger.error(f"Error packing shipment: {e}")
-            return False, str(e)
+            db.session.rollback()
+            logger.error(f"Error packing shipments: {e}")
+            return [self._failed(str(e)) for _ in packs]
+
+    def pack_shipment(self, warehouse_id, shipment_id, items, timeout=10):
+        return self._wait(self.pack_shipment_async(warehouse_id, shipment_id, items), timeout)
     
-    def load_shipment(self, warehouse_id, truck_id, shipment_id):
+    def load_shipment_async(self, warehouse_id, truck_id, shipment_id):
+        """Queue an APutOnTruck; the Future resolves to "ACK" or fails with WorldRequestError."""
         if not self.connected:
-            return False, "Not connected to World Simulator"
+            return self._failed("Not connected to World Simulator")
         
         try:
             command = amazon_pb2.ACommands()
@@ -258,44 +673,122 @@ class WorldSimulatorService:
             load.truckid = truck_id
             load.shipid = shipment_id
             load.seqnum = self._get_next_seqnum()
-            
-            # Save command to database
-            # db_message = WorldMessage(
-            #     seqnum=load.seqnum,
-            #     message_type='load',
-            #     message_content=f"Warehouse: {warehouse_id}, Truck: {truck_id}, Shipment: {shipment_id}",
-            #     status='sent'
-            # )
-            # db.session.add(db_message)
-            # db.session.commit()
-            
-            # ceate event sequence number
 
             logger.info(f"Loading shipment {shipment_id} onto truck {truck_id} at warehouse {warehouse_id}")
-            
 
-            event = threading.Event()
-            with self.lock:
-                self.response_events[load.seqnum] = event
-            
-            # queue the command
-            self.queue_command(command)
-            
-            if event.wait(timeout=10):
-                with self.lock:
-                    if load.seqnum in self.pending_responses:
-                        response = self.pending_responses[load.seqnum]
-                        del self.pending_responses[load.seqnum]
-                        del self.response_events[load.seqnum]
-                        return True, response
-            
-            return False, "Timeout waiting for response"
+            future = self._track(load.seqnum, 'load', shipment_id)
+            self._queue_tracked(command)
+            return future
         except Exception as e:
             logger.error(f"Error loading shipment: {e}")
+            return self._failed(str(e))
+
+    def load_shipment(self, warehouse_id, truck_id, shipment_id, timeout=10):
+        return self._wait(self.load_shipment_async(warehouse_id, truck_id, shipment_id), timeout)
+
+    def load_shipments(self, warehouse_id, truck_id, shipment_ids):
+        """
+        Put many shipments on one truck with a single ACommands (one
+        APutOnTruck, with its own seqnum, per shipment). Nothing blocks:
+        returns (True, TruckLoad), which completes as the acks and ALoaded
+        responses come in, or (False, reason) when the command queue
+        rejects the command.
+        """
+        if not self.connected:
+            return False, "Not connected to World Simulator"
+        shipment_ids = list(dict.fromkeys(shipment_ids))
+        if not shipment_ids:
+            return False, "Nothing to load"
+
+        command = amazon_pb2.ACommands()
+        seqnums = {}
+        for shipment_id in shipment_ids:
+            load = command.load.add()
+            load.whnum = warehouse_id
+            load.truckid = truck_id
+            load.shipid = shipment_id
+            load.seqnum = self._get_next_seqnum()
+            seqnums[load.seqnum] = shipment_id
+
+        handle = TruckLoad(truck_id, warehouse_id, seqnums)
+        now = time.monotonic()
+        with self.lock:
+            self.truck_loads = {sid: h for sid, h in self.truck_loads.items()
+                                if not h.done() and now - h.created_at < TRUCK_LOAD_TTL}
+            for shipment_id in shipment_ids:
+                self.truck_loads[shipment_id] = handle
+        for seqnum, shipment_id in seqnums.items():
+            future = self._track(seqnum, 'load', shipment_id)
+            future.add_done_callback(functools.partial(handle._acked, shipment_id))
+
+        logger.info(f"Loading {len(shipment_ids)} shipments onto truck {truck_id} at warehouse {warehouse_id} "
+                    f"in one command")
+        try:
+            self.queue_command(command)
+        except QueueBackpressure as e:
             return False, str(e)
+        return True, handle
+
+    def _settle_loaded(self, shipment_ids):
+        with self.lock:
+            handles = [(shipment_id, self.truck_loads.pop(shipment_id, None)) for shipment_id in shipment_ids]
+        for shipment_id, handle in handles:
+            if handle is not None:
+                handle._loaded(shipment_id)
     
-    
-    
+    def load_when_ready(self, shipment_id, truck_id, warehouse_id):
+        """
+        Load the shipment now if it is packed, otherwise park the truck in
+        WAITING_PRODUCTS until the world reports the package ready. Runs under
+        ARRIVED_LOCK in the process that receives world events, so it cannot
+        race with handle_package_ready.
+        """
+        from app.services.shipment_transitions import current_status, transition
+
+        with self.app.app_context():
+            lock = self.app.config.get('ARRIVED_LOCK')
+            with lock:
+                # packed -> loading in one statement; anything else leaves the row untouched
+                if transition(shipment_id, 'loading', from_states=('packed',), truck_id=truck_id):
+                    db.session.commit()
+                    logger.info(f"The shipment {shipment_id} has been packed and is ready to be loaded.")
+                    # Not awaited: the ack arrives on the receiver thread, which may be the caller
+                    future = warn_on_failure(self.load_shipment_async(warehouse_id=warehouse_id, truck_id=truck_id,
+                                                                      shipment_id=shipment_id),
+                                             f"Loading shipment {shipment_id}")
+                    future.add_done_callback(lambda f: self._release_failed_load(f, shipment_id))
+                    if future.done() and future.exception() is not None:
+                        return False, str(future.exception())
+                    logger.info(f"Shipment {shipment_id} Loading info are sent to world")
+                    return True, 'loading'
+
+                status = current_status(shipment_id)
+                if status is None:
+                    return False, f"Shipment {shipment_id} not found"
+                if status != 'packing':
+                    logger.info(f"Shipment {shipment_id} is already {status}; not loading it again")
+                    return True, status
+
+                logger.info(f"The shipment {shipment_id} is not packed yet. Waiting for products to arrive. Add to map!")
+                waiting_products = self.app.config.get('WAITING_PRODUCTS')
+                waiting_products[shipment_id] = (truck_id, warehouse_id)
+                return True, 'waiting'
+
+    def _release_failed_load(self, future, shipment_id):
+        # A rejected, timed-out or unsendable load puts the shipment back to packed for the next truck
+        if future.exception() is None:
+            return
+        from app.services.shipment_transitions import transition
+
+        with self.app.app_context():
+            try:
+                if transition(shipment_id, 'packed', from_states=('loading',), truck_id=None):
+                    db.session.commit()
+                    logger.info(f"Shipment {shipment_id} is back to packed after its load failed")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Could not release shipment {shipment_id} after a failed load: {e}")
+
     def queue_command(self, command):
         # Add acks for received messages
         # with self.lock:
@@ -303,8 +796,43 @@ class WorldSimulatorService:
         #         command.acks.append(ack)
         #     self.acks.clear()
         
-        # Queue the command
-        self.message_queue.put(command)
+        # Anything carrying a seqnum is kept until acked so a reconnect can replay it
+        with self.lock:
+            for field in ('buy', 'topack', 'load', 'queries'):
+                for sub_command in getattr(command, field):
+                    self.unacked[sub_command.seqnum] = (field, sub_command)
+
+        # Queue the command; raises QueueBackpressure when its class is full
+        try:
+            shed = self.message_queue.put(command)
+        except QueueBackpressure as e:
+            self._forget(command, str(e))
+            raise
+        for dropped in shed:
+            self._forget(dropped, "Shed from the world command queue under backpressure")
+
+    def _queue_tracked(self, command):
+        # On backpressure _forget has already failed the command's futures; they carry the reason
+        try:
+            self.queue_command(command)
+        except QueueBackpressure:
+            pass
+
+    def _forget(self, command, reason):
+        """Drop a command that will never be sent and fail anything waiting on it."""
+        seqnums = [sub_command.seqnum for field in ('buy', 'topack', 'load', 'queries')
+                   for sub_command in getattr(command, field)]
+        with self.lock:
+            for seqnum in seqnums:
+                self.unacked.pop(seqnum, None)
+            dropped = [h for h in self.purchases if not set(h.seqnums).isdisjoint(seqnums)]
+            self.purchases = [h for h in self.purchases if h not in dropped]
+        for handle in dropped:
+            handle._fail(reason)
+        for seqnum in seqnums:
+            self._resolve(seqnum, error=reason)
+        if seqnums:
+            logger.warning(f"Dropped world command(s) {seqnums}: {reason}")
 
     def _queue_ack_immediately(self, seqnum_to_ack):
         """Creates and queues an ACommands message containing only an ACK."""
@@ -316,7 +844,7 @@ class WorldSimulatorService:
             ack_command = amazon_pb2.ACommands()
             ack_command.acks.append(seqnum_to_ack)
             self.message_queue.put(ack_command)
-            logger.debug(f"Queued immediate ACK for seqnum {seqnum_to_ack}")
+            logger.debug("Queued immediate ACK for seqnum %s", seqnum_to_ack)
         except Exception as e:
             logger.error(f"Error queueing immediate ACK for seqnum {seqnum_to_ack}: {e}", exc_info=True)
     
@@ -325,16 +853,32 @@ class WorldSimulatorService:
         while self.running:
             try:
                 # Get next command from queue
+                now = time.monotonic()
+                if now >= self._next_sweep:
+                    self._next_sweep = now + 1
+                    self._sweep_requests(now)
+                # Hold commands while the receiver is re-establishing the session
+                if not self._link_up.wait(timeout=1):
+                    continue
                 try:
                     command = self.message_queue.get(timeout=1)
                 except queue.Empty:
                     continue
                 
                 # Send the command
-                self.send_protobuf(command)
-                
-                # Mark as done
-                self.message_queue.task_done()
+                try:
+                    self.send_protobuf(command)
+                except OSError as send_err:
+                    # Seqnum'd parts stay in `unacked` and are replayed; wake the receiver so it reconnects
+                    logger.warning(f"Send failed, waiting for reconnect: {send_err}")
+                    self._link_up.clear()
+                    try:
+                        self.socket.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                finally:
+                    # Mark as done
+                    self.message_queue.task_done()
             except Exception as e:
                 logger.error(f"Error in send loop: {e}")
                 time.sleep(1)  # Avoid tight loop on error
@@ -351,26 +895,26 @@ class WorldSimulatorService:
                     last_heartbeat = current_time
                     
                 data = self.receive_message()
+                if data is None:
+                    if not self._on_link_lost("connection closed by world"):
+                        break
+                    continue
                 if not data:
-                    logger.warning("Empty response received")
-                    time.sleep(1) 
+                    logger.debug("Empty response received")
                     continue
+                WORLD_FRAMES_RECEIVED.inc()
 
-                logger.info(f"Received raw data of length: {len(data)}")
-                
-                # Try to parse and log the response for debugging
+                response = amazon_pb2.AResponses()
                 try:
-                    response = amazon_pb2.AResponses()
                     response.ParseFromString(data)
-                    logger.info(f"Parsed AResponses: ACKs received: {list(response.acks)}, "
-                               f"Arrived: {len(response.arrived)}, Ready: {len(response.ready)}, "
-                               f"Loaded: {len(response.loaded)}, Errors: {len(response.error)}")
-                except Exception as parse_err:
-                    logger.error(f"Failed to parse received data: {parse_err}")
-                
-                # Normal processing continues
-                response = amazon_pb2.AResponses()
-                response.ParseFromString(data)
+                except DecodeError as parse_err:
+                    logger.error("Failed to parse received data (%d bytes): %s", len(data), parse_err)
+                    continue
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Parsed AResponses (%d bytes): ACKs %s, Arrived: %d, Ready: %d, Loaded: %d, Errors: %d",
+                                 len(data), list(response.acks), len(response.arrived), len(response.ready),
+                                 len(response.loaded), len(response.error))
 
                 if self.app:
                     with self.app.app_context():
@@ -378,12 +922,12 @@ class WorldSimulatorService:
                 else:
                     logger.error("WorldSimulatorService was not initialized with a Flask app object. Cannot create app context in receive_loop.")
             
-            except ConnectionAbortedError:
-                logger.warning("Connection aborted, stopping receive loop.")
-                self.running = False
             except socket.timeout:
                 logger.debug("Socket receive timed out, continuing loop.")
                 continue 
+            except OSError as e:
+                if not self._on_link_lost(str(e)):
+                    break
             except Exception as e:
                 logger.error(f"Error in receive loop: {e}", exc_info=True)
                 if not self.running:
@@ -393,10 +937,15 @@ class WorldSimulatorService:
 
     def process_response(self, response):
         try:
+            # Errors first: the world acks a rejected command too, and the ack must not win
+            for error in response.error:
+                self._queue_ack_immediately(error.seqnum)
+                self.process_error(error)
 
-            for ack_seqnum in response.acks:
-                logger.info(f"Processing ACK received from world for seqnum: {ack_seqnum}")
-                self.process_ack(ack_seqnum) 
+            if response.acks:
+                sampled_log.log(logging.INFO, 'ack', "Processing %d ACKs received from world, first seqnum: %s",
+                                len(response.acks), response.acks[0])
+                self.process_acks(response.acks)
 
             for package in response.arrived:
                 self._queue_ack_immediately(package.seqnum)
@@ -408,66 +957,58 @@ class WorldSimulatorService:
                 self.process_ready(package)
 
             for package in response.loaded:
-                logger.info("Receive Loaded Info, Processing package loaded...")
                 self._queue_ack_immediately(package.seqnum)
-                self.process_loaded(package) 
+            if response.loaded:
+                self.process_loaded(response.loaded)
 
             for package in response.packagestatus:
                 self._queue_ack_immediately(package.seqnum)
                 self.process_package_status(package) 
 
-            for error in response.error:
-                self._queue_ack_immediately(error.seqnum)
-                self.process_error(error)
-
             # with self.lock:
             #      self.acks.update(acks_to_send)
 
         except Exception as e:
-            logger.error(f"Error processing response content: {e}", exc_info=True)
+            logger.error("Error processing response content: %s", e, exc_info=True)
 
 
     def process_ack(self, seqnum):
-        logger.debug(f"Received ack for seqnum {seqnum}")
-        
-        logger.info(f"Attempting to find WorldMessage for acked seqnum {seqnum}...")
-        message = WorldMessage.query.filter_by(seqnum=seqnum).first()
-        if message:
-            logger.info(f"Found WorldMessage ID {message.id}, current status {message.status}. Setting status to 'acked'.")
-            message.status = 'acked'
-            try:
-                db.session.commit()
-                logger.info(f"Successfully committed status update for WorldMessage ID {message.id}, seqnum {seqnum}.")
-            except Exception as commit_err:
-                db.session.rollback()
-                logger.error(f"Failed to commit status update for seqnum {seqnum}: {commit_err}", exc_info=True)
-        else:
-            # Create a new WorldMessage record for this ack
-            try:
-                new_message = WorldMessage(
-                    seqnum=seqnum,
-                    message_type='auto_created',
-                    message_content=f"Auto-created record for ack {seqnum}",
-                    status='acked'
-                )
-                db.session.add(new_message)
-                db.session.commit()
-                logger.info(f"Created new WorldMessage record for previously unknown seqnum {seqnum}")
-            except Exception as create_err:
-                db.session.rollback()
-                logger.error(f"Failed to create WorldMessage for seqnum {seqnum}: {create_err}", exc_info=True)
-                
+        self.process_acks([seqnum])
+
+    def process_acks(self, seqnums):
+        """Mark the WorldMessage rows of all ACKs of one response acked in one transaction, then resolve their requests."""
+        seqnums = list(dict.fromkeys(seqnums))
         with self.lock:
-            if seqnum in self.response_events:
-                if seqnum not in self.pending_responses or self.pending_responses[seqnum] is None:
-                    self.pending_responses[seqnum] = "ACK"
-                self.response_events[seqnum].set()
-                logger.info(f"Set event for seqnum {seqnum}")
-            else:
-                logger.debug(f"No event waiting for ack of seqnum {seqnum}")
+            for seqnum in seqnums:
+                self.unacked.pop(seqnum, None)
+        try:
+            known = set(db.session.scalars(select(WorldMessage.seqnum).where(WorldMessage.seqnum.in_(seqnums))))
+            if known:
+                db.session.execute(update(WorldMessage).where(WorldMessage.seqnum.in_(known)).values(status='acked'))
+            # Acks for seqnums never recorded (e.g. sent before a restart) get a record of their own
+            missing = [seqnum for seqnum in seqnums if seqnum not in known]
+            if missing:
+                db.session.execute(insert(WorldMessage), [{
+                    'seqnum': seqnum,
+                    'message_type': 'auto_created',
+                    'message_content': f"Auto-created record for ack {seqnum}",
+                    'status': 'acked'
+                } for seqnum in missing])
+            db.session.commit()
+            logger.debug("Marked %d WorldMessages acked, created %d", len(known), len(missing))
+        except Exception as commit_err:
+            db.session.rollback()
+            logger.error("Failed to record ACKs for seqnums %s: %s", seqnums, commit_err, exc_info=True)
+
+        with self.lock:
+            pending = [(seqnum, self.requests.get(seqnum)) for seqnum in seqnums]
+        # A query is only acked here; its answer is the APackage status that follows
+        for seqnum, request in pending:
+            if request is not None and request.kind != 'query':
+                self._resolve(seqnum, "ACK")
     
     def process_arrived(self, package):
-        logger.info(f"Products arrived for warehouse {package.whnum}")
+        logger.info("Products arrived for warehouse %s", package.whnum)
         from app.services.world_event_handler import WorldEventHandler
 
         handler = WorldEventHandler(self.app)
@@ -478,12 +1019,14 @@ class WorldSimulatorService:
                 'description': product.description,
                 'quantity': product.count
             })
+            # Stock is committed by now, so waiters see it when their handle completes
+            self._settle_arrival(package.whnum, product.id, product.count)
         
         # with self.lock:
         #     self.acks.add(package.seqnum)
     
     def process_ready(self, package):
-        logger.info(f"Package {package.shipid} is ready")
+        logger.info("Package %s is ready", package.shipid)
         from app.services.world_event_handler import WorldEventHandler
 
         handler = WorldEventHandler(self.app)
@@ -493,49 +1036,41 @@ class WorldSimulatorService:
         # with self.lock:
         #     self.acks.add(package.seqnum)
     
-    def process_loaded(self, package):
-        logger.info(f"Package {package.shipid} is loaded")
-        
-        from app.model import Shipment
-        shipment = Shipment.query.filter_by(shipment_id=package.shipid).first()
-        
-        if shipment and shipment.truck_id:
-            from app.services.world_event_handler import WorldEventHandler
-            handler = WorldEventHandler(self.app)
-            handler.handle_world_event('package_loaded', {
-                'shipment_id': package.shipid,
-                'truck_id': shipment.truck_id
-            })
-        
-        # with self.lock:
-        #     self.acks.add(package.seqnum)
-    
+    def process_loaded(self, packages):
+        shipment_ids = [package.shipid for package in packages]
+        logger.info("Packages %s are loaded", shipment_ids)
+
+        # Every ALoaded of this response is applied in one transaction
+        from app.services.world_event_handler import WorldEventHandler
+        handler = WorldEventHandler(self.app)
+        handler.handle_world_event('packages_loaded', {'shipment_ids': shipment_ids})
+        self._settle_loaded(shipment_ids)
+
     def process_package_status(self, package):
-        logger.info(f"Package {package.packageid} status: {package.status}")
+        sampled_log.log(logging.INFO, 'package_status', "Package %s status: %s", package.packageid, package.status)
         
         with self.lock:
-            if package.seqnum in self.response_events:
-                self.pending_responses[package.seqnum] = package.status
-                self.response_events[package.seqnum].set()
+            waiting = list(self.queries.get(package.packageid, ()))
+        for seqnum in waiting:
+            self._resolve(seqnum, package.status)
         
         # with self.lock:
         #     self.acks.add(package.seqnum)
     
     def process_error(self, error):
-        logger.error(f"Error from world simulator: {error.err} (seqnum: {error.originseqnum})")
+        logger.error("Error from world simulator: %s (seqnum: %s)", error.err, error.originseqnum)
         
-        # Store the error
         with self.lock:
-            if error.originseqnum in self.response_events:
-                self.pending_responses[error.originseqnum] = f"Error: {error.err}"
-                self.response_events[error.originseqnum].set()
+            self.unacked.pop(error.originseqnum, None)
+        self._resolve(error.originseqnum, error=f"Error: {error.err}")
         
         # with self.lock:
         #     self.acks.add(error.seqnum)
     
     def send_protobuf(self, message):
-        # Add logging to track the message being sent
-        try:
+        # Only pay for inspecting the message when the line will actually be written
+        # AConnect goes through here too and has none of the ACommands fields
+        if isinstance(message, amazon_pb2.ACommands) and sampled_log.ready(logging.INFO, 'send'):
             seqnum = None
             if message.buy:
                 seqnum = message.buy[0].seqnum
@@ -545,16 +1080,15 @@ class WorldSimulatorService:
                 seqnum = message.load[0].seqnum
             elif message.queries:
                 seqnum = message.queries[0].seqnum
-                
-            logger.info(f"Sending message with seqnum: {seqnum}, ACKs being sent: {list(message.acks)}")
-        except Exception as e:
-            logger.warning(f"Could not log message details: {e}")
-            
+            logger.info("Sending message with seqnum: %s, ACKs being sent: %s (sampled, %d so far)",
+                        seqnum, list(message.acks), sampled_log.counts['send'])
+
         serialized = message.SerializeToString()
         # Use Varint32 encoding for message length
         size_prefix = _VarintBytes(len(serialized))
         # Send both length prefix and message in one call
         self.socket.sendall(size_prefix + serialized)
+        WORLD_FRAMES_SENT.inc()
     
     # receive a message
     def receive_message(self):
@@ -585,25 +1119,89 @@ class WorldSimulatorService:
         return data
     
     def _reconnect_with_backoff(self):
-        retry_count = 0
-        max_retries = 5
-        base_delay = 1  # seconds
-        
-        while retry_count < max_retries:
+        """
+        Re-open the session to the same world with jittered exponential
+        backoff, then replay every unacked command in one ACommands. Gives up
+        only after `reconnect_max_attempts` failures (0 = never) or on
+        disconnect().
+        """
+        attempt = 0
+        while self.running and not self._stopping.is_set():
             try:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.connect((self.host, self.port))
+                world_id, result = self._handshake(self.world_id)
+                if world_id is None:
+                    raise ConnectionError(result)
+                replayed = self._replay_unacked()
+                with self.lock:
+                    self.link_stats['reconnects'] += 1
+                    self.link_stats['replayed_commands'] += replayed
+                self._mark_up()
+                logger.info(f"Reconnected to world {self.world_id} after {attempt} failed attempts; "
+                            f"replayed {replayed} unacked commands")
                 return True
             except Exception as e:
-                retry_count += 1
-                delay = base_delay * (2 ** retry_count)
-                logger.warning(f"Reconnection attempt {retry_count} failed. Retrying in {delay} seconds.")
-                time.sleep(delay)
-        
-        return False
-    
+                attempt += 1
+                with self.lock:
+                    self.link_stats['failed_attempts'] += 1
+                    self.link_stats['last_error'] = str(e)
+                if self.reconnect_max_attempts and attempt >= self.reconnect_max_attempts:
+                    break
+                delay = min(self.reconnect_max_delay, self.reconnect_base_delay * (2 ** (attempt - 1)))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"Reconnection attempt {attempt} failed ({e}). Retrying in {delay:.1f} seconds.")
+                if self._stopping.wait(delay):
+                    break
 
+        if not self._stopping.is_set():
+            logger.error(f"Giving up on world {self.world_id} after {attempt} reconnection attempts")
+            self.connected = False
+            self.running = False
+            with self.lock:
+                self.state = 'disconnected'
+            self._sweep_requests(reason="Lost connection to World Simulator")
+        return False
 
+    def _replay_unacked(self):
+        """Send every unacked command, plus acks still waiting in the queue, as one ACommands."""
+        replay = amazon_pb2.ACommands()
+        # Queued commands with seqnums are already in `unacked`; only their acks and settings are kept
+        while True:
+            try:
+                command = self.message_queue.get_nowait()
+            except queue.Empty:
+                break
+            replay.acks.extend(command.acks)
+            if command.HasField('simspeed'):
+                replay.simspeed = command.simspeed
+            self.message_queue.task_done()
+        with self.lock:
+            pending = sorted(self.unacked.items())
+        for _, (field, sub_command) in pending:
+            getattr(replay, field).add().CopyFrom(sub_command)
+        if pending or replay.acks or replay.HasField('simspeed'):
+            self.send_protobuf(replay)
+        return len(pending)
+
+    def connection_stats(self):
+        now = time.monotonic()
+        with self.lock:
+            stats = dict(self.link_stats)
+            unacked = len(self.unacked)
+            pending = len(self.requests)
+            state = self.state
+        up_since, down_since = stats.pop('up_since'), stats.pop('down_since')
+        if down_since is not None:
+            stats['downtime_s'] += now - down_since
+        stats.update({
+            'state': state,
+            'world_id': self.world_id,
+            'uptime_s': now - up_since if up_since is not None else 0.0,
+            'unacked_commands': unacked,
+            'pending_requests': pending,
+            'queued_commands': self.message_queue.qsize(),
+            'queue': self.message_queue.stats()
+        })
+        return stats
 
     def set_sim_speed(self, speed: int):
 
@@ -817,7 +1415,7 @@ class WorldSimulatorService:
     #         self.socket = None
     #         return None, "Connection timed out"
     #     except Exception as e:
-    #         logger.error(f"Error connecting to World Simulator: {e}", exc_info=True)
+    #         logger.error(f"Error connecting to World Simulator: {e}")
     #         if self.socket:
     #             try:
     #                 self.socket.close()
@@ -827,10 +1425,10 @@ class WorldSimulatorService:
     #         self.connected = False
     #         return None, str(e)
 
-    def query_package(self, package_id):
+    def query_package_async(self, package_id):
+        """Queue an AQuery; the Future resolves to the package status string from the world."""
         if not self.connected:
-            return False, "Not connected to World Simulator"
-
+            return self._failed("Not connected to World Simulator")
 
         try:
             command = amazon_pb2.ACommands()
@@ -849,50 +1447,20 @@ class WorldSimulatorService:
                 db.session.add(db_message)
                 db.session.commit()
 
-
-            # Prepare to wait for the response
-            event = threading.Event()
-            with self.lock:
-                self.response_events[query.seqnum] = event
-
-            self.queue_command(command)
+            future = self._track(query.seqnum, 'query', package_id)
+            self._queue_tracked(command)
             logger.info(f"Queued query command for package ID {package_id} (seqnum: {query.seqnum})")
-
-            # Wait for the response or timeout
-            if event.wait(timeout=10): # Adjust timeout if needed
-                with self.lock:
-                    if query.seqnum in self.pending_responses:
-                        response_status = self.pending_responses[query.seqnum]
-                        logger.info(f"Received response for query seqnum {query.seqnum}: Status='{response_status}'")
-                        # Clean up
-                        del self.pending_responses[query.seqnum]
-                        if query.seqnum in self.response_events: del self.response_events[query.seqnum]
-                        # The response is likely the status string (e.g., "packed", "loaded")
-                        return True, response_status
-                    else:
-                        # Event was set, but no response recorded? Should ideally not happen with current logic.
-                        logger.warning(f"Event set for query seqnum {query.seqnum}, but no response found in pending_responses.")
-                        return False, "Response event triggered, but data missing"
-            else:
-                logger.warning(f"Timeout waiting for query response for package ID {package_id} (seqnum: {query.seqnum})")
-                # Clean up the event waiter if timed out
-                with self.lock:
-                    if query.seqnum in self.response_events:
-                        del self.response_events[query.seqnum]
-                    # Optionally remove from pending_responses too if it might get populated later erroneously
-                    if query.seqnum in self.pending_responses:
-                        del self.pending_responses[query.seqnum]
-                return False, "Timeout waiting for query response"
-
-        # except ConnectionResetError:
+            return future
         except Exception as e:
             logger.error(f"Error querying package {package_id}: {e}", exc_info=True)
             with self.app.app_context():
                 db.session.rollback()
-            with self.lock:
-                 if 'query' in locals() and query.seqnum in self.response_events:
-                     del self.response_events[query.seqnum]
-                 if 'query' in locals() and query.seqnum in self.pending_responses:
-                      del self.pending_responses[query.seqnum]
-            return False, str(e)
+            return self._failed(str(e))
 
+    def query_package(self, package_id, timeout=10):
+        success, result = self._wait(self.query_package_async(package_id), timeout)
+        if success:
+            logger.info(f"Received status for package ID {package_id}: '{result}'")
+        else:
+            logger.warning(f"Query for package ID {package_id} failed: {result}")
+        return success, result
@@ -0,0 +1,129 @@
+"""
+Static 2-D k-d tree over warehouse coordinates.
+
+Points are stored in one NumPy array reordered so that every subrange
+[lo, hi) is a subtree whose root is its median element at (lo + hi) // 2.
+No node objects are allocated; a query walks index ranges. Small or
+filtered queries over up to `scan_limit` candidates use a vectorized scan,
+which beats walking the tree when only part of the points qualify.
+"""
+import numpy as np
+
+
+class KDTree:
+    def __init__(self, ids, points, brute_force_below=64, scan_limit=4096):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.brute_force_below = brute_force_below
+        self.scan_limit = scan_limit
+        self.axes = np.zeros(len(self.ids), dtype=np.int8)
+        self._build()
+        # Python-side copies: scalar access on lists is much cheaper than on arrays
+        self._xs = self.points[:, 0].tolist()
+        self._ys = self.points[:, 1].tolist()
+        self._axes = self.axes.tolist()
+        self._ids = self.ids.tolist()
+        # id -> position lookup: a dense table when ids are compact (the usual
+        # case for serial keys), otherwise a sorted index for binary search
+        self._position_by_id = None
+        max_id = int(self.ids.max()) if len(self.ids) else -1
+        if 0 <= int(self.ids.min() if len(self.ids) else 0) and max_id < 4 * len(self.ids) + 1024:
+            self._position_by_id = np.full(max_id + 1, -1, dtype=np.int64)
+            self._position_by_id[self.ids] = np.arange(len(self.ids))
+        self._id_order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._id_order]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _build(self):
+        order = np.arange(len(self.ids))
+        stack = [(0, len(order))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= 1:
+                continue
+            segment = self.points[order[lo:hi]]
+            # Split on the axis with the larger spread
+            axis = int(np.ptp(segment[:, 1]) > np.ptp(segment[:, 0]))
+            mid = (hi - lo) // 2
+            partitioned = np.argpartition(segment[:, axis], mid)
+            order[lo:hi] = order[lo:hi][partitioned]
+            self.axes[lo + mid] = axis
+            stack.append((lo, lo + mid))
+            stack.append((lo + mid + 1, hi))
+        self.ids = self.ids[order]
+        self.points = self.points[order]
+
+    def positions_for(self, warehouse_ids):
+        """Tree positions of the given ids; ids not in the tree are dropped."""
+        if not isinstance(warehouse_ids, np.ndarray):
+            warehouse_ids = list(warehouse_ids)
+        wanted = np.fromiter(warehouse_ids, dtype=np.int64, count=len(warehouse_ids))
+        if len(wanted) == 0 or len(self._sorted_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        if self._position_by_id is not None:
+            wanted = wanted[(wanted >= 0) & (wanted < len(self._position_by_id))]
+            positions = self._position_by_id[wanted]
+            return positions[positions >= 0]
+        idx = np.minimum(np.searchsorted(self._sorted_ids, wanted), len(self._sorted_ids) - 1)
+        found = self._sorted_ids[idx] == wanted
+        return self._id_order[idx[found]]
+
+    def nearest(self, x, y, positions=None):
+        """
+        Return (warehouse_id, squared_distance) of the closest point, or
+        (None, None). `positions` (from positions_for) restricts the search.
+        """
+        n = len(self._ids)
+        if n == 0:
+            return None, None
+
+        if positions is not None:
+            if len(positions) == 0:
+                return None, None
+            if len(positions) <= self.scan_limit:
+                return self._nearest_brute(x, y, positions)
+            allowed = np.zeros(n, dtype=bool)
+            allowed[positions] = True
+            return self._nearest_tree(x, y, allowed)
+
+        if n <= self.brute_force_below:
+            return self._nearest_brute(x, y, None)
+        return self._nearest_tree(x, y, None)
+
+    def _nearest_brute(self, x, y, positions):
+        points = self.points if positions is None else self.points[positions]
+        d2 = (points[:, 0] - x) ** 2 + (points[:, 1] - y) ** 2
+        best = int(np.argmin(d2))
+        position = best if positions is None else int(positions[best])
+        return self._ids[position], float(d2[best])
+
+    def _nearest_tree(self, x, y, allowed):
+        xs, ys, axes = self._xs, self._ys, self._axes
+        best_d2 = float('inf')
+        best = -1
+        # (lo, hi, squared distance from the query to the splitting plane that led here)
+        stack = [(0, len(xs), 0.0)]
+        while stack:
+            lo, hi, plane_d2 = stack.pop()
+            if lo >= hi or plane_d2 >= best_d2:
+                continue
+            mid = (lo + hi) >> 1
+            px, py = xs[mid], ys[mid]
+            if allowed is None or allowed[mid]:
+                d2 = (px - x) * (px - x) + (py - y) * (py - y)
+                if d2 < best_d2:
+                    best_d2, best = d2, mid
+            diff = (x - px) if axes[mid] == 0 else (y - py)
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            # Far side first so the near side is explored (and best_d2 tightened) before it
+            stack.append((far[0], far[1], diff * diff))
+            stack.append((near[0], near[1], 0.0))
+
+        if best < 0:
+            return None, None
+        return self._ids[best], best_d2
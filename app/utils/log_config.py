@@ -0,0 +1,130 @@
+"""
+Logging setup shared by the web app, the world gateway and scripts.
+
+configure_logging() puts a single QueueHandler on the root logger and moves
+formatting and I/O to a QueueListener thread, so request handlers and the
+world receiver thread never block on a slow stderr. Per-module levels come
+from LOG_LEVELS, e.g. "app.services.world_simulator_service=WARNING,sqlalchemy=WARNING".
+
+LogSampler is for very high volume messages (per-ACK, per-frame): it emits
+the first and then every Nth message per key and drops the rest cheaply.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_lock = threading.Lock()
+_installed_handler = None
+_listener = None
+_sample_every = 100
+
+
+def parse_levels(spec):
+    """Accept a dict or a "module=LEVEL,module=LEVEL" string; return {module: LEVEL}."""
+    if not spec:
+        return {}
+    if isinstance(spec, dict):
+        return {name: str(level).upper() for name, level in spec.items()}
+
+    levels = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level='INFO', levels=None, use_queue=True, sample_every=100, handlers=None):
+    """
+    Install (or re-install) the app's logging pipeline. Safe to call once per
+    create_app(); if something else (gunicorn, pytest) already owns the root
+    handlers, only the levels are applied.
+    """
+    global _installed_handler, _listener, _sample_every
+
+    root = logging.getLogger()
+    with _lock:
+        _sample_every = max(int(sample_every or 1), 1)
+        root.setLevel(str(level).upper())
+        for name, module_level in parse_levels(levels).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        foreign = [h for h in root.handlers if h is not _installed_handler]
+        if foreign and handlers is None:
+            return
+
+        _remove_installed(root)
+
+        if handlers is None:
+            handlers = [logging.StreamHandler()]
+        formatter = logging.Formatter(LOG_FORMAT)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        if use_queue:
+            log_queue = queue.SimpleQueue()
+            _installed_handler = logging.handlers.QueueHandler(log_queue)
+            _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            _listener.start()
+        else:
+            _installed_handler = handlers[0] if len(handlers) == 1 else _FanOutHandler(handlers)
+        root.addHandler(_installed_handler)
+
+
+def shutdown_logging():
+    """Flush and stop the listener thread (registered with atexit)."""
+    with _lock:
+        _remove_installed(logging.getLogger())
+
+
+def _remove_installed(root):
+    global _installed_handler, _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _installed_handler is not None:
+        root.removeHandler(_installed_handler)
+        _installed_handler = None
+
+
+class _FanOutHandler(logging.Handler):
+    def __init__(self, handlers):
+        super().__init__()
+        self.handlers = handlers
+
+    def emit(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class LogSampler:
+    """Emit the first and then every Nth message per key; the others are only counted."""
+
+    def __init__(self, logger, every=None):
+        self.logger = logger
+        self.every = every
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def ready(self, level, key):
+        """True when a message for `key` should be emitted now; build expensive args only then."""
+        if not self.logger.isEnabledFor(level):
+            return False
+        every = self.every or _sample_every
+        with self.lock:
+            count = self.counts.get(key, 0) + 1
+            self.counts[key] = count
+        return every == 1 or count % every == 1
+
+    def log(self, level, key, msg, *args):
+        if self.ready(level, key):
+            self.logger.log(level, msg + ' (sampled, %d so far)', *args, self.counts[key])
+
+
+atexit.register(shutdown_logging)
@@ -1,49 +1,146 @@
 # amazon-ups/app/utils/mapping.py
 import logging
+from operator import attrgetter
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 US_BOUNDS = {
-    'min_lat': 30.396308,  #
-    'max_lat': 47.384358,  
-    'min_lon': -125.000000, 
-    'max_lon': -81.934570   
+    'min_lat': 30.396308,
+    'max_lat': 47.384358,
+    'min_lon': -125.000000,
+    'max_lon': -81.934570
 }
 
-def convert_sim_coords_to_latlon(warehouses):
+# Simulator coordinates are clamped to this square before projection
+SIM_MIN = 0.0
+SIM_MAX = 100.0
+
+LAT_RANGE = US_BOUNDS['max_lat'] - US_BOUNDS['min_lat']
+LON_RANGE = US_BOUNDS['max_lon'] - US_BOUNDS['min_lon']
+
+
+def project(xs, ys):
+    """
+    Project simulator coordinates onto the US bounding box in one vectorized pass.
+
+    xs, ys: array-likes of equal length. Returns (lat, lon) float64 arrays.
+    x grows eastwards, y grows southwards.
+    """
+    xs = np.clip(np.asarray(xs, dtype=np.float64), SIM_MIN, SIM_MAX)
+    ys = np.clip(np.asarray(ys, dtype=np.float64), SIM_MIN, SIM_MAX)
+    span = SIM_MAX - SIM_MIN
+    lon = US_BOUNDS['min_lon'] + ((xs - SIM_MIN) / span) * LON_RANGE
+    lat = US_BOUNDS['max_lat'] - ((ys - SIM_MIN) / span) * LAT_RANGE
+    return lat, lon
 
-    mapped_warehouses = []
-    lat_range = US_BOUNDS['max_lat'] - US_BOUNDS['min_lat']
-    lon_range = US_BOUNDS['max_lon'] - US_BOUNDS['min_lon']
 
-    if lon_range == 0 or lat_range == 0:
-         logger.error("Latitude or Longitude range is zero. Check US_BOUNDS constants.")
-         return []
+def project_point(x, y):
+    """(lat, lon) of a single simulator coordinate, or (None, None) if it is not numeric."""
+    try:
+        lat, lon = project([float(x)], [float(y)])
+    except (TypeError, ValueError):
+        return None, None
+    if not (np.isfinite(lat[0]) and np.isfinite(lon[0])):
+        return None, None
+    return float(lat[0]), float(lon[0])
 
-    for wh in warehouses:
+
+def _to_columns(items, id_attr, fields):
+    """
+    Pull (id, x, y, *fields) out of objects or tuples into NumPy columns.
+
+    Items with missing or non-numeric coordinates are skipped with a warning,
+    like the per-item loop this replaces; the common all-valid case converts
+    each column in a single call.
+    """
+    items = list(items)
+    fields = tuple(fields)
+    width = 3 + len(fields)
+    if not items:
+        columns = [()] * width
+    elif all(isinstance(item, (tuple, list)) and len(item) >= width for item in items):
+        columns = list(zip(*[item[:width] for item in items]))
+    else:
+        getter = attrgetter(id_attr, 'x', 'y', *fields)
         try:
-            sim_x = float(getattr(wh, 'x', 0)) # Use getattr for flexibility
-            sim_y = float(getattr(wh, 'y', 0))
-            wh_id = int(getattr(wh, 'warehouse_id', 0))
-            is_active = bool(getattr(wh, 'active', False))
-
-            clamped_x = max(0.0, min(100.0, sim_x))
-            clamped_y = max(0.0, min(100.0, sim_y))
-
-            lon = US_BOUNDS['min_lon'] + (clamped_x / 100.0) * lon_range
-            lat = US_BOUNDS['max_lat'] - (clamped_y / 100.0) * lat_range
-
-            mapped_warehouses.append({
-                'id': wh_id,
-                'x': sim_x, # Store original sim coords
-                'y': sim_y,
-                'active': is_active,
-                'lat': lat,
-                'lon': lon
-            })
-        except (TypeError, ValueError, AttributeError) as e:
-            wh_identifier = getattr(wh, 'warehouse_id', 'Unknown ID')
-            logger.warning(f"Could not convert coordinates for warehouse {wh_identifier}: {e}")
-            continue # Skip this warehouse if coordinates are invalid
-
-    return mapped_warehouses
\ No newline at end of file
+            columns = list(zip(*map(getter, items)))
+        except (AttributeError, TypeError):
+            # Mixed or partial items: fall back to per-item lookups with defaults
+            columns = list(zip(*[
+                tuple(item[:width]) + (None,) * (width - len(item)) if isinstance(item, (tuple, list))
+                else (getattr(item, id_attr, 0), getattr(item, 'x', 0), getattr(item, 'y', 0),
+                      *[getattr(item, name, None) for name in fields])
+                for item in items
+            ]))
+    ids, xs, ys = columns[0], columns[1], columns[2]
+    extra = {name: list(columns[3 + i]) for i, name in enumerate(fields)}
+
+    try:
+        id_col = np.array(ids, dtype=np.int64)
+        x_col = np.array(xs, dtype=np.float64)
+        y_col = np.array(ys, dtype=np.float64)
+    except (TypeError, ValueError):
+        keep = []
+        for i, (item_id, x, y) in enumerate(zip(ids, xs, ys)):
+            try:
+                int(item_id), float(x), float(y)
+                keep.append(i)
+            except (TypeError, ValueError) as e:
+                logger.warning("Could not convert coordinates for %s %s: %s", id_attr, item_id, e)
+        id_col = np.array([ids[i] for i in keep], dtype=np.int64)
+        x_col = np.array([xs[i] for i in keep], dtype=np.float64)
+        y_col = np.array([ys[i] for i in keep], dtype=np.float64)
+        extra = {name: [column[i] for i in keep] for name, column in extra.items()}
+
+    finite = np.isfinite(x_col) & np.isfinite(y_col)
+    if not finite.all():
+        logger.warning("Skipping %d %s entries with non-finite coordinates", int((~finite).sum()), id_attr)
+        id_col, x_col, y_col = id_col[finite], x_col[finite], y_col[finite]
+        extra = {name: [v for v, ok in zip(column, finite.tolist()) if ok] for name, column in extra.items()}
+    return id_col, x_col, y_col, extra
+
+
+def map_points(ids, xs, ys, **columns):
+    """
+    Build map marker dicts from column arrays.
+
+    Each marker carries 'id', the original 'x'/'y', the projected 'lat'/'lon'
+    and one key per extra column.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    lat, lon = project(xs, ys)
+    markers = [
+        {'id': i, 'x': x, 'y': y, 'lat': la, 'lon': lo}
+        for i, x, y, la, lo in zip(np.asarray(ids).tolist(), xs.tolist(), ys.tolist(), lat.tolist(), lon.tolist())
+    ]
+    for name, column in columns.items():
+        for marker, value in zip(markers, np.asarray(column).tolist()):
+            marker[name] = value
+    return markers
+
+
+def convert_sim_coords_to_latlon(warehouses):
+    """
+    Map warehouses (objects with warehouse_id/x/y/active, or
+    (warehouse_id, x, y, active) tuples) to marker dicts.
+    """
+    ids, xs, ys, extra = _to_columns(warehouses, 'warehouse_id', ('active',))
+    return map_points(ids, xs, ys, active=np.array(extra['active'], dtype=bool))
+
+
+def project_destinations(shipments):
+    """Markers for shipment destinations; takes Shipment objects or (shipment_id, x, y) tuples."""
+    items = [
+        s if isinstance(s, (tuple, list)) else (s.shipment_id, s.destination_x, s.destination_y)
+        for s in shipments
+    ]
+    ids, xs, ys, _ = _to_columns(items, 'shipment_id', ())
+    return map_points(ids, xs, ys)
+
+
+def project_trucks(trucks):
+    """Markers for truck positions given as (truck_id, x, y) tuples or objects with truck_id/x/y."""
+    ids, xs, ys, _ = _to_columns(trucks, 'truck_id', ())
+    return map_points(ids, xs, ys)
@@ -0,0 +1,371 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Counters and histograms are aggregated per thread: every thread that
+records into a series gets its own cell and only ever writes that cell,
+so the hot path (inc / observe) takes no lock. A scrape sums the cells;
+cells of threads that have exited are folded into a running total so
+per-request threads do not pile up. Gauges hold a single value or are
+read from a function at scrape time (queue depths, connection state).
+
+Histograms use fixed buckets chosen when the metric is defined. Metrics
+are defined once at module level with counter() / gauge() / histogram();
+defining the same name again returns the existing metric.
+
+    REQUESTS = counter('http_requests_total', 'HTTP requests', ('endpoint', 'status'))
+    REQUESTS.labels('amazon.index', '200').inc()
+    with histogram('checkout_seconds', 'Checkout duration').time():
+        ...
+    render()  # text for /metrics
+
+time_statements() is the one SQL statement timer: everything that wants
+per-statement timings (the /metrics histograms, the SQL profiler) adds an
+observer to it instead of listening on the engine itself.
+"""
+import math
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from sqlalchemy import event
+
+# Seconds; from sub-millisecond DB statements to multi-second world round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Shards:
+    """Per-thread cells of `width` numbers; a thread only writes its own cell, readers sum them."""
+    __slots__ = ('width', 'local', 'lock', 'cells', 'retired')
+
+    def __init__(self, width):
+        self.width = width
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.cells = []
+        self.retired = [0.0] * width
+
+    def new_cell(self):
+        cell = [0.0] * self.width
+        with self.lock:
+            self.cells.append((threading.current_thread(), cell))
+        self.local.cell = cell
+        return cell
+
+    def totals(self):
+        with self.lock:
+            totals = list(self.retired)
+            live = []
+            for thread, cell in self.cells:
+                for i, value in enumerate(cell):
+                    totals[i] += value
+                if thread.is_alive():
+                    live.append((thread, cell))
+                else:
+                    # The thread is gone and will not write again
+                    for i, value in enumerate(cell):
+                        self.retired[i] += value
+            self.cells = live
+        return totals
+
+
+class _Timer:
+    __slots__ = ('series', 'started')
+
+    def __init__(self, series):
+        self.series = series
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.series.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _CounterSeries(_Shards):
+    __slots__ = ()
+
+    def __init__(self, _metric):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        try:
+            cell = self.local.cell
+        except AttributeError:
+            cell = self.new_cell()
+        cell[0] += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.totals()[0]
+
+
+class _GaugeSeries:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self, _metric):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = float(value)
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class _HistogramSeries(_Shards):
+    __slots__ = ('metric', 'bounds')
+
+    def __init__(self, metric):
+        self.metric = metric
+        self.bounds = metric.buckets
+        # One count per bucket, one for +Inf, then the sum
+        super().__init__(len(self.bounds) + 2)
+
+    def observe(self, value):
+        try:
+            cell = self.local.cell
+        except AttributeError:
+            cell = self.new_cell()
+        cell[bisect_left(self.bounds, value)] += 1
+        cell[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        totals = self.totals()
+        prefix = labels + ',' if labels else ''
+        cumulative = 0
+        for le, count in zip(self.metric.le_labels, totals):
+            cumulative += count
+            yield f'{name}_bucket', f'{prefix}le="{le}"', cumulative
+        yield f'{name}_sum', labels, totals[-1]
+        yield f'{name}_count', labels, cumulative
+
+
+class Metric:
+    """A metric family: one series per combination of label values."""
+    kind = None
+    series_class = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Label values as passed -> series; rendered label text -> series
+        self.series = {}
+        self.by_text = {}
+        self.lock = threading.Lock()
+        self._default = None if self.labelnames else self.labels()
+
+    def labels(self, *values, **by_name):
+        if by_name:
+            values = tuple(by_name[name] for name in self.labelnames)
+        series = self.series.get(values)
+        if series is None:
+            series = self._add(values)
+        return series
+
+    def _add(self, values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        text = ','.join(f'{name}="{_escape_label(value)}"' for name, value in zip(self.labelnames, values))
+        with self.lock:
+            # 200 and '200' are the same series
+            series = self.by_text.get(text)
+            if series is None:
+                series = self.by_text[text] = self.series_class(self)
+            self.series[values] = series
+        return series
+
+    def collect(self):
+        for text, series in list(self.by_text.items()):
+            yield from series.samples(self.name, text)
+
+
+class Counter(Metric):
+    kind = 'counter'
+    series_class = _CounterSeries
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+    series_class = _GaugeSeries
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.function = None
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set_function(self, function):
+        """
+        Read the gauge at scrape time instead: `function` returns a number,
+        or for a labelled gauge a {label values tuple: number} dict.
+        """
+        self.function = function
+
+    def collect(self):
+        if self.function is None:
+            yield from super().collect()
+            return
+        value = self.function()
+        if not self.labelnames:
+            yield self.name, '', value
+            return
+        for key, item in value.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, ','.join(f'{name}="{_escape_label(part)}"'
+                                      for name, part in zip(self.labelnames, key)), item
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    series_class = _HistogramSeries
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets if bound != math.inf))
+        self.le_labels = tuple(_format_value(bound) for bound in self.buckets + (math.inf,))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return _Timer(self._default)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric_class, name, documentation, labelnames=(), **kwargs):
+        with self.lock:
+            existing = self.metrics.get(name)
+            if existing is not None:
+                if type(existing) is not metric_class or existing.labelnames != tuple(labelnames):
+                    raise ValueError(f"Metric {name} is already defined as a {existing.kind} with labels "
+                                     f"{existing.labelnames}")
+                return existing
+            metric = metric_class(name, documentation, labelnames, **kwargs)
+            self.metrics[name] = metric
+            return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            try:
+                samples = list(metric.collect())
+            except Exception as e:
+                lines.append(f'# {metric.name} not collected: {_escape_help(str(e))}')
+                continue
+            for name, labels, value in samples:
+                if labels:
+                    lines.append(f'{name}{{{labels}}} {_format_value(value)}')
+                else:
+                    lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def counter(name, documentation, labelnames=(), registry=REGISTRY):
+    return registry.register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=(), registry=REGISTRY):
+    return registry.register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+    return registry.register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def render(registry=REGISTRY):
+    return registry.render()
+
+
+_STATEMENT_STARTED_KEY = 'statement_timer_started'
+# engine -> observers of its statements
+_statement_observers = weakref.WeakKeyDictionary()
+
+
+def time_statements(engine, observer):
+    """
+    Call observer(conn, statement, parameters, executemany, seconds) after
+    every statement the engine runs. The engine gets one set of listeners,
+    shared by all of its observers.
+    """
+    observers = _statement_observers.get(engine)
+    if observers is None:
+        observers = _statement_observers[engine] = []
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _statement_failed)
+    if observer not in observers:
+        observers.append(observer)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_STATEMENT_STARTED_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get(_STATEMENT_STARTED_KEY)
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    for observer in _statement_observers.get(conn.engine, ()):
+        observer(conn, statement, parameters, executemany, elapsed)
+
+
+def _statement_failed(context):
+    # after_cursor_execute does not run for a failed statement
+    if context.connection is None or getattr(context, 'cursor', None) is None:
+        return
+    started = context.connection.info.get(_STATEMENT_STARTED_KEY)
+    if started:
+        started.pop()
+
+
+def _format_value(value):
+    if type(value) is int:
+        return str(value)
+    value = float(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
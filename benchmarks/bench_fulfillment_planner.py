@@ -0,0 +1,93 @@
+"""
+Fulfillment planner throughput for a flash-sale burst.
+
+Generates W warehouses with random stock of a few hot products and N
+single-line orders from random destinations, then plans them one by one
+(plan_line, as checkout does) and in one batch (plan_batch). Both start
+from identical stock snapshots and must produce the same allocations.
+
+    python benchmarks/bench_fulfillment_planner.py --orders 20000 --warehouses 500
+"""
+import os
+import sys
+import time
+import copy
+import argparse
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.services.fulfillment_planner import FulfillmentPlanner, ProductStock
+
+
+def build_stock(rng, n_products, n_warehouses, max_units):
+    xy = rng.integers(0, 1000, size=(n_warehouses, 2))
+    stock = {}
+    for product_id in range(1, n_products + 1):
+        holders = rng.choice(n_warehouses, size=max(1, n_warehouses // 4), replace=False)
+        stock[product_id] = ProductStock(holders + 1, xy[holders], rng.integers(1, max_units, size=len(holders)))
+    return stock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--warehouses', type=int, default=500)
+    parser.add_argument('--products', type=int, default=10)
+    parser.add_argument('--max-units', type=int, default=1000)
+    parser.add_argument('--max-quantity', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    stock = build_stock(rng, args.products, args.warehouses, args.max_units)
+    orders = [
+        (i, int(rng.integers(1, args.products + 1)), int(rng.integers(1, args.max_quantity + 1)),
+         float(rng.integers(0, 1000)), float(rng.integers(0, 1000)))
+        for i in range(args.orders)
+    ]
+
+    sequential = FulfillmentPlanner(copy.deepcopy(stock))
+    start = time.perf_counter()
+    one_by_one = {key: sequential.plan_line(product_id, quantity, x, y) for key, product_id, quantity, x, y in orders}
+    sequential_s = time.perf_counter() - start
+
+    batch = FulfillmentPlanner(copy.deepcopy(stock))
+    start = time.perf_counter()
+    batched = batch.plan_batch(orders)
+    batch_s = time.perf_counter() - start
+
+    assert one_by_one == batched, "batch and sequential plans differ"
+
+    planned = [a for a in batched.values() if a]
+    split = [a for a in planned if len(a) > 1]
+    print(f"{args.orders} orders, {args.products} products, {args.warehouses} warehouses")
+    print(f"  filled {len(planned)} ({len(split)} split, max {max((len(a) for a in split), default=1)} shipments), "
+          f"unfillable {args.orders - len(planned)}")
+    print(f"  plan_line loop: {sequential_s * 1e3:8.1f} ms  ({args.orders / sequential_s:9.0f} orders/s)")
+    print(f"  plan_batch:     {batch_s * 1e3:8.1f} ms  ({args.orders / batch_s:9.0f} orders/s)")
+
+    # Exact vs greedy split quality on small candidate sets
+    exact, greedy = FulfillmentPlanner(exact_limit=12), FulfillmentPlanner(exact_limit=0)
+    exact_total = greedy_total = 0.0
+    for _ in range(500):
+        xy = rng.integers(0, 1000, size=(10, 2))
+        units = rng.integers(1, 20, size=10)
+        quantity = int(units.sum() * 0.6)
+        x, y = rng.integers(0, 1000, size=2)
+        for planner, label in ((exact, 'exact'), (greedy, 'greedy')):
+            planner.stock = {1: ProductStock(np.arange(10), xy, units.copy())}
+            allocation = planner.plan_line(1, quantity, x, y)
+            total = sum(np.hypot(*(xy[w] - (x, y))) for w, _ in allocation)
+            if label == 'exact':
+                exact_total += total
+            else:
+                greedy_total += total
+    print(f"  split distance, 500 small cases: exact {exact_total:.0f} vs greedy {greedy_total:.0f} "
+          f"({1 - exact_total / greedy_total:.1%} shorter)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Order fulfillment on delivery: per-shipment ORM loop vs. set-based roll-up.
+
+Seeds O orders with S shipments and L order lines each, then delivers
+every shipment three ways, each on a fresh copy of the data:
+
+  legacy loop     the previous handle_package_delivered (load all shipments
+                  and lines of the order, update them one by one, commit)
+  roll-up         ShipmentService.handle_package_delivered per shipment
+  batch roll-up   ShipmentService.handle_packages_delivered in chunks
+
+and checks that all three leave the same orders and lines fulfilled.
+
+    python benchmarks/bench_fulfillment_rollup.py --orders 5000 --shipments-per-order 2
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from sqlalchemy import insert
+from app import create_app
+from app.model import db, Order, OrderProduct, Shipment, Warehouse
+from app.services.shipment_service import ShipmentService
+
+
+def seed(args):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(Warehouse), [{'warehouse_id': 1, 'x': 0, 'y': 0, 'active': True}])
+    db.session.execute(insert(Order), [
+        {'order_id': o, 'buyer_id': 1, 'total_amount': 10, 'num_products': args.lines_per_order}
+        for o in range(1, args.orders + 1)
+    ])
+    db.session.execute(insert(OrderProduct), [
+        {'order_id': o, 'product_id': line, 'quantity': 1, 'price': 1, 'seller_id': 1}
+        for o in range(1, args.orders + 1) for line in range(1, args.lines_per_order + 1)
+    ])
+    db.session.execute(insert(Shipment), [
+        {'order_id': o, 'warehouse_id': 1, 'destination_x': 1, 'destination_y': 1, 'status': 'delivering'}
+        for o in range(1, args.orders + 1) for _ in range(args.shipments_per_order)
+    ])
+    db.session.commit()
+    return [sid for (sid,) in db.session.query(Shipment.shipment_id).order_by(Shipment.shipment_id)]
+
+
+def legacy_deliver(shipment_id):
+    shipment = Shipment.query.filter_by(shipment_id=shipment_id).first()
+    shipment.status = 'delivered'
+    shipment.updated_at = datetime.now(timezone.utc)
+    all_shipments = Shipment.query.filter_by(order_id=shipment.order_id).all()
+    if all(s.status == 'delivered' for s in all_shipments):
+        order = Order.query.filter_by(order_id=shipment.order_id).first()
+        order.order_status = 'Fulfilled'
+        for item in OrderProduct.query.filter_by(order_id=order.order_id).all():
+            item.status = 'Fulfilled'
+            item.fulfillment_date = datetime.now(timezone.utc)
+    db.session.commit()
+
+
+def outcome():
+    return (
+        db.session.query(Order).filter_by(order_status='Fulfilled').count(),
+        db.session.query(OrderProduct).filter_by(status='Fulfilled').count(),
+        db.session.query(Shipment).filter_by(status='delivered').count()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--shipments-per-order', type=int, default=2)
+    parser.add_argument('--lines-per-order', type=int, default=3)
+    parser.add_argument('--batch', type=int, default=1000, help='shipments per batched roll-up call')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        service = ShipmentService()
+        runs = [
+            ('legacy loop', lambda ids: [legacy_deliver(sid) for sid in ids]),
+            ('roll-up', lambda ids: [service.handle_package_delivered(sid) for sid in ids]),
+            ('batch roll-up', lambda ids: [service.handle_packages_delivered(ids[i:i + args.batch])
+                                           for i in range(0, len(ids), args.batch)]),
+        ]
+        results = []
+        for label, deliver in runs:
+            shipment_ids = seed(args)
+            start = time.perf_counter()
+            deliver(shipment_ids)
+            elapsed = time.perf_counter() - start
+            results.append((label, elapsed, outcome()))
+
+    deliveries = args.orders * args.shipments_per_order
+    expected = (args.orders, args.orders * args.lines_per_order, deliveries)
+    print(f"{deliveries} deliveries over {args.orders} orders "
+          f"({args.shipments_per_order} shipments, {args.lines_per_order} lines each)")
+    for label, elapsed, result in results:
+        assert result == expected, f"{label}: {result} != {expected}"
+        print(f"  {label:<14} {elapsed * 1e3:10.1f} ms   {elapsed / deliveries * 1e6:8.1f} us/delivery")
+    print(f"  all runs fulfilled {expected[0]} orders and {expected[1]} lines")
+
+
+if __name__ == '__main__':
+    main()
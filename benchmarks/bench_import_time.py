@@ -0,0 +1,90 @@
+"""
+Cold-start benchmark: how long does `import app` take in a fresh interpreter?
+
+Runs `python -X importtime -c "import app"` several times, reports the median
+cumulative import time of the `app` package plus the heaviest modules it
+pulled in, and exits non-zero when the median exceeds the budget. It also
+times `create_app()` (no bootstrap, no DB round-trips) separately.
+
+    python benchmarks/bench_import_time.py --budget-ms 300
+"""
+import os
+import re
+import sys
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+CREATE_APP_SNIPPET = (
+    "import time; t = time.perf_counter(); "
+    "from app import create_app; create_app(); "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def importtime(module, env):
+    """Return ({module: cumulative_us}, target_cumulative_us) for one cold import."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=project_root, env=env, capture_output=True, text=True, check=True
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return cumulative, cumulative.get(module, 0)
+
+
+def create_app_ms(env):
+    result = subprocess.run(
+        [sys.executable, '-c', CREATE_APP_SNIPPET],
+        cwd=project_root, env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=300.0, help='fail if the median import exceeds this')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_import_time.db'))
+
+    # First run warms the bytecode cache so we measure import work, not compilation
+    importtime(args.module, env)
+
+    samples = []
+    last = {}
+    for _ in range(args.runs):
+        last, total_us = importtime(args.module, env)
+        samples.append(total_us / 1000)
+    factory_samples = [create_app_ms(env) for _ in range(args.runs)]
+
+    median = statistics.median(samples)
+    print(f"import {args.module}: median {median:.1f} ms, min {min(samples):.1f} ms, max {max(samples):.1f} ms "
+          f"({args.runs} runs, budget {args.budget_ms:.0f} ms)")
+    print(f"create_app(): median {statistics.median(factory_samples):.1f} ms (includes the import)")
+
+    print("\nheaviest modules (cumulative, last run):")
+    heaviest = sorted(last.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    for name, cumulative_us in heaviest:
+        print(f"  {cumulative_us / 1000:>9.1f} ms  {name}")
+
+    if median > args.budget_ms:
+        print(f"\nFAIL: import {args.module} is over budget by {median - args.budget_ms:.1f} ms")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main()
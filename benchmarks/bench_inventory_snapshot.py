@@ -0,0 +1,94 @@
+"""
+Inventory snapshot: incremental upkeep vs. re-running the grouped query.
+
+Seeds an in-memory SQLite database, then replays random arrivals
+(add_product_to_warehouse), picks (remove_product_from_warehouse, which
+deletes emptied listings) and quantity edits. After every commit the
+snapshot is read, and at the end it is compared with a fresh rebuild.
+
+    python benchmarks/bench_inventory_snapshot.py --warehouses 200 --products 50 --events 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from app import create_app, bootstrap_database
+from app.model import db, Warehouse, WarehouseProduct, Product
+from app.services.warehouse_service import WarehouseService
+from app.services.inventory_snapshot import InventorySnapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--warehouses', type=int, default=200)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    app = create_app()
+    with app.app_context():
+        bootstrap_database()
+        db.session.add_all([Product(product_name=f'p{i}', description='', price=1.0, category_id=1, owner_id=1)
+                            for i in range(args.products)])
+        db.session.add_all([Warehouse(x=rnd.randint(0, 100), y=rnd.randint(0, 100), active=True)
+                            for _ in range(args.warehouses)])
+        db.session.commit()
+        db.session.add_all([
+            WarehouseProduct(warehouse_id=w, product_id=p, quantity=rnd.randint(1, 20))
+            for w in range(1, args.warehouses + 1) for p in range(1, args.products + 1) if rnd.random() < 0.3
+        ])
+        db.session.commit()
+
+        snapshot = app.config['INVENTORY_SNAPSHOT']
+        service = WarehouseService()
+        snapshot.all()
+
+        read_s = 0.0
+        for _ in range(args.events):
+            warehouse_id = rnd.randint(1, args.warehouses)
+            product_id = rnd.randint(1, args.products)
+            kind = rnd.random()
+            if kind < 0.4:
+                service.add_product_to_warehouse(warehouse_id, product_id, rnd.randint(1, 10))
+            elif kind < 0.9:
+                listing = WarehouseProduct.query.filter_by(warehouse_id=warehouse_id).first()
+                if listing and listing.quantity > 0:
+                    service.remove_product_from_warehouse(warehouse_id, listing.product_id,
+                                                          rnd.randint(1, listing.quantity))
+            else:
+                listing = WarehouseProduct.query.filter_by(warehouse_id=warehouse_id).first()
+                if listing:
+                    listing.quantity = rnd.randint(0, 30)
+                    db.session.commit()
+            start = time.perf_counter()
+            snapshot.summary(warehouse_id)
+            read_s += time.perf_counter() - start
+
+        incremental = snapshot.all()
+        stats = snapshot.stats()
+        fresh = InventorySnapshot(low_stock_threshold=snapshot.low_stock_threshold)
+        start = time.perf_counter()
+        rebuilt = fresh.all()
+        rebuild_s = time.perf_counter() - start
+        assert incremental == rebuilt, "incremental snapshot drifted from the database"
+
+    low = sum(1 for entry in rebuilt if entry['low_stock'])
+    print(f"{args.warehouses} warehouses, {args.products} products, {args.events} events "
+          f"({stats['deltas_applied']} deltas applied, {stats['rebuilds']} rebuilds)")
+    print(f"  {low} warehouses with low stock; incremental totals match a rebuild")
+    print(f"  summary read after each commit: {read_s / args.events * 1e6:8.1f} us")
+    print(f"  grouped-query rebuild:          {rebuild_s * 1e3:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Coordinate mapping: per-item loop vs. vectorized projection, and the admin map payload.
+
+Part 1 projects N warehouses with the previous getattr/float/try loop and
+with the column API, checking both agree. Part 2 seeds an in-memory
+SQLite database and times building the map payload the old way (one
+products.count() per warehouse), the grouped-query way, and from the cache.
+
+    python benchmarks/bench_mapping.py --warehouses 10000 --db-warehouses 500
+"""
+import os
+import sys
+import time
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from app import create_app, bootstrap_database
+from app.model import db, Warehouse, WarehouseProduct, Product
+from app.utils.mapping import US_BOUNDS, convert_sim_coords_to_latlon, project, project_trucks
+
+
+def loop_mapping(warehouses):
+    # The per-item implementation this module used to have
+    lat_range = US_BOUNDS['max_lat'] - US_BOUNDS['min_lat']
+    lon_range = US_BOUNDS['max_lon'] - US_BOUNDS['min_lon']
+    mapped = []
+    for wh in warehouses:
+        try:
+            sim_x = float(getattr(wh, 'x', 0))
+            sim_y = float(getattr(wh, 'y', 0))
+            clamped_x = max(0.0, min(100.0, sim_x))
+            clamped_y = max(0.0, min(100.0, sim_y))
+            mapped.append({
+                'id': int(getattr(wh, 'warehouse_id', 0)),
+                'x': sim_x,
+                'y': sim_y,
+                'active': bool(getattr(wh, 'active', False)),
+                'lat': US_BOUNDS['max_lat'] - (clamped_y / 100.0) * lat_range,
+                'lon': US_BOUNDS['min_lon'] + (clamped_x / 100.0) * lon_range
+            })
+        except (TypeError, ValueError, AttributeError):
+            continue
+    return mapped
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1e3, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--warehouses', type=int, default=10000)
+    parser.add_argument('--db-warehouses', type=int, default=500)
+    parser.add_argument('--listings', type=int, default=20, help='product listings per warehouse')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    xy = rng.integers(-20, 120, size=(args.warehouses, 2))
+    objects = [SimpleNamespace(warehouse_id=i + 1, x=int(x), y=int(y), active=True) for i, (x, y) in enumerate(xy)]
+    tuples = [(i + 1, int(x), int(y), True) for i, (x, y) in enumerate(xy)]
+
+    loop_ms, expected = timed(lambda: loop_mapping(objects), args.repeat)
+    objects_ms, mapped = timed(lambda: convert_sim_coords_to_latlon(objects), args.repeat)
+    tuples_ms, mapped_tuples = timed(lambda: convert_sim_coords_to_latlon(tuples), args.repeat)
+    for a, b, c in zip(expected, mapped, mapped_tuples):
+        assert a['id'] == b['id'] == c['id'] and a['active'] == b['active'] == c['active']
+        assert abs(a['lat'] - b['lat']) < 1e-9 and abs(a['lon'] - c['lon']) < 1e-9
+    trucks_ms, _ = timed(lambda: project_trucks(tuples), args.repeat)
+    xs, ys = xy[:, 0].astype(float), xy[:, 1].astype(float)
+    project_ms, _ = timed(lambda: project(xs, ys), args.repeat)
+
+    print(f"{args.warehouses} points")
+    print(f"  per-item loop:            {loop_ms:8.2f} ms")
+    print(f"  vectorized (objects):     {objects_ms:8.2f} ms")
+    print(f"  vectorized (tuples):      {tuples_ms:8.2f} ms")
+    print(f"  trucks (tuples):          {trucks_ms:8.2f} ms")
+    print(f"  project() on arrays:      {project_ms:8.2f} ms  (no marker dicts)")
+
+    app = create_app()
+    with app.app_context():
+        bootstrap_database()
+        product_ids = []
+        for i in range(args.listings):
+            product = Product(product_name=f'p{i}', description='', price=1.0, category_id=1, owner_id=1)
+            db.session.add(product)
+            db.session.flush()
+            product_ids.append(product.product_id)
+        for i in range(args.db_warehouses):
+            warehouse = Warehouse(x=int(rng.integers(0, 100)), y=int(rng.integers(0, 100)), active=True)
+            db.session.add(warehouse)
+            db.session.flush()
+            db.session.add_all([WarehouseProduct(warehouse_id=warehouse.warehouse_id, product_id=pid, quantity=5)
+                                for pid in product_ids])
+        db.session.commit()
+
+        map_cache = app.config['WAREHOUSE_MAP_CACHE']
+
+        def old_payload():
+            warehouses = Warehouse.query.filter_by(active=True).all()
+            counts = {wh.warehouse_id: wh.products.count() for wh in warehouses}
+            return convert_sim_coords_to_latlon(warehouses), counts
+
+        snapshot = app.config['INVENTORY_SNAPSHOT']
+
+        def new_payload():
+            map_cache.invalidate()
+            snapshot.invalidate()
+            return map_cache.payload(), snapshot.product_counts()
+
+        repeat = max(1, args.repeat // 4)
+        old_ms, _ = timed(old_payload, repeat)
+
+        build_ms, (_, counts) = timed(new_payload, repeat)
+        assert set(counts.values()) == {args.listings}
+        cached_ms, payload = timed(map_cache.payload, args.repeat * 50)
+        assert len(payload['markers']) == args.db_warehouses
+
+        # A new warehouse drops the cache
+        db.session.add(Warehouse(x=1, y=1, active=True))
+        db.session.commit()
+        assert len(map_cache.payload()['markers']) == args.db_warehouses + 1
+
+    print(f"\nadmin map payload, {args.db_warehouses} warehouses x {args.listings} listings (sqlite)")
+    print(f"  count() per warehouse:     {old_ms:8.2f} ms")
+    print(f"  grouped queries + project: {build_ms:8.2f} ms")
+    print(f"  cached:                    {cached_ms * 1e3:8.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Overhead of app.utils.metrics on the hot paths it instruments.
+
+Part 1 times the primitives per call: Counter.inc, a labelled inc (label
+lookup included), Histogram.observe and a timed block, against an empty
+function call. It does this on one thread and again with T threads
+recording at once, since every thread writes its own cells.
+
+Part 2 requests a cheap page through the Flask test client of an app
+with the metrics blueprint registered (request hooks plus SQL statement
+timing) and one without, alternating rounds, and reports the difference
+per request. On a busy machine that difference is mostly noise, so the
+hooks are also timed on their own: one request's worth of request hooks
+and statement listeners, called directly.
+
+Part 3 times one /metrics render with S labelled series.
+
+    python benchmarks/bench_metrics.py --calls 200000 --threads 4 --requests 500 --rounds 5
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from app.utils.metrics import Registry, Counter, Histogram
+
+
+def per_call(function, calls, threads=1):
+    """Nanoseconds per call, wall clock, with `threads` threads each making `calls` calls."""
+    gate = threading.Barrier(threads + 1)
+
+    def run():
+        gate.wait()
+        for _ in range(calls):
+            function()
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    gate.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (calls * threads) * 1e9
+
+
+def bench_primitives(calls, threads):
+    registry = Registry()
+    plain = registry.register(Counter, 'plain_total', 'plain')
+    labelled = registry.register(Counter, 'labelled_total', 'labelled', ('kind', 'outcome'))
+    latency = registry.register(Histogram, 'latency_seconds', 'latency')
+    timed = registry.register(Histogram, 'timed_seconds', 'timed', ('kind',))
+
+    def timed_block():
+        with timed.labels('topack').time():
+            pass
+
+    cases = (
+        ('empty call', lambda: None),
+        ('counter inc', plain.inc),
+        ('labelled inc', lambda: labelled.labels('topack', 'ok').inc()),
+        ('histogram observe', lambda: latency.observe(0.003)),
+        ('labelled timed block', timed_block),
+    )
+    rows = []
+    for label, function in cases:
+        rows.append((label, per_call(function, calls), per_call(function, calls // threads, threads)))
+
+    expected = calls + (calls // threads) * threads
+    assert plain.labels().totals()[0] == expected, plain.labels().totals()
+    return rows
+
+
+def bench_requests(count, rounds):
+    from app import create_app, bootstrap_database
+
+    clients = []
+    for enabled in (False, True):
+        os.environ['METRICS_ENABLED'] = '1' if enabled else '0'
+        app = create_app()
+        with app.app_context():
+            bootstrap_database()
+        client = app.test_client()
+        for _ in range(50):
+            client.get('/')
+        clients.append(client)
+
+    # Alternate between the two apps and keep each one's best round, so drift hits both alike
+    best = [float('inf'), float('inf')]
+    for _ in range(rounds):
+        for i, client in enumerate(clients):
+            start = time.perf_counter()
+            for _ in range(count):
+                assert client.get('/').status_code == 200
+            best[i] = min(best[i], (time.perf_counter() - start) / count)
+    return best
+
+
+def bench_hooks(count, statements):
+    """Microseconds the request hooks and statement listeners add to one request with `statements` SQL statements."""
+    from types import SimpleNamespace
+    from flask import Flask, Response
+    from app.controllers import metrics_controller
+    from app.utils import metrics
+
+    class Engine:
+        pass
+
+    app = Flask(__name__)
+    conn = SimpleNamespace(info={}, engine=Engine())
+    # What time_statements sets up for a real engine, minus the SQLAlchemy listeners
+    metrics._statement_observers[conn.engine] = [metrics_controller._observe_statement]
+    response = Response('ok')
+    with app.test_request_context('/'):
+        start = time.perf_counter()
+        for _ in range(count):
+            metrics_controller._start_request()
+            for _ in range(statements):
+                metrics._before_cursor_execute(conn, None, None, None, None, False)
+                metrics._after_cursor_execute(conn, None, None, None, None, False)
+            metrics_controller._finish_request(response)
+        return (time.perf_counter() - start) / count * 1e6
+
+
+def bench_render(series):
+    registry = Registry()
+    latency = registry.register(Histogram, 'latency_seconds', 'latency', ('endpoint',))
+    requests = registry.register(Counter, 'requests_total', 'requests', ('endpoint', 'status'))
+    for i in range(series):
+        latency.labels(f'endpoint_{i}').observe(0.01)
+        requests.labels(f'endpoint_{i}', '200').inc()
+    start = time.perf_counter()
+    text = registry.render()
+    return time.perf_counter() - start, len(text.splitlines())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=500, help='requests per round')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--statements', type=int, default=7, help='SQL statements per request for the hook timing')
+    parser.add_argument('--series', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"primitives, ns per call ({args.calls} calls; then {args.threads} threads sharing them)")
+    for label, single, shared in bench_primitives(args.calls, args.threads):
+        print(f"  {label:<22} {single:8.0f} ns   {shared:8.0f} ns with {args.threads} threads")
+
+    without, with_metrics = bench_requests(args.requests, args.rounds)
+    hooks = bench_hooks(args.requests * args.rounds, args.statements)
+    print(f"flask request to '/', best of {args.rounds} rounds of {args.requests} requests")
+    print(f"  without metrics        {without * 1e6:8.1f} us")
+    print(f"  with metrics           {with_metrics * 1e6:8.1f} us   "
+          f"{(with_metrics - without) * 1e6:+.1f} us ({(with_metrics / without - 1) * 100:+.1f}%)")
+    print(f"  hook work alone        {hooks:8.1f} us per request with {args.statements} statements "
+          f"({hooks / (without * 1e6) * 100:.1f}% of the request)")
+
+    elapsed, lines = bench_render(args.series)
+    print(f"render, {args.series} endpoints (histogram + counter each): {elapsed * 1e3:.1f} ms, {lines} lines")
+
+
+if __name__ == '__main__':
+    main()
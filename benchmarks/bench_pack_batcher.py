@@ -0,0 +1,126 @@
+"""
+Packing during a checkout burst against the local fake world: one command per shipment vs. PackBatcher.
+
+T checkout threads each create S shipments at once, spread over W
+warehouses, and request packing for every one the way create_shipment
+does, then wait for all the acks. The world service is real and connected
+to benchmarks/fake_world.py. This runs once per window: 0 is the world
+service's own pack_shipment_async, with one ACommands and one WorldMessage
+commit per shipment; anything else goes through a PackBatcher with that
+window.
+
+For each window it reports packs acked per second, the ack latency seen by
+one shipment (p50 / p99), the frames the world received and the batches
+sent.
+
+    python benchmarks/bench_pack_batcher.py --threads 8 --shipments 50 --warehouses 5 --windows 0,5,20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from fake_world import FakeWorld
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--shipments', type=int, default=50, help='shipments per thread')
+    parser.add_argument('--warehouses', type=int, default=5)
+    parser.add_argument('--windows', default='0,5,20', help='comma-separated batch windows in ms')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    # Packages never become ready during the run; only the packing acks are measured
+    world = FakeWorld(pack_delay=3600)
+    port = world.start()
+
+    db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['WORLD_HOST'] = '127.0.0.1'
+    os.environ['WORLD_PORT'] = str(port)
+
+    from app import create_app, bootstrap_database
+    from app.model import Warehouse
+    from app.services.pack_batcher import PackBatcher
+
+    app = create_app()
+    with app.app_context():
+        bootstrap_database()
+        from app.model import db
+        db.session.add_all([Warehouse(warehouse_id=w, x=w, y=w, active=True) for w in range(1, args.warehouses + 1)])
+        db.session.commit()
+
+        service = app.config['WORLD_SIMULATOR_SERVICE']
+        world_id, result = service.connect(init_warehouses=Warehouse.query.all())
+        assert world_id, result
+
+    items = [{'product_id': 1, 'description': 'Widget', 'quantity': 2}]
+    next_id = iter(range(1, 10 ** 9))
+    results = []
+    for window_ms in [float(w) for w in args.windows.split(',')]:
+        packer = service if window_ms <= 0 else PackBatcher(app, service, window=window_ms / 1e3)
+        latencies = []
+        latency_lock = threading.Lock()
+        start_gate = threading.Barrier(args.threads + 1)
+
+        def checkout(thread_index):
+            shipment_ids = [next(next_id) for _ in range(args.shipments)]
+            with app.app_context():
+                start_gate.wait()
+                sent = []
+                for n, shipment_id in enumerate(shipment_ids):
+                    warehouse_id = (thread_index + n) % args.warehouses + 1
+                    sent.append((time.perf_counter(), packer.pack_shipment_async(warehouse_id, shipment_id, items)))
+                for submitted, future in sent:
+                    assert future.result(timeout=args.timeout) == 'ACK'
+                    done = time.perf_counter()
+                    with latency_lock:
+                        latencies.append(done - submitted)
+
+        threads = [threading.Thread(target=checkout, args=(i,)) for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        frames = world.counts['frames_in']
+        start_gate.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        frames = world.counts['frames_in'] - frames
+
+        total = args.threads * args.shipments
+        assert len(latencies) == total
+        latencies.sort()
+        batches = packer.stats()['batches'] if packer is not service else total
+        results.append((window_ms, total / elapsed, percentile(latencies, 50), percentile(latencies, 99), frames,
+                        batches))
+        if packer is not service:
+            packer.close()
+
+    with app.app_context():
+        service.disconnect()
+        app.config['SHIPMENT_EVENT_LOG'].close()
+    world.stop()
+    os.unlink(db_file)
+
+    print(f"{args.threads} threads x {args.shipments} shipments over {args.warehouses} warehouses")
+    for window_ms, rate, p50, p99, frames, batches in results:
+        label = 'per shipment' if window_ms <= 0 else f'window {window_ms:g} ms'
+        print(f"  {label:<14} {rate:8.0f} packs/s   ack p50 {p50 * 1e3:7.1f} ms   p99 {p99 * 1e3:7.1f} ms   "
+              f"{frames:5d} frames to the world   {batches:5d} pack commands")
+
+
+if __name__ == '__main__':
+    main()
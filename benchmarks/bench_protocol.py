@@ -0,0 +1,443 @@
+"""
+Micro-benchmarks for the world protocol and event processing hot paths.
+
+Each case times one operation many times and reports microseconds per
+operation: the median and min over --samples samples, plus the spread.
+Per-operation setup (resetting rows, re-tracking futures) runs outside
+the timer.
+
+  frame.send.*       WorldSimulatorService.send_protobuf of an ACommands
+                     with 1/10/1000 APacks into a socket that discards the
+                     bytes: serialization, length prefix and the logging
+                     check, at WARNING and at INFO (sampled) logging
+  frame.receive.*    receive_message of one AResponses frame with
+                     1/10/1000 acks from an in-memory socket, plus parsing
+  build.pack.*       pack_shipments_async for 1/10/1000 shipments:
+                     ACommands construction, tracking and queueing, with
+                     the database stubbed out and a queue that drops
+  build.buy.*        buy_products for 1/10/1000 products, the same way
+  dispatch.acks_*    process_response of 1/10/1000 acks for tracked
+                     requests, database stubbed out
+  dispatch.status_*  process_response of 1/10/1000 APackage statuses
+                     answering pending queries
+  event.ready_*      process_response of 1/10/100 APacked against a
+                     scratch SQLite file: the full package_ready
+                     handling with its transition and commit
+  event.arrived_*    process_response of one APurchaseMore with 1/10/100
+                     products arriving, against SQLite
+  webhook.*          validate_message_structure per UPS message type, JSON
+                     decoding plus validation, and a 1/10/1000 event batch
+
+--json PATH writes the results as JSON with stable case names. Use
+--json - for stdout. --compare BASELINE reports each case against an
+earlier JSON file and exits 1 when a median is slower by more than
+--tolerance.
+
+    python benchmarks/bench_protocol.py
+    python benchmarks/bench_protocol.py --filter frame. --samples 9 --json results.json
+    python benchmarks/bench_protocol.py --compare baseline.json --tolerance 0.3
+"""
+import gc
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+# A file, not :memory:, so the shipment event writer thread gets its own connection
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_protocol.db'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+# No UPS here: anything that calls it fails at once instead of waiting on DNS
+os.environ.setdefault('LOG_LEVELS', 'app.services.ups_integration_service=CRITICAL')
+os.environ['HTTP_PROXY'] = 'http://127.0.0.1:9'
+
+from google.protobuf.internal.encoder import _VarintBytes
+
+SIZES = (1, 10, 1000)
+EVENT_SIZES = (1, 10, 100)
+
+
+class NullSocket:
+    def sendall(self, data):
+        pass
+
+
+class ReplaySocket:
+    """Serves the same bytes on every pass, the way receive_message reads a socket."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def rewind(self):
+        self.pos = 0
+
+    def recv(self, n):
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+
+class DropQueue:
+    """Stands in for the CommandQueue: accepts every command and sends nothing."""
+    depth = {}
+
+    def put(self, command, *args, **kwargs):
+        return []
+
+
+class NullSession:
+    def execute(self, *args, **kwargs):
+        pass
+
+    def scalars(self, *args, **kwargs):
+        return []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class NullDB:
+    session = NullSession()
+
+
+def measure(op, setup=None, samples=7, min_time=0.05):
+    """Microseconds per op: (median, min, stdev) over `samples` samples of enough ops to take `min_time`."""
+    def run(count):
+        total = 0.0
+        # Like timeit: collect before, and keep the collector out of the timed part
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(count):
+                if setup is not None:
+                    setup()
+                start = time.perf_counter()
+                op()
+                total += time.perf_counter() - start
+        finally:
+            gc.enable()
+        return total
+
+    count = 1
+    while True:
+        elapsed = run(count)
+        if elapsed >= min_time or count >= 1 << 20:
+            break
+        count = max(count * 2, int(count * min_time / max(elapsed, 1e-9) * 1.2))
+    per_op = [run(count) / count * 1e6 for _ in range(samples)]
+    return statistics.median(per_op), min(per_op), statistics.stdev(per_op) if len(per_op) > 1 else 0.0, count
+
+
+def protocol_cases(service, amazon_pb2):
+    import app.services.world_simulator_service as world_module
+
+    def pack_command(n):
+        command = amazon_pb2.ACommands()
+        for i in range(n):
+            pack = command.topack.add()
+            pack.whnum = 1
+            pack.shipid = i + 1
+            pack.seqnum = i + 1
+            product = pack.things.add()
+            product.id = i + 1
+            product.description = f'Product {i + 1}'
+            product.count = 2
+        command.acks.extend(range(1, n + 1))
+        return command
+
+    # INFO records are formatted and written, to a file that discards them
+    def with_info_logging(op):
+        def run():
+            world_module.logger.setLevel(logging.INFO)
+            world_module.logger.propagate = False
+            world_module.logger.addHandler(devnull)
+            try:
+                op()
+            finally:
+                world_module.logger.removeHandler(devnull)
+                world_module.logger.propagate = True
+                world_module.logger.setLevel(level)
+        level = world_module.logger.level
+        devnull = logging.StreamHandler(open(os.devnull, 'w'))
+        devnull.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        return run
+
+    cases = []
+    service.socket = NullSocket()
+    for n in SIZES:
+        command = pack_command(n)
+        cases.append((f'frame.send.acommands_{n}', lambda command=command: service.send_protobuf(command), None))
+    command = pack_command(10)
+    cases.append(('frame.send.acommands_10.info_logging',
+                  with_info_logging(lambda: service.send_protobuf(command)), None))
+
+    for n in SIZES:
+        response = amazon_pb2.AResponses()
+        response.acks.extend(range(1, n + 1))
+        payload = response.SerializeToString()
+        frame_socket = ReplaySocket(_VarintBytes(len(payload)) + payload)
+
+        def receive(frame_socket=frame_socket):
+            service.socket = frame_socket
+            amazon_pb2.AResponses().ParseFromString(service.receive_message())
+        cases.append((f'frame.receive.aresponses_{n}', receive, frame_socket.rewind))
+
+    def reset_service():
+        service.requests.clear()
+        service.queries.clear()
+        service.unacked.clear()
+        service.purchases = []
+
+    items = [{'product_id': 1, 'description': 'Widget', 'quantity': 2}]
+    for n in SIZES:
+        packs = [(i + 1, items) for i in range(n)]
+        cases.append((f'build.pack.shipments_{n}', lambda packs=packs: service.pack_shipments_async(1, packs),
+                      reset_service))
+    for n in SIZES:
+        lines = [(1 + i % 5, i + 1, f'Product {i + 1}', 3) for i in range(n)]
+        cases.append((f'build.buy.products_{n}', lambda lines=lines: service.buy_products(lines), reset_service))
+
+    for n in SIZES:
+        response = amazon_pb2.AResponses()
+        response.acks.extend(range(1, n + 1))
+
+        def track_all(n=n):
+            reset_service()
+            for seqnum in range(1, n + 1):
+                service._track(seqnum, 'topack', seqnum)
+        cases.append((f'dispatch.acks_{n}', lambda response=response: service.process_response(response), track_all))
+
+    for n in SIZES:
+        response = amazon_pb2.AResponses()
+        for i in range(n):
+            status = response.packagestatus.add()
+            status.packageid = i + 1
+            status.status = 'packed'
+            status.seqnum = 100000 + i
+
+        def query_all(n=n):
+            reset_service()
+            for seqnum in range(1, n + 1):
+                service._track(seqnum, 'query', seqnum)
+        cases.append((f'dispatch.status_{n}', lambda response=response: service.process_response(response), query_all))
+    return cases
+
+
+def event_cases(app, service, amazon_pb2):
+    from sqlalchemy import insert, update
+    from app.model import db, Order, Shipment, Warehouse, Product, ProductCategory, User
+
+    with app.app_context():
+        owner = User.query.first()
+        category = ProductCategory.query.first()
+        db.session.add(Warehouse(warehouse_id=1, x=0, y=0, active=True))
+        db.session.execute(insert(Order), [{'order_id': 1, 'buyer_id': owner.user_id, 'total_amount': 1,
+                                            'num_products': 1}])
+        db.session.execute(insert(Product), [
+            {'product_id': p, 'category_id': category.category_id, 'product_name': f'Product {p}', 'price': 1,
+             'owner_id': owner.user_id}
+            for p in range(1, max(EVENT_SIZES) + 1)
+        ])
+        db.session.execute(insert(Shipment), [
+            {'shipment_id': s, 'order_id': 1, 'warehouse_id': 1, 'destination_x': 1, 'destination_y': 1,
+             'status': 'packing'}
+            for s in range(1, max(EVENT_SIZES) + 1)
+        ])
+        db.session.commit()
+
+    def in_app(op):
+        def run():
+            with app.app_context():
+                op()
+        return run
+
+    def repack(n):
+        def reset():
+            with app.app_context():
+                db.session.execute(update(Shipment).where(Shipment.shipment_id <= n).values(status='packing'))
+                db.session.commit()
+        return reset
+
+    cases = []
+    for n in EVENT_SIZES:
+        response = amazon_pb2.AResponses()
+        for i in range(n):
+            ready = response.ready.add()
+            ready.shipid = i + 1
+            ready.seqnum = 200000 + i
+        cases.append((f'event.ready_{n}', in_app(lambda response=response: service.process_response(response)),
+                      repack(n)))
+    for n in EVENT_SIZES:
+        response = amazon_pb2.AResponses()
+        arrived = response.arrived.add()
+        arrived.whnum = 1
+        arrived.seqnum = 300000 + n
+        for i in range(n):
+            product = arrived.things.add()
+            product.id = i + 1
+            product.description = f'Product {i + 1}'
+            product.count = 5
+        cases.append((f'event.arrived_{n}', in_app(lambda response=response: service.process_response(response)),
+                      None))
+    return cases
+
+
+def webhook_cases():
+    from app.services.amazon_exposed_api import validate_message_structure, BATCH_EVENT_TYPES, BATCH_ID_FIELDS
+
+    def message(message_type, **payload):
+        return {'message_type': message_type, 'timestamp': '2024-01-01T00:00:00', 'sequence_number': 1,
+                'payload': payload}
+
+    messages = {
+        'TruckArrived': message('TruckArrived', truck_id=7, warehouse_id=1, shipment_id=42),
+        'TruckDispatched': message('TruckDispatched', truck_id=7, shipment_id=42),
+        'ShipmentDelivered': message('ShipmentDelivered', shipment_id=42),
+        'PackageDetailRequest': message('PackageDetailRequest', shipment_id=42),
+    }
+    cases = []
+    for message_type, body in messages.items():
+        cases.append((f'webhook.validate.{message_type}',
+                      lambda body=body, message_type=message_type: validate_message_structure(body, message_type), None))
+    raw = json.dumps(messages['TruckArrived'])
+    cases.append(('webhook.json_validate.TruckArrived',
+                  lambda: validate_message_structure(json.loads(raw), 'TruckArrived'), None))
+    for n in SIZES:
+        batch = json.dumps({'message_type': 'Batch', 'timestamp': '2024-01-01T00:00:00',
+                            'events': [messages['TruckArrived']] * n})
+
+        # The per-event part of /api/webhooks/batch, before anything touches the database
+        def validate_batch(batch=batch):
+            valid = []
+            for event in json.loads(batch)['events']:
+                event_type = event.get('message_type')
+                if event_type in BATCH_EVENT_TYPES and validate_message_structure(event, event_type):
+                    payload = dict(event['payload'])
+                    for field in BATCH_ID_FIELDS:
+                        if field in payload:
+                            payload[field] = int(payload[field])
+                    valid.append(payload)
+        cases.append((f'webhook.json_validate.batch_{n}', validate_batch, None))
+    return cases
+
+
+def run(args):
+    from app import create_app, bootstrap_database
+    from app.proto import world_amazon_1_pb2 as amazon_pb2
+    from app.services.world_simulator_service import WorldSimulatorService
+    import app.services.world_simulator_service as world_module
+
+    app = create_app()
+    with app.app_context():
+        bootstrap_database()
+    service = WorldSimulatorService(app=app)
+    service.connected = True
+    service.message_queue = DropQueue()
+
+    groups = [('protocol', lambda: protocol_cases(service, amazon_pb2)),
+              ('event', lambda: event_cases(app, service, amazon_pb2)),
+              ('webhook', webhook_cases)]
+    results = {}
+    for group, build in groups:
+        if args.filter and not any(f in group or group in f.split('.')[0] for f in args.filter):
+            continue
+        # The protocol cases run against a stubbed database; the event cases use the real one
+        real_db = world_module.db
+        if group == 'protocol':
+            world_module.db = NullDB()
+        try:
+            for name, op, setup in build():
+                if args.filter and not any(f in name for f in args.filter):
+                    continue
+                median, best, spread, count = measure(op, setup, args.samples, args.min_time)
+                results[name] = {'median_us': round(median, 3), 'min_us': round(best, 3),
+                                 'stdev_us': round(spread, 3), 'ops_per_sample': count}
+                if not args.quiet:
+                    print(f"  {name:<42} {median:12.2f} us   min {best:12.2f}   +/- {spread:10.2f}",
+                          file=sys.stderr if args.json == '-' else sys.stdout)
+        finally:
+            world_module.db = real_db
+    service.running = False
+    app.config['SHIPMENT_EVENT_LOG'].close()
+    return {
+        'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'protobuf': _protobuf_version()
+        },
+        'unit': 'us',
+        'samples': args.samples,
+        'results': results
+    }
+
+
+def _protobuf_version():
+    from google import protobuf
+    from google.protobuf.internal import api_implementation
+    return f'{protobuf.__version__} ({api_implementation.Type()})'
+
+
+def compare(results, baseline, tolerance):
+    """(case, now, baseline, change) rows plus the cases that got slower than `tolerance` allows."""
+    rows, regressions = [], []
+    for name, base in sorted(baseline['results'].items()):
+        now = results['results'].get(name)
+        if now is None:
+            continue
+        change = now['median_us'] / base['median_us'] - 1 if base['median_us'] else 0.0
+        rows.append((name, now['median_us'], base['median_us'], change))
+        if change > tolerance:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.05, help='seconds of timed work per sample')
+    parser.add_argument('--filter', action='append', help='only cases whose name contains this; repeatable')
+    parser.add_argument('--json', help="write the results as JSON to this file ('-' for stdout)")
+    parser.add_argument('--compare', help='earlier --json output to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative slowdown of a median')
+    parser.add_argument('--quiet', action='store_true', help='no per-case lines')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.tolerance)
+        out = sys.stderr if args.json == '-' else sys.stdout
+        print(f"against {args.compare} (recorded {baseline.get('recorded_at')})", file=out)
+        for name, now, base, change in rows:
+            flag = '  SLOWER' if name in regressions else ''
+            print(f"  {name:<42} {now:12.2f} us   was {base:12.2f}   {change * 100:+7.1f}%{flag}", file=out)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
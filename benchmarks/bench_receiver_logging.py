@@ -0,0 +1,124 @@
+"""
+Receiver-thread throughput under different logging configurations.
+
+Feeds pre-framed AResponses (package status updates, optionally ACKs) to
+WorldSimulatorService.receive_loop over a local socket pair and measures
+frames/s until every frame has been processed. Logs go to a real file
+through the app's logging pipeline.
+
+    python benchmarks/bench_receiver_logging.py --frames 20000
+"""
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_receiver.db'))
+
+from google.protobuf.internal.encoder import _VarintBytes
+from app import create_app, bootstrap_database
+from app.proto import world_amazon_1_pb2 as amazon_pb2
+from app.services.world_simulator_service import WorldSimulatorService
+from app.utils.log_config import configure_logging
+
+# (label, root level, per-message sampling: every Nth)
+CONFIGS = [
+    ('INFO, unsampled', 'INFO', 1),
+    ('INFO, sampled 1/100', 'INFO', 100),
+    ('WARNING', 'WARNING', 100),
+]
+
+
+class CountingService(WorldSimulatorService):
+    def __init__(self, expected, **kwargs):
+        super().__init__(**kwargs)
+        self.expected = expected
+        self.processed = 0
+        self.done = threading.Event()
+
+    def process_response(self, response):
+        super().process_response(response)
+        self.processed += 1
+        if self.processed >= self.expected:
+            self.done.set()
+
+
+def build_frames(n_frames, statuses_per_frame, acks_per_frame):
+    frames = []
+    seqnum = 1
+    for i in range(n_frames):
+        response = amazon_pb2.AResponses()
+        for j in range(statuses_per_frame):
+            status = response.packagestatus.add()
+            status.packageid = i * statuses_per_frame + j
+            status.status = 'packing'
+            status.seqnum = seqnum
+            seqnum += 1
+        for _ in range(acks_per_frame):
+            response.acks.append(seqnum)
+            seqnum += 1
+        payload = response.SerializeToString()
+        frames.append(_VarintBytes(len(payload)) + payload)
+    return b''.join(frames)
+
+
+def run_once(app, stream, n_frames):
+    ours, theirs = socket.socketpair()
+    service = CountingService(n_frames, app=app, host='localhost', port=0)
+    service.socket = ours
+    service.connected = True
+
+    receiver = threading.Thread(target=service.receive_loop, daemon=True)
+    writer = threading.Thread(target=theirs.sendall, args=(stream,), daemon=True)
+
+    start = time.perf_counter()
+    receiver.start()
+    writer.start()
+    service.done.wait()
+    elapsed = time.perf_counter() - start
+
+    service.running = False
+    theirs.close()
+    ours.close()
+    return n_frames / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--statuses-per-frame', type=int, default=4)
+    parser.add_argument('--acks-per-frame', type=int, default=0, help='ACKs hit the database; keep 0 to isolate logging')
+    parser.add_argument('--no-queue', action='store_true', help='log synchronously instead of via QueueListener')
+    args = parser.parse_args()
+
+    app = create_app({
+        'SECRET_KEY': 'bench',
+        'SQLALCHEMY_DATABASE_URI': os.environ['DATABASE_URL'],
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'UPLOAD_FOLDER': tempfile.mkdtemp(),
+        'WORLD_HOST': 'localhost',
+        'WORLD_PORT': 0,
+    })
+    with app.app_context():
+        bootstrap_database()
+
+    stream = build_frames(args.frames, args.statuses_per_frame, args.acks_per_frame)
+    log_path = os.path.join(tempfile.mkdtemp(), 'receiver.log')
+
+    print(f"{args.frames} frames x {args.statuses_per_frame} statuses, "
+          f"{args.acks_per_frame} acks/frame, queue={'off' if args.no_queue else 'on'}")
+    for label, level, sample_every in CONFIGS:
+        configure_logging(level=level, use_queue=not args.no_queue, sample_every=sample_every,
+                          handlers=[logging.FileHandler(log_path)])
+        rate = run_once(app, stream, args.frames)
+        print(f"  {label:<22} {rate:>10.0f} frames/s")
+
+
+if __name__ == '__main__':
+    main()
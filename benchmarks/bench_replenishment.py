@@ -0,0 +1,124 @@
+"""
+Replenishment against the local fake world: per-product buys vs. one batched cycle.
+
+Seeds W warehouses x P products below their reorder points, connects a
+real WorldSimulatorService to benchmarks/fake_world.py, and restocks
+everything three times: one buy_product call per listing (the single
+seller restock route), one buy_products batch awaited through its
+PurchaseHandle, and one ReplenishmentEngine cycle. For each pass it reports
+the time to send, the frames the world received, and the time until every
+arrival has been applied to stock. A dry run is timed as well.
+
+    python benchmarks/bench_replenishment.py --warehouses 20 --products 25
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from fake_world import FakeWorld
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--warehouses', type=int, default=20)
+    parser.add_argument('--products', type=int, default=25)
+    parser.add_argument('--reorder-point', type=int, default=10)
+    parser.add_argument('--target', type=int, default=50)
+    parser.add_argument('--arrive-delay', type=float, default=0.2)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    world = FakeWorld(arrive_delay=args.arrive_delay)
+    port = world.start()
+
+    db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['WORLD_HOST'] = '127.0.0.1'
+    os.environ['WORLD_PORT'] = str(port)
+
+    from app import create_app, bootstrap_database
+    from app.model import db, Warehouse, WarehouseProduct, Product, ReorderPoint
+
+    app = create_app()
+    with app.app_context():
+        bootstrap_database()
+        db.session.add_all([Product(product_name=f'Widget {i}', description='', price=1.0, category_id=1, owner_id=1)
+                            for i in range(args.products)])
+        db.session.add_all([Warehouse(warehouse_id=w, x=w, y=w, active=True) for w in range(1, args.warehouses + 1)])
+        db.session.commit()
+        pairs = [(w, p) for w in range(1, args.warehouses + 1) for p in range(1, args.products + 1)]
+        db.session.add_all([ReorderPoint(warehouse_id=w, product_id=p, reorder_point=args.reorder_point,
+                                         target_level=args.target) for w, p in pairs])
+        db.session.commit()
+
+        service = app.config['WORLD_SIMULATOR_SERVICE']
+        engine = app.config['REPLENISHMENT_ENGINE']
+        world_id, result = service.connect(init_warehouses=Warehouse.query.all())
+        assert world_id, result
+
+        def reset_stock():
+            db.session.query(WarehouseProduct).delete()
+            db.session.add_all([WarehouseProduct(warehouse_id=w, product_id=p, quantity=(w + p) % args.reorder_point)
+                                for w, p in pairs])
+            db.session.commit()
+
+        def wait_restocked():
+            deadline = time.perf_counter() + args.timeout
+            while time.perf_counter() < deadline:
+                db.session.expire_all()
+                below = db.session.query(WarehouseProduct)\
+                                  .filter(WarehouseProduct.quantity < args.reorder_point).count()
+                if below == 0:
+                    return True
+                time.sleep(0.05)
+            return False
+
+        def run_pass(label, send):
+            reset_stock()
+            frames_before = world.counts['frames_in']
+            start = time.perf_counter()
+            send()
+            sent_s = time.perf_counter() - start
+            # Commands are written by the sender thread; wait until the queue drains
+            service.message_queue.join()
+            assert wait_restocked(), f"{label}: not restocked within {args.timeout}s"
+            total_s = time.perf_counter() - start
+            frames = world.counts['frames_in'] - frames_before
+            print(f"  {label:<22} send {sent_s * 1e3:9.1f} ms   restocked {total_s * 1e3:9.1f} ms   "
+                  f"frames to world {frames:>6}")
+
+        dry_start = time.perf_counter()
+        reset_stock()
+        _, report = engine.run_cycle(dry_run=True)
+        dry_ms = (time.perf_counter() - dry_start) * 1e3
+        assert report['shortfalls'] == len(pairs) and not report['sent']
+
+        print(f"{args.warehouses} warehouses x {args.products} products = {len(pairs)} listings below reorder point")
+        print(f"  {'dry run (plan only)':<22} {dry_ms:9.1f} ms   {report['units']} units planned")
+
+        def per_product():
+            for item in engine.plan():
+                service.buy_product(item['warehouse_id'], item['product_id'], item['description'], item['quantity'])
+
+        def batched():
+            success, handle = service.buy_products(engine.plan())
+            assert success, handle
+            assert handle.wait(args.timeout), f"{handle.outstanding_units()} units never arrived"
+
+        run_pass('buy_product per item', per_product)
+        run_pass('buy_products + wait', batched)
+        run_pass('replenishment cycle', engine.run_cycle)
+
+        service.disconnect()
+    world.stop()
+    os.unlink(db_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Shipment event log: batched writer and vectorized latency percentiles.
+
+Part 1 writes E events to shipment_events one INSERT + COMMIT at a time
+(what an inline write in every handler costs) and through ShipmentEventLog
+(buffered, one bulk INSERT per flush).
+
+Part 2 generates full lifecycles for S shipments over W warehouses and
+computes per-stage, per-warehouse percentiles twice: a plain Python pass
+(dict per shipment, sorted lists, interpolated percentiles) and
+shipment_analytics.latency_report. Both must agree.
+
+    python benchmarks/bench_shipment_events.py --events 20000 --shipments 50000 --warehouses 20
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from sqlalchemy import insert
+from app import create_app
+from app.model import db, Order, Shipment, ShipmentEvent, Warehouse
+from app.services.shipment_analytics import STAGES, EventColumns, latency_report
+
+PERCENTILES = (50, 90, 95, 99)
+LIFECYCLE = (('created', 0), ('packed', 40), ('truck_arrived', 30), ('loading', 20), ('loaded', 5),
+             ('delivering', 2), ('delivered', 300))
+
+
+def seed(shipments, warehouses):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(Warehouse), [{'warehouse_id': w, 'x': w, 'y': w, 'active': True}
+                                           for w in range(1, warehouses + 1)])
+    db.session.execute(insert(Order), [{'order_id': 1, 'buyer_id': 1, 'total_amount': 1, 'num_products': 1}])
+    db.session.execute(insert(Shipment), [
+        {'order_id': 1, 'warehouse_id': s % warehouses + 1, 'destination_x': 1, 'destination_y': 1}
+        for s in range(shipments)
+    ])
+    db.session.commit()
+
+
+def bench_writer(app, count):
+    rows = [{'shipment_id': i % 100 + 1, 'event': 'packed', 'truck_id': None, 'occurred_at': datetime.utcnow()}
+            for i in range(count)]
+    start = time.perf_counter()
+    for row in rows:
+        db.session.add(ShipmentEvent(**row))
+        db.session.commit()
+    inline = time.perf_counter() - start
+
+    event_log = app.config['SHIPMENT_EVENT_LOG']
+    start = time.perf_counter()
+    for i in range(0, count, 50):
+        event_log.record(rows[i:i + 50])
+    event_log.flush()
+    batched = time.perf_counter() - start
+    return inline, batched
+
+
+def synthetic_columns(shipments, warehouses, rng):
+    base = datetime(2026, 1, 1).timestamp()
+    shipment_ids, warehouse_ids, events, times = [], [], [], []
+    for shipment_id in range(1, shipments + 1):
+        at = base + rng.uniform(0, 86400)
+        # Slower warehouses have a longer tail
+        scale = 1 + (shipment_id % warehouses) / warehouses
+        for event, mean in LIFECYCLE:
+            at += rng.expovariate(1 / mean) * scale if mean else 0
+            shipment_ids.append(shipment_id)
+            warehouse_ids.append(shipment_id % warehouses + 1)
+            events.append(event)
+            times.append(at)
+    return shipment_ids, warehouse_ids, events, times
+
+
+def percentile(sorted_values, p):
+    position = (len(sorted_values) - 1) * p / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def python_report(shipment_ids, warehouse_ids, events, times):
+    first = {}
+    warehouse_of = {}
+    for shipment_id, warehouse_id, event, at in zip(shipment_ids, warehouse_ids, events, times):
+        reached = first.setdefault(shipment_id, {})
+        if event not in reached or at < reached[event]:
+            reached[event] = at
+        warehouse_of[shipment_id] = warehouse_id
+    stages = {}
+    for stage, (begin, end) in STAGES.items():
+        by_warehouse = {}
+        for shipment_id, reached in first.items():
+            if begin in reached and end in reached and reached[end] >= reached[begin]:
+                by_warehouse.setdefault(warehouse_of[shipment_id], []).append(reached[end] - reached[begin])
+        stages[stage] = {warehouse_id: {f'p{p}': round(percentile(sorted(values), p), 3) for p in PERCENTILES}
+                         for warehouse_id, values in by_warehouse.items()}
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=20000, help='events for the writer comparison')
+    parser.add_argument('--shipments', type=int, default=50000, help='shipments for the percentile comparison')
+    parser.add_argument('--warehouses', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        seed(100, args.warehouses)
+        inline, batched = bench_writer(app, args.events)
+    print(f"writer, {args.events} events")
+    print(f"  insert + commit each  {inline * 1e3:9.1f} ms   {args.events / inline:10.0f} events/s")
+    print(f"  ShipmentEventLog      {batched * 1e3:9.1f} ms   {args.events / batched:10.0f} events/s")
+
+    raw = synthetic_columns(args.shipments, args.warehouses, random.Random(args.seed))
+    start = time.perf_counter()
+    expected = python_report(*raw)
+    python_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns = EventColumns(*raw)
+    report = latency_report(columns=columns, percentiles=PERCENTILES)
+    numpy_elapsed = time.perf_counter() - start
+
+    for stage, by_warehouse in expected.items():
+        got = report['stages'][stage]['warehouses']
+        for warehouse_id, values in by_warehouse.items():
+            for key, value in values.items():
+                assert abs(got[warehouse_id][key] - value) <= 1e-3, (stage, warehouse_id, key, got[warehouse_id][key], value)
+
+    print(f"percentiles, {len(columns)} events, {args.shipments} shipments, {args.warehouses} warehouses, "
+          f"{len(STAGES)} stages")
+    print(f"  python loop           {python_elapsed * 1e3:9.1f} ms")
+    print(f"  numpy (analytics)     {numpy_elapsed * 1e3:9.1f} ms   {python_elapsed / numpy_elapsed:6.1f}x")
+    print(f"  results match; end_to_end p50/p99 overall: {report['stages']['end_to_end']['all']['p50']:.1f} s / "
+          f"{report['stages']['end_to_end']['all']['p99']:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
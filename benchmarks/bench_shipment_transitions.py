@@ -0,0 +1,99 @@
+"""
+Shipment status updates: ORM load-modify-commit vs. compare-and-set transitions.
+
+Seeds N packing shipments and drives each one through
+packed -> loading -> loaded -> delivering, then replays every event once
+more out of order (duplicates and late packed/loading events, as the world
+and UPS deliver them). Three ways, each on fresh data:
+
+  load-modify     query the row, assign status, commit (the old handlers)
+  cas             shipment_transitions.transition per event, commit
+  cas batch       shipment_transitions.transition_many per event type
+
+Reports events/s and how many shipments ended in a regressed state.
+
+    python benchmarks/bench_shipment_transitions.py --shipments 5000
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from sqlalchemy import insert
+from app import create_app
+from app.model import db, Order, Shipment, Warehouse
+from app.services.shipment_transitions import transition, transition_many
+
+LIFECYCLE = ('packed', 'loading', 'loaded', 'delivering')
+# Replayed after the lifecycle: duplicates plus stale events that must not regress anything
+REPLAY = ('loaded', 'packed', 'delivering', 'loading')
+
+
+def seed(count):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(Warehouse), [{'warehouse_id': 1, 'x': 0, 'y': 0, 'active': True}])
+    db.session.execute(insert(Order), [{'order_id': 1, 'buyer_id': 1, 'total_amount': 1, 'num_products': 1}])
+    db.session.execute(insert(Shipment), [
+        {'order_id': 1, 'warehouse_id': 1, 'destination_x': 1, 'destination_y': 1, 'status': 'packing'}
+        for _ in range(count)
+    ])
+    db.session.commit()
+    return [sid for (sid,) in db.session.query(Shipment.shipment_id).order_by(Shipment.shipment_id)]
+
+
+def load_modify(shipment_id, status):
+    shipment = Shipment.query.filter_by(shipment_id=shipment_id).first()
+    shipment.status = status
+    shipment.updated_at = datetime.now(timezone.utc)
+    db.session.commit()
+
+
+def cas(shipment_id, status):
+    transition(shipment_id, status)
+    db.session.commit()
+
+
+def regressed():
+    return db.session.query(Shipment).filter(Shipment.status != 'delivering').count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shipments', type=int, default=5000)
+    args = parser.parse_args()
+
+    def per_event(apply):
+        return lambda ids: [apply(sid, status) for status in LIFECYCLE + REPLAY for sid in ids]
+
+    def batched(ids):
+        for status in LIFECYCLE + REPLAY:
+            transition_many(ids, status)
+            db.session.commit()
+
+    app = create_app()
+    with app.app_context():
+        results = []
+        for label, run in (('load-modify', per_event(load_modify)), ('cas', per_event(cas)), ('cas batch', batched)):
+            ids = seed(args.shipments)
+            start = time.perf_counter()
+            run(ids)
+            elapsed = time.perf_counter() - start
+            results.append((label, elapsed, regressed()))
+
+    events = args.shipments * (len(LIFECYCLE) + len(REPLAY))
+    print(f"{args.shipments} shipments, {events} status events ({len(REPLAY)} replayed per shipment)")
+    for label, elapsed, bad in results:
+        print(f"  {label:<12} {elapsed * 1e3:10.1f} ms   {events / elapsed:10.0f} events/s   "
+              f"{bad} shipments regressed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Loading a truck against the local fake world: one command per shipment vs. one batch.
+
+Seeds N packed shipments in one warehouse, connects a real
+WorldSimulatorService to benchmarks/fake_world.py and loads them onto a
+truck three ways, each on fresh shipments:
+
+  blocking     load_shipment per shipment, waiting for each ack (the
+               original handle_truck_arrived)
+  async        load_shipment_async per shipment, all in flight at once
+  coordinator  TruckLoadingCoordinator.load_truck: one claim UPDATE, one
+               ACommands with every APutOnTruck, one TruckLoad to wait on
+
+Each mode runs --rounds times on fresh shipments; the median round reports
+the time until every shipment is 'loaded' in the
+database and the frames the world received from the app (commands and
+acks).
+
+    python benchmarks/bench_truck_loading.py --shipments 30 --load-delay 0.05
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from fake_world import FakeWorld
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shipments', type=int, default=30)
+    parser.add_argument('--load-delay', type=float, default=0.05)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    world = FakeWorld(load_delay=args.load_delay)
+    port = world.start()
+
+    db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # There is no UPS here. Its loaded notifications go through a proxy that refuses at once, so they
+    # fail fast and quietly instead of waiting on DNS for the UPS host
+    os.environ.setdefault('LOG_LEVELS', 'app.services.ups_integration_service=CRITICAL')
+    os.environ['HTTP_PROXY'] = 'http://127.0.0.1:9'
+    os.environ['WORLD_HOST'] = '127.0.0.1'
+    os.environ['WORLD_PORT'] = str(port)
+
+    from sqlalchemy import insert
+    from app import create_app, bootstrap_database
+    from app.model import db, Order, Shipment, Warehouse
+    from app.services.truck_loading import TruckLoadingCoordinator
+
+    app = create_app()
+    with app.app_context():
+        bootstrap_database()
+        db.session.add(Warehouse(warehouse_id=1, x=0, y=0, active=True))
+        db.session.execute(insert(Order), [{'order_id': 1, 'buyer_id': 1, 'total_amount': 1, 'num_products': 1}])
+        db.session.commit()
+
+        service = app.config['WORLD_SIMULATOR_SERVICE']
+        world_id, result = service.connect(init_warehouses=Warehouse.query.all())
+        assert world_id, result
+
+        def seed():
+            first = (db.session.query(db.func.max(Shipment.shipment_id)).scalar() or 0) + 1
+            db.session.execute(insert(Shipment), [
+                {'shipment_id': first + i, 'order_id': 1, 'warehouse_id': 1, 'destination_x': 1,
+                 'destination_y': 1, 'status': 'packed'}
+                for i in range(args.shipments)
+            ])
+            db.session.commit()
+            return list(range(first, first + args.shipments))
+
+        def wait_loaded(shipment_ids):
+            deadline = time.perf_counter() + args.timeout
+            while time.perf_counter() < deadline:
+                db.session.expire_all()
+                done = db.session.query(Shipment).filter(Shipment.shipment_id.in_(shipment_ids),
+                                                         Shipment.status == 'loaded').count()
+                if done == len(shipment_ids):
+                    return True
+                time.sleep(0.005)
+            return False
+
+        def claim(shipment_ids, truck_id):
+            db.session.query(Shipment).filter(Shipment.shipment_id.in_(shipment_ids))\
+                      .update({'status': 'loading', 'truck_id': truck_id}, synchronize_session=False)
+            db.session.commit()
+
+        def blocking(shipment_ids, truck_id):
+            claim(shipment_ids, truck_id)
+            for shipment_id in shipment_ids:
+                success, result = service.load_shipment(1, truck_id, shipment_id)
+                assert success, result
+
+        def per_shipment_async(shipment_ids, truck_id):
+            claim(shipment_ids, truck_id)
+            futures = [service.load_shipment_async(1, truck_id, shipment_id) for shipment_id in shipment_ids]
+            for future in futures:
+                future.result(timeout=args.timeout)
+
+        def coordinator(shipment_ids, truck_id):
+            success, load = TruckLoadingCoordinator(service).load_truck(truck_id, 1)
+            assert success and set(load.shipment_ids) == set(shipment_ids), load
+            return load
+
+        modes = (('blocking', blocking), ('async', per_shipment_async), ('coordinator', coordinator))
+        results = {label: [] for label, _ in modes}
+        truck_id = 0
+        for _ in range(args.rounds):
+            for label, run in modes:
+                truck_id += 1
+                shipment_ids = seed()
+                frames = world.counts['frames_in']
+                start = time.perf_counter()
+                load = run(shipment_ids, truck_id)
+                sent = time.perf_counter() - start
+                assert wait_loaded(shipment_ids), f"{label}: shipments not loaded within {args.timeout}s"
+                elapsed = time.perf_counter() - start
+                if load is not None:
+                    # Settles after the UPS notifications, which are not part of the comparison
+                    assert load.wait(args.timeout) and not load.summary()['failed'], load.summary()
+                # The receiver handles responses in order: once a query comes back, this mode's backlog
+                # is not left for the next one
+                assert service.query_package(shipment_ids[-1], timeout=args.timeout)[0]
+                results[label].append((elapsed, sent, world.counts['frames_in'] - frames))
+
+        service.disconnect()
+        app.config['SHIPMENT_EVENT_LOG'].close()
+    world.stop()
+    os.unlink(db_file)
+
+    print(f"{args.shipments} shipments onto one truck, world load delay {args.load_delay * 1e3:.0f} ms")
+    print(f"median of {args.rounds} rounds")
+    for label, runs in results.items():
+        elapsed, sent, frames = sorted(runs)[len(runs) // 2]
+        print(f"  {label:<12} send {sent * 1e3:8.1f} ms   all loaded {elapsed * 1e3:8.1f} ms   "
+              f"{frames:4d} frames to the world")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Requests/second for an authenticated page with and without the user identity cache.
+
+    python benchmarks/bench_user_loader.py [--requests 2000] [--path /profile]
+
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_user_loader.db')
+
+from app import create_app, bootstrap_database
+from app.model import db, User
+
+
+def build_app(cache_ttl):
+    app = create_app({
+        'SECRET_KEY': 'bench',
+        'SQLALCHEMY_DATABASE_URI': os.environ['DATABASE_URL'],
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'UPLOAD_FOLDER': tempfile.mkdtemp(),
+        'WORLD_HOST': 'localhost',
+        'WORLD_PORT': 23456,
+        'USER_CACHE_TTL': cache_ttl,
+    })
+    with app.app_context():
+        bootstrap_database()
+    return app
+
+
+def ensure_user(app):
+    with app.app_context():
+        user = User.query.filter_by(email='bench@example.com').first()
+        if not user:
+            user = User(email='bench@example.com', first_name='Bench', last_name='User', is_seller=False)
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+        return user.user_id
+
+
+def run(app, user_id, path, n_requests):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    # Warm up templates, connection pool and (when enabled) the cache
+    for _ in range(20):
+        client.get(path)
+
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+    elapsed = time.perf_counter() - start
+    return n_requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--path', default='/profile')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    uncached_app = build_app(cache_ttl=0)
+    cached_app = build_app(cache_ttl=30)
+    user_id = ensure_user(cached_app)
+
+    before = run(uncached_app, user_id, args.path, args.requests)
+    after = run(cached_app, user_id, args.path, args.requests)
+
+    print(f"GET {args.path} x {args.requests}")
+    print(f"  without identity cache: {before:10.1f} req/s")
+    print(f"  with identity cache:    {after:10.1f} req/s  ({after / before:.2f}x)")
+    print(f"  cache stats: {cached_app.config['USER_IDENTITY_CACHE'].stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Nearest-warehouse lookup at scale: k-d tree vs. NumPy scan vs. SQL ORDER BY.
+
+Builds N random warehouses (default 10k), checks the tree against brute
+force, then reports microseconds per query with no stock filter and with
+stock held by 1%, 10% and 50% of warehouses.
+
+    python benchmarks/bench_warehouse_routing.py --warehouses 10000
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.utils.kdtree import KDTree
+
+
+def per_query_us(fn, queries):
+    start = time.perf_counter()
+    for x, y in queries:
+        fn(x, y)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--warehouses', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--sql-queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    ids = np.arange(1, args.warehouses + 1)
+    points = rng.integers(0, 1000, size=(args.warehouses, 2))
+    queries = [tuple(q) for q in rng.integers(0, 1000, size=(args.queries, 2)).astype(float).tolist()]
+
+    start = time.perf_counter()
+    tree = KDTree(ids, points)
+    print(f"{args.warehouses} warehouses, tree built in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    xs, ys = points[:, 0].astype(float), points[:, 1].astype(float)
+
+    def brute(x, y, subset=None):
+        px, py = (xs, ys) if subset is None else (xs[subset], ys[subset])
+        d2 = (px - x) ** 2 + (py - y) ** 2
+        return float(d2.min())
+
+    for x, y in queries[:500]:
+        _, d2 = tree.nearest(x, y)
+        assert d2 == brute(x, y), (x, y)
+
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE warehouses (warehouse_id INTEGER PRIMARY KEY, x INTEGER, y INTEGER, active BOOLEAN)"))
+        conn.execute(text("INSERT INTO warehouses VALUES (:id, :x, :y, 1)"),
+                     [{'id': int(i), 'x': int(p[0]), 'y': int(p[1])} for i, p in zip(ids, points)])
+    sql = text("SELECT warehouse_id FROM warehouses WHERE active "
+               "ORDER BY (x - :x) * (x - :x) + (y - :y) * (y - :y) LIMIT 1")
+    with engine.connect() as conn:
+        sql_us = per_query_us(lambda x, y: conn.execute(sql, {'x': x, 'y': y}).first(), queries[:args.sql_queries])
+
+    print(f"\n{'query':<34} {'us/query':>10}")
+    print(f"{'SQL ORDER BY (sqlite, in-memory)':<34} {sql_us:>10.1f}")
+    print(f"{'NumPy scan':<34} {per_query_us(brute, queries):>10.1f}")
+    print(f"{'k-d tree':<34} {per_query_us(tree.nearest, queries):>10.1f}")
+    print("\nnearest with stock (engine picks scan or masked tree walk):")
+
+    for share in (0.01, 0.10, 0.50):
+        stocked = rng.choice(ids, size=max(1, int(args.warehouses * share)), replace=False)
+        stocked_ids = stocked.tolist()
+        subset = stocked - 1
+        for x, y in queries[:200]:
+            assert tree.nearest(x, y, tree.positions_for(stocked_ids))[1] == brute(x, y, subset)
+        # Includes mapping the candidate id list to tree positions, as the router does per request
+        routed_us = per_query_us(lambda x, y: tree.nearest(x, y, tree.positions_for(stocked_ids)), queries)
+        print(f"{f'stock in {share:.0%} ({len(stocked_ids)} ids)':<34} {routed_us:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
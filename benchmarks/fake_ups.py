@@ -0,0 +1,218 @@
+"""
+Local stand-in for the UPS service, both directions.
+
+Serves the endpoints UPSIntegrationService posts to (point UPS_URL at
+`url`): ShipmentCreated is acknowledged with status success, ShipmentLoaded
+and status requests likewise. Like the real UPS it then calls the app
+back. `truck_delay` seconds after a shipment is created it posts
+TruckArrived to /api/webhooks/truck-arrived. `deliver_delay` seconds after
+the shipment is reported loaded it posts ShipmentDelivered to
+/api/webhooks/shipment-delivered.
+
+Every callback's round trip and status is recorded per webhook, and so is
+the time each shipment was created, loaded and delivered, so load tests
+can report webhook latency and fulfillment time. Callbacks are sent from
+a small pool of threads, in schedule order.
+
+Import FakeUPS from benchmarks, or run it standalone against a running app:
+
+    python benchmarks/fake_ups.py --port 8081 --app-url http://127.0.0.1:8080
+"""
+import json
+import time
+import heapq
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+WEBHOOKS = {
+    'TruckArrived': '/api/webhooks/truck-arrived',
+    'ShipmentDelivered': '/api/webhooks/shipment-delivered',
+}
+
+
+class FakeUPS:
+    def __init__(self, app_url=None, host='127.0.0.1', port=0, truck_delay=0.05, deliver_delay=0.05, workers=4):
+        self.app_url = app_url.rstrip('/') if app_url else None
+        self.host = host
+        self.port = port
+        self.truck_delay = truck_delay
+        self.deliver_delay = deliver_delay
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.events = []
+        # message type -> [(seconds, ok)] for the callbacks into the app
+        self.webhooks = {message_type: [] for message_type in WEBHOOKS}
+        # shipment_id -> perf_counter() when UPS heard of it / was told it is loaded / reported it delivered
+        self.created = {}
+        self.loaded = {}
+        self.delivered = {}
+        self.warehouses = {}
+        self.next_truck_id = 1
+        self.running = False
+        self.server = None
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fake-ups')
+        self.local = threading.local()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/api'
+
+    def start(self):
+        ups = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    message = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    message = None
+                status, body = ups._handle(self.path, message)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.running = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._event_loop, daemon=True).start()
+        return self.port
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.wake.notify()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _reply(self, status='success', **payload):
+        return 200, {
+            'message_type': 'Acknowledgement',
+            'timestamp': datetime.utcnow().isoformat(),
+            'payload': dict(payload, status=status)
+        }
+
+    def _handle(self, path, message):
+        if not isinstance(message, dict) or not isinstance(message.get('payload'), dict):
+            self.counts['bad_requests'] += 1
+            return 400, {'message_type': 'Error', 'payload': {'status': 'fail', 'message': 'Invalid message'}}
+        payload = message['payload']
+        now = time.perf_counter()
+        endpoint = path.rstrip('/').rsplit('/', 1)[-1]
+        self.counts[endpoint] += 1
+
+        if endpoint == 'shipment':
+            shipment_id = payload.get('shipment_id')
+            with self.lock:
+                self.created[shipment_id] = now
+                self.warehouses[shipment_id] = payload.get('warehouse_id')
+                truck_id = self.next_truck_id
+                self.next_truck_id += 1
+            self._schedule(self.truck_delay, 'TruckArrived', {
+                'truck_id': truck_id,
+                'warehouse_id': payload.get('warehouse_id'),
+                'shipment_id': shipment_id
+            })
+            return self._reply(ups_tracking_id=f'UPS{shipment_id}')
+        if endpoint == 'shipment_loaded':
+            shipment_id = payload.get('shipment_id')
+            with self.lock:
+                self.loaded.setdefault(shipment_id, now)
+            self._schedule(self.deliver_delay, 'ShipmentDelivered', {'shipment_id': shipment_id})
+            return self._reply()
+        if endpoint == 'shipment_status':
+            shipment_id = payload.get('shipment_id')
+            status = 'delivered' if shipment_id in self.delivered else 'in_transit'
+            return self._reply(shipment_id=shipment_id, shipment_status=status)
+        return self._reply()
+
+    def _schedule(self, delay, message_type, payload):
+        if not self.app_url:
+            return
+        with self.lock:
+            heapq.heappush(self.events, (time.monotonic() + delay, self.counts['scheduled'], message_type, payload))
+            self.counts['scheduled'] += 1
+            self.wake.notify()
+
+    def _event_loop(self):
+        while True:
+            with self.lock:
+                while self.running and not (self.events and self.events[0][0] <= time.monotonic()):
+                    self.wake.wait(self.events[0][0] - time.monotonic() if self.events else None)
+                if not self.running:
+                    return
+                _, _, message_type, payload = heapq.heappop(self.events)
+            self.pool.submit(self._call_app, message_type, payload)
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def _call_app(self, message_type, payload):
+        message = {
+            'message_type': message_type,
+            'timestamp': datetime.utcnow().isoformat(),
+            'sequence_number': self.counts['sent'],
+            'payload': payload
+        }
+        self.counts['sent'] += 1
+        start = time.perf_counter()
+        try:
+            response = self._session().post(f'{self.app_url}{WEBHOOKS[message_type]}', json=message, timeout=30)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        done = time.perf_counter()
+        with self.lock:
+            self.webhooks[message_type].append((done - start, ok))
+            if ok and message_type == 'ShipmentDelivered':
+                self.delivered.setdefault(payload['shipment_id'], done)
+        self.counts[f'{message_type}_ok' if ok else f'{message_type}_failed'] += 1
+
+    def outstanding(self):
+        """Shipments UPS has heard of that it has not delivered yet."""
+        with self.lock:
+            return len(self.created) - len(self.delivered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--app-url', default='http://127.0.0.1:8080', help='where to send the webhooks')
+    parser.add_argument('--truck-delay', type=float, default=0.5)
+    parser.add_argument('--deliver-delay', type=float, default=0.5)
+    args = parser.parse_args()
+
+    ups = FakeUPS(args.app_url, args.host, args.port, args.truck_delay, args.deliver_delay)
+    ups.start()
+    print(f"Fake UPS listening on {ups.url}, calling back {args.app_url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(dict(ups.counts))
+    except KeyboardInterrupt:
+        ups.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+Local stand-in for the world simulator's Amazon port.
+
+Speaks the same varint-framed protobuf protocol as the real server:
+answers AConnect with AConnected, acks every command seqnum, and later
+reports APurchaseMore arrivals, APacked, ALoaded and APackage statuses
+with its own seqnums. Those are re-sent until the client acks them, like
+the real world does. Delays are configurable, and every command type
+and frame is counted so benchmarks can assert on the traffic. Outages can
+be simulated with drop_client(), `accepting = False` (refuse sessions) and
+`swallow = True` (read commands but never ack them).
+
+Import FakeWorld from benchmarks, or run it standalone:
+
+    python benchmarks/fake_world.py --port 23456 --arrive-delay 0.5
+"""
+import os
+import sys
+import time
+import heapq
+import socket
+import argparse
+import threading
+from collections import Counter
+
+from google.protobuf.internal.encoder import _VarintBytes
+from google.protobuf.internal.decoder import _DecodeVarint32
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.proto import world_amazon_1_pb2 as amazon_pb2
+
+
+def read_frame(sock):
+    buf = b''
+    while True:
+        chunk = sock.recv(1)
+        if not chunk:
+            return None
+        buf += chunk
+        try:
+            size, _ = _DecodeVarint32(buf, 0)
+            break
+        except IndexError:
+            continue
+    data = b''
+    while len(data) < size:
+        packet = sock.recv(size - len(data))
+        if not packet:
+            return None
+        data += packet
+    return data
+
+
+def write_frame(sock, message):
+    payload = message.SerializeToString()
+    sock.sendall(_VarintBytes(len(payload)) + payload)
+
+
+class FakeWorld:
+    def __init__(self, host='127.0.0.1', port=0, arrive_delay=0.05, pack_delay=0.05, load_delay=0.05,
+                 resend_after=1.0, world_id=1000):
+        self.host = host
+        self.port = port
+        self.arrive_delay = arrive_delay
+        self.pack_delay = pack_delay
+        self.load_delay = load_delay
+        self.resend_after = resend_after
+        self.next_world_id = world_id
+        self.counts = Counter()
+        self.packages = {}
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.events = []
+        self.unacked = {}
+        self.seqnum = 0
+        self.client = None
+        self.running = False
+        self.server = None
+        # Outage knobs: refuse new sessions, or read commands without acting on them
+        self.accepting = True
+        self.swallow = False
+
+    def start(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((self.host, self.port))
+        self.server.listen(8)
+        self.port = self.server.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._event_loop, daemon=True).start()
+        return self.port
+
+    def stop(self):
+        self.running = False
+        for sock in (self.client, self.server):
+            if sock:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+
+    def drop_client(self):
+        """Close the current connection abruptly, as a crashed or restarted world would."""
+        client, self.client = self.client, None
+        if client:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+            self.counts['dropped'] += 1
+
+    def _next_seqnum(self):
+        with self.lock:
+            self.seqnum += 1
+            return self.seqnum
+
+    def _send(self, response):
+        client = self.client
+        if client is None:
+            return
+        try:
+            with self.send_lock:
+                write_frame(client, response)
+            self.counts['frames_out'] += 1
+        except OSError:
+            pass
+
+    def _schedule(self, delay, kind, build):
+        with self.lock:
+            heapq.heappush(self.events, (time.monotonic() + delay, self.counts['scheduled'], kind, build))
+            self.counts['scheduled'] += 1
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        if not self.accepting:
+            self.counts['refused'] += 1
+            client.close()
+            return
+        data = read_frame(client)
+        if data is None:
+            client.close()
+            return
+        connect = amazon_pb2.AConnect()
+        connect.ParseFromString(data)
+        reply = amazon_pb2.AConnected()
+        if connect.HasField('worldid'):
+            reply.worldid = connect.worldid
+        else:
+            reply.worldid = self.next_world_id
+            self.next_world_id += 1
+        reply.result = 'connected!'
+        self.client = client
+        write_frame(client, reply)
+        self.counts['connects'] += 1
+
+        while self.running:
+            try:
+                data = read_frame(client)
+            except OSError:
+                data = None
+            if data is None:
+                break
+            command = amazon_pb2.ACommands()
+            command.ParseFromString(data)
+            self.counts['frames_in'] += 1
+            if self.swallow:
+                self.counts['swallowed'] += 1
+                continue
+            if self._handle(command):
+                break
+        if self.client is client:
+            self.client = None
+        client.close()
+
+    def _handle(self, command):
+        acks = amazon_pb2.AResponses()
+        for seqnum in command.acks:
+            with self.lock:
+                self.unacked.pop(seqnum, None)
+            self.counts['acks_in'] += 1
+
+        for buy in command.buy:
+            acks.acks.append(buy.seqnum)
+            self.counts['buy'] += 1
+            self.counts['buy_things'] += len(buy.things)
+
+            def build(response, buy=buy):
+                arrived = response.arrived.add()
+                arrived.CopyFrom(buy)
+                arrived.seqnum = self._next_seqnum()
+                return arrived.seqnum
+            self._schedule(self.arrive_delay, 'arrived', build)
+
+        for pack in command.topack:
+            acks.acks.append(pack.seqnum)
+            self.counts['topack'] += 1
+            self.packages[pack.shipid] = 'packing'
+
+            def build(response, shipid=pack.shipid):
+                self.packages[shipid] = 'packed'
+                ready = response.ready.add()
+                ready.shipid = shipid
+                ready.seqnum = self._next_seqnum()
+                return ready.seqnum
+            self._schedule(self.pack_delay, 'ready', build)
+
+        for load in command.load:
+            acks.acks.append(load.seqnum)
+            self.counts['load'] += 1
+            self.packages[load.shipid] = 'loading'
+
+            def build(response, shipid=load.shipid):
+                self.packages[shipid] = 'loaded'
+                loaded = response.loaded.add()
+                loaded.shipid = shipid
+                loaded.seqnum = self._next_seqnum()
+                return loaded.seqnum
+            self._schedule(self.load_delay, 'loaded', build)
+
+        for query in command.queries:
+            acks.acks.append(query.seqnum)
+            self.counts['queries'] += 1
+            status = acks.packagestatus.add()
+            status.packageid = query.packageid
+            status.status = self.packages.get(query.packageid, 'unknown')
+            status.seqnum = self._next_seqnum()
+
+        if command.HasField('simspeed'):
+            self.counts['simspeed'] += 1
+
+        if acks.acks or acks.packagestatus:
+            self._send(acks)
+
+        if command.disconnect:
+            finished = amazon_pb2.AResponses()
+            finished.finished = True
+            self._send(finished)
+            return True
+        return False
+
+    def _event_loop(self):
+        while self.running:
+            now = time.monotonic()
+            response = amazon_pb2.AResponses()
+            with self.lock:
+                due = []
+                while self.events and self.events[0][0] <= now:
+                    due.append(heapq.heappop(self.events))
+                resend = [seqnum for seqnum, (sent_at, _) in self.unacked.items() if now - sent_at > self.resend_after]
+            for _, _, kind, build in due:
+                seqnum = build(response)
+                single = amazon_pb2.AResponses()
+                build_copy = getattr(response, kind)[-1]
+                getattr(single, kind).add().CopyFrom(build_copy)
+                with self.lock:
+                    self.unacked[seqnum] = (now, single)
+                self.counts[kind] += 1
+            for seqnum in resend:
+                with self.lock:
+                    entry = self.unacked.get(seqnum)
+                    if entry is None:
+                        continue
+                    self.unacked[seqnum] = (now, entry[1])
+                response.MergeFrom(entry[1])
+                self.counts['resent'] += 1
+            if due or resend:
+                self._send(response)
+            time.sleep(0.002)
+
+    def outstanding(self):
+        with self.lock:
+            return len(self.events) + len(self.unacked)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=23456)
+    parser.add_argument('--arrive-delay', type=float, default=0.5)
+    parser.add_argument('--pack-delay', type=float, default=0.5)
+    parser.add_argument('--load-delay', type=float, default=0.5)
+    args = parser.parse_args()
+
+    world = FakeWorld(args.host, args.port, args.arrive_delay, args.pack_delay, args.load_delay)
+    port = world.start()
+    print(f"Fake world listening on {args.host}:{port}")
+    try:
+        while True:
+            time.sleep(5)
+            print(dict(world.counts))
+    except KeyboardInterrupt:
+        world.stop()
+
+
+if __name__ == '__main__':
+    main()
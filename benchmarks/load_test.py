@@ -0,0 +1,440 @@
+"""
+End-to-end load test: browsing, cart, checkout and fulfillment against a local fake world and fake UPS.
+
+The app runs in-process behind werkzeug's threaded server. It is
+connected to benchmarks/fake_world.py, and UPS_URL points it at
+benchmarks/fake_ups.py. The fake UPS calls the app's webhooks back: a
+truck arrives for every shipment, and every loaded shipment is delivered.
+So each checkout goes through the whole lifecycle: pack, truck, load,
+deliver.
+
+U virtual users, each with its own HTTP session, log in and run I
+iterations of:
+
+  home             GET /
+  products         GET /products?page=n
+  product_detail   GET /products/<id>, V times
+  cart_add         POST /cart/add
+  cart_view        GET /cart
+  checkout         POST /checkout (one order per cart line, one shipment each)
+
+Alongside the users, a restock loop posts product_arrived world events
+to /api/world/event (world_product_arrived). The fake UPS's callbacks
+are reported as ups_truck_arrived and ups_shipment_delivered. After the
+users finish, the run waits until every shipment is delivered and reports
+two fulfillment times per shipment: UPS notified to loaded, and UPS
+notified to delivered.
+
+Every step gets a count, errors, requests/s over the run, and latency
+percentiles. The fulfillment stages (pack, truck wait, load, delivery)
+come from the app's shipment event log, as in /admin/shipment-latency.
+
+A request counts as an error when it fails, or when the app logged an
+ERROR while serving it: many pages catch a database error, log it and
+still answer 200. ERRORs logged outside a request, by the world
+listener or the pack retries, are reported as background errors.
+
+CSRF checks are off for the run, as in a test config, since the users
+are plain HTTP clients. The run uses DATABASE_URL when it is set, and
+otherwise a throwaway SQLite file. SQLite serializes writers, so only
+compare a run against a baseline from the same database.
+
+Baselines guard the hot paths against regressions. --save-baseline
+writes the results to benchmarks/baselines/load_test.json, or --baseline
+PATH. --compare checks a run against that file and exits with status 1
+when a step got slower or lost throughput beyond --tolerance, or when a
+step has errors the baseline did not. Baselines are only comparable on
+the same machine with the same arguments.
+
+    python benchmarks/load_test.py --users 8 --iterations 10
+    python benchmarks/load_test.py --save-baseline
+    python benchmarks/load_test.py --compare --tolerance 0.5
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import logging
+import threading
+from datetime import datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import requests
+from flask import g, has_request_context
+
+from fake_world import FakeWorld
+from fake_ups import FakeUPS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'load_test.json')
+PERCENTILES = (50, 90, 95, 99)
+# Set by the app under test on responses whose request logged an ERROR
+LOGGED_ERRORS_HEADER = 'X-Logged-Errors'
+# Arguments that change the workload; a baseline only applies to runs with the same ones
+WORKLOAD_ARGS = ('users', 'iterations', 'views', 'products', 'warehouses', 'quantity', 'restock_interval',
+                 'pack_delay', 'load_delay', 'truck_delay', 'deliver_delay', 'seed')
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)]
+
+
+class StepStats:
+    """Latency samples and errors per step, recorded from any thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, step, seconds, ok=True):
+        with self.lock:
+            self.samples.setdefault(step, []).append(seconds)
+            if not ok:
+                self.errors[step] = self.errors.get(step, 0) + 1
+
+    def timed(self, step, call, check=lambda response: response.status_code == 200):
+        start = time.perf_counter()
+        try:
+            response = call()
+            # Pages that swallow an exception still answer 200
+            ok = check(response) and not response.headers.get(LOGGED_ERRORS_HEADER)
+        except requests.exceptions.RequestException:
+            response, ok = None, False
+        self.record(step, time.perf_counter() - start, ok)
+        return response if ok else None
+
+    def summary(self, elapsed):
+        with self.lock:
+            samples = {step: sorted(values) for step, values in self.samples.items()}
+            errors = dict(self.errors)
+        steps = {}
+        for step, values in samples.items():
+            row = {
+                'count': len(values),
+                'errors': errors.get(step, 0),
+                'per_second': len(values) / elapsed,
+                'max_ms': values[-1] * 1e3
+            }
+            for p in PERCENTILES:
+                row[f'p{p}_ms'] = percentile(values, p) * 1e3
+            steps[step] = row
+        return steps
+
+
+def seed_database(app, args):
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+    from app.model import db, User, Product, ProductCategory, Warehouse, WarehouseProduct
+
+    with app.app_context():
+        seller = User.query.filter_by(email='admin@example.com').first()
+        category = ProductCategory.query.filter_by(category_name='General').first()
+        db.session.add_all([Warehouse(warehouse_id=w, x=w * 10, y=w * 10, active=True)
+                            for w in range(1, args.warehouses + 1)])
+        db.session.execute(insert(Product), [
+            {'product_id': p, 'category_id': category.category_id, 'product_name': f'Load test product {p}',
+             'description': f'Product {p}', 'price': 1 + p % 50, 'owner_id': seller.user_id}
+            for p in range(1, args.products + 1)
+        ])
+        db.session.execute(insert(WarehouseProduct), [
+            {'warehouse_id': w, 'product_id': p, 'quantity': args.iterations * args.users * 10}
+            for w in range(1, args.warehouses + 1) for p in range(1, args.products + 1)
+        ])
+        # A cheap hash: logging in is measured, the default 600k PBKDF2 rounds are not the point
+        password = generate_password_hash('loadtest', method='pbkdf2:sha256:1000')
+        db.session.execute(insert(User), [
+            {'email': f'load{u}@example.com', 'first_name': 'Load', 'last_name': f'User{u}', 'password': password,
+             'address': '1 Test Street', 'is_seller': False}
+            for u in range(args.users)
+        ])
+        db.session.commit()
+        return seller.user_id, Warehouse.query.all()
+
+
+def virtual_user(index, base_url, seller_id, stats, args, start_gate):
+    rng = random.Random(args.seed * 1000 + index)
+    session = requests.Session()
+    start_gate.wait()
+
+    def redirected_to(path):
+        return lambda response: response.status_code == 302 and response.headers.get('Location', '').endswith(path)
+
+    if stats.timed('login', lambda: session.post(f'{base_url}/login', allow_redirects=False, data={
+            'email': f'load{index}@example.com', 'password': 'loadtest'}), redirected_to('/')) is None:
+        return
+
+    pages = max((args.products + 11) // 12, 1)
+    for _ in range(args.iterations):
+        stats.timed('home', lambda: session.get(f'{base_url}/'))
+        stats.timed('products', lambda: session.get(f'{base_url}/products', params={'page': rng.randint(1, pages)}))
+        product_id = rng.randint(1, args.products)
+        for _ in range(args.views):
+            product_id = rng.randint(1, args.products)
+            stats.timed('product_detail', lambda: session.get(f'{base_url}/products/{product_id}'))
+        stats.timed('cart_add', lambda: session.post(f'{base_url}/cart/add', allow_redirects=False, data={
+            'product_id': product_id, 'seller_id': seller_id, 'quantity': rng.randint(1, args.quantity)}),
+            lambda response: response.status_code == 302)
+        stats.timed('cart_view', lambda: session.get(f'{base_url}/cart'))
+        stats.timed('checkout', lambda: session.post(f'{base_url}/checkout', allow_redirects=False, data={
+            'destination_x': rng.randint(-100, 100), 'destination_y': rng.randint(-100, 100)}), redirected_to('/'))
+
+
+def restock_loop(base_url, stats, args, stop):
+    rng = random.Random(args.seed)
+    session = requests.Session()
+    while not stop.wait(args.restock_interval):
+        product_id = rng.randint(1, args.products)
+        stats.timed('world_product_arrived', lambda: session.post(f'{base_url}/api/world/event', json={
+            'event_type': 'product_arrived',
+            'event_data': {'warehouse_id': rng.randint(1, args.warehouses), 'product_id': product_id,
+                           'description': f'Load test product {product_id}', 'quantity': 10}
+        }), lambda response: response.status_code == 200 and response.json().get('success'))
+
+
+class LoggedErrors(logging.Handler):
+    """Counts ERROR records: per request in `g`, and the rest as background errors."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.lock = threading.Lock()
+        self.background = 0
+
+    def emit(self, record):
+        if has_request_context():
+            g.logged_errors = g.get('logged_errors', 0) + 1
+        else:
+            with self.lock:
+                self.background += 1
+
+    def install(self, app):
+        logging.getLogger().addHandler(self)
+
+        @app.after_request
+        def report_logged_errors(response):
+            if g.get('logged_errors'):
+                response.headers[LOGGED_ERRORS_HEADER] = str(g.logged_errors)
+            return response
+
+
+def run(args):
+    world = FakeWorld(pack_delay=args.pack_delay, load_delay=args.load_delay)
+    world_port = world.start()
+    ups = FakeUPS(truck_delay=args.truck_delay, deliver_delay=args.deliver_delay)
+    ups.start()
+
+    db_file = None
+    if not os.environ.get('DATABASE_URL'):
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('LOG_LEVELS', 'werkzeug=WARNING,alembic=WARNING')
+    os.environ['WORLD_HOST'] = '127.0.0.1'
+    os.environ['WORLD_PORT'] = str(world_port)
+    os.environ['UPS_URL'] = ups.url
+    os.environ['NO_PROXY'] = '127.0.0.1,localhost'
+
+    from werkzeug.serving import make_server
+    from app import create_app, bootstrap_database
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    logged_errors = LoggedErrors()
+    logged_errors.install(app)
+    with app.app_context():
+        bootstrap_database()
+    seller_id, warehouses = seed_database(app, args)
+    service = app.config['WORLD_SIMULATOR_SERVICE']
+    with app.app_context():
+        world_id, result = service.connect(init_warehouses=warehouses)
+    if not world_id:
+        raise SystemExit(f"Could not connect to the fake world: {result}")
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ups.app_url = base_url
+
+    stats = StepStats()
+    start_gate = threading.Barrier(args.users + 1)
+    users = [threading.Thread(target=virtual_user, args=(i, base_url, seller_id, stats, args, start_gate))
+             for i in range(args.users)]
+    for user in users:
+        user.start()
+    stop_restock = threading.Event()
+    restock = threading.Thread(target=restock_loop, args=(base_url, stats, args, stop_restock), daemon=True)
+    start_gate.wait()
+    start = time.perf_counter()
+    restock.start()
+    for user in users:
+        user.join()
+    stop_restock.set()
+    restock.join()
+    users_done = time.perf_counter()
+
+    deadline = users_done + args.drain_timeout
+    while ups.outstanding() and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    undelivered = ups.outstanding()
+
+    with ups.lock:
+        for message_type, step in (('TruckArrived', 'ups_truck_arrived'),
+                                   ('ShipmentDelivered', 'ups_shipment_delivered')):
+            for seconds, ok in ups.webhooks[message_type]:
+                stats.record(step, seconds, ok)
+        for shipment_id, created in ups.created.items():
+            if shipment_id in ups.loaded:
+                stats.record('fulfillment_to_loaded', ups.loaded[shipment_id] - created)
+            if shipment_id in ups.delivered:
+                stats.record('fulfillment_to_delivered', ups.delivered[shipment_id] - created)
+
+    # Where the fulfillment time went, from the app's own shipment event log
+    from app.services.shipment_analytics import latency_report
+    with app.app_context():
+        app.config['SHIPMENT_EVENT_LOG'].flush()
+        report = latency_report(percentiles=PERCENTILES)
+    stages = {stage: {key: value * 1e3 if key.startswith('p') or key == 'mean' else value
+                      for key, value in entry['all'].items()}
+              for stage, entry in report['stages'].items()}
+
+    server.shutdown()
+    with app.app_context():
+        service.disconnect()
+        app.config['SHIPMENT_EVENT_LOG'].close()
+    logging.getLogger().removeHandler(logged_errors)
+    ups.stop()
+    world.stop()
+    if db_file:
+        os.unlink(db_file)
+
+    return {
+        'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'database': os.environ['DATABASE_URL'].split(':', 1)[0]
+        },
+        'args': {name: getattr(args, name) for name in WORKLOAD_ARGS},
+        'users_seconds': users_done - start,
+        'seconds': elapsed,
+        'shipments': len(ups.created),
+        'undelivered': undelivered,
+        'background_errors': logged_errors.background,
+        'world_frames_in': world.counts['frames_in'],
+        'world_counts': dict(world.counts),
+        'steps': stats.summary(elapsed),
+        'stages': stages
+    }
+
+
+def print_results(results):
+    steps = results['steps']
+    print(f"{results['args']['users']} users x {results['args']['iterations']} iterations: "
+          f"{results['users_seconds']:.1f} s of traffic, {results['seconds']:.1f} s until delivered; "
+          f"{results['shipments']} shipments, {results['undelivered']} undelivered, "
+          f"{results['background_errors']} errors logged outside requests")
+    print(f"  {'step':<26}{'count':>7}{'errors':>8}{'per s':>9}" + ''.join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+          + f"{'max ms':>10}")
+    for step in sorted(steps):
+        row = steps[step]
+        print(f"  {step:<26}{row['count']:>7}{row['errors']:>8}{row['per_second']:>9.1f}"
+              + ''.join(f"{row[f'p{p}_ms']:>10.1f}" for p in PERCENTILES) + f"{row['max_ms']:>10.1f}")
+    print("  fulfillment stages from the shipment event log (ms)")
+    for stage, row in results['stages'].items():
+        if row['count']:
+            print(f"  {stage:<26}{row['count']:>7}{'':>17}" + ''.join(f"{row[f'p{p}']:>10.1f}" for p in PERCENTILES))
+
+
+def compare(results, baseline, tolerance, min_delta_ms, min_samples):
+    """Regressions of `results` against `baseline`, one line each."""
+    regressions = []
+    if results['args'] != baseline['args']:
+        print(f"warning: baseline was recorded with different arguments: {baseline['args']}")
+
+    def slower(name, p95, base_p95, count):
+        # The p95 of a handful of samples is just the slowest one
+        if count >= min_samples and p95 > base_p95 * (1 + tolerance) and p95 - base_p95 > min_delta_ms:
+            regressions.append(f"{name}: p95 {p95:.1f} ms vs {base_p95:.1f} ms baseline")
+
+    for step, base in sorted(baseline['steps'].items()):
+        row = results['steps'].get(step)
+        if row is None:
+            regressions.append(f"{step}: missing from this run")
+            continue
+        slower(step, row['p95_ms'], base['p95_ms'], row['count'])
+        if row['per_second'] < base['per_second'] * (1 - tolerance):
+            regressions.append(f"{step}: {row['per_second']:.1f}/s vs {base['per_second']:.1f}/s baseline")
+        if row['errors'] > base['errors']:
+            regressions.append(f"{step}: {row['errors']} errors vs {base['errors']} in the baseline")
+    for stage, base in sorted(baseline['stages'].items()):
+        row = results['stages'].get(stage, {'count': 0})
+        if base['count'] and row['count']:
+            slower(f"stage {stage}", row['p95'], base['p95'], row['count'])
+    if results['undelivered'] > baseline['undelivered']:
+        regressions.append(f"{results['undelivered']} shipments undelivered vs {baseline['undelivered']} in the baseline")
+    if results['background_errors'] > baseline.get('background_errors', 0):
+        regressions.append(f"{results['background_errors']} errors logged outside requests vs "
+                           f"{baseline.get('background_errors', 0)} in the baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=10, help='browse/cart/checkout rounds per user')
+    parser.add_argument('--views', type=int, default=3, help='product pages viewed per iteration')
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--warehouses', type=int, default=5)
+    parser.add_argument('--quantity', type=int, default=3, help='largest quantity added to the cart')
+    parser.add_argument('--restock-interval', type=float, default=0.2, help='seconds between product_arrived events')
+    parser.add_argument('--pack-delay', type=float, default=0.05)
+    parser.add_argument('--load-delay', type=float, default=0.05)
+    parser.add_argument('--truck-delay', type=float, default=0.1)
+    parser.add_argument('--deliver-delay', type=float, default=0.1)
+    parser.add_argument('--drain-timeout', type=float, default=60, help='seconds to wait for every shipment to deliver')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to --baseline')
+    parser.add_argument('--compare', action='store_true', help='exit 1 on a regression against --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative p95 / throughput change')
+    parser.add_argument('--min-delta-ms', type=float, default=10, help='p95 changes smaller than this never count')
+    parser.add_argument('--min-samples', type=int, default=20, help='steps with fewer samples skip the p95 check')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        failing = sorted(step for step, row in results['steps'].items() if row['errors'])
+        if failing or results['background_errors']:
+            # A baseline with errors in it would let those code paths stay broken
+            sys.exit(f"not saving a baseline with errors: {', '.join(failing) or 'background errors'}")
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline written to {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms, args.min_samples)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (recorded {baseline['recorded_at']})")
+
+
+if __name__ == '__main__':
+    main()
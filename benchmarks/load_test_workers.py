@@ -0,0 +1,125 @@
+"""
+Throughput scaling of the production serving profile with gunicorn worker count.
+
+Starts one world gateway (`flask world-gateway`) plus gunicorn with 1, 2, 4...
+workers pointed at it, drives GET traffic from client processes for a fixed
+duration per step and reports requests/second and scaling efficiency.
+
+    python benchmarks/load_test_workers.py [--workers 1 2 4] [--duration 10] [--path /products]
+
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import requests
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+GATEWAY_PORT = 18090
+WEB_PORT = 18080
+
+
+def wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def client_loop(args):
+    url, duration = args
+    session = requests.Session()
+    done = 0
+    errors = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        try:
+            if session.get(url, timeout=10).status_code == 200:
+                done += 1
+            else:
+                errors += 1
+        except requests.exceptions.RequestException:
+            errors += 1
+    return done, errors
+
+
+def run_step(env, n_workers, path, duration, clients_per_worker):
+    step_env = dict(env, WEB_CONCURRENCY=str(n_workers), GUNICORN_THREADS='1',
+                    GUNICORN_BIND=f'127.0.0.1:{WEB_PORT}', GUNICORN_LOG_LEVEL='warning')
+    web = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null', 'wsgi:app'],
+        cwd=project_root, env=step_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f'http://127.0.0.1:{WEB_PORT}{path}'
+        if not wait_for(url):
+            raise RuntimeError(f"gunicorn with {n_workers} workers did not come up")
+        # warm every worker
+        with multiprocessing.Pool(n_workers * clients_per_worker) as pool:
+            pool.map(client_loop, [(url, 1)] * (n_workers * clients_per_worker))
+            start = time.time()
+            results = pool.map(client_loop, [(url, duration)] * (n_workers * clients_per_worker))
+            elapsed = time.time() - start
+        done = sum(r[0] for r in results)
+        errors = sum(r[1] for r in results)
+        return done / elapsed, errors
+    finally:
+        web.send_signal(signal.SIGTERM)
+        web.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--path', default='/products')
+    parser.add_argument('--clients-per-worker', type=int, default=2)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load_test_workers.db')
+    env.update({
+        'FLASK_APP': 'app',
+        'WORLD_GATEWAY_HOST': '127.0.0.1',
+        'WORLD_GATEWAY_PORT': str(GATEWAY_PORT),
+        'PYTHONUNBUFFERED': '1',
+    })
+    gateway_env = {k: v for k, v in env.items() if k != 'WORLD_GATEWAY_URL'}
+    env['WORLD_GATEWAY_URL'] = f'http://127.0.0.1:{GATEWAY_PORT}/gateway'
+
+    subprocess.run([sys.executable, '-m', 'flask', 'bootstrap'], cwd=project_root, env=gateway_env, check=True)
+    gateway = subprocess.Popen(
+        [sys.executable, '-m', 'flask', 'world-gateway'],
+        cwd=project_root, env=gateway_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_for(f'http://127.0.0.1:{GATEWAY_PORT}/gateway/status'):
+            raise RuntimeError("world gateway did not come up")
+
+        baseline = None
+        print(f"GET {args.path}, {args.duration:.0f}s per step, {args.clients_per_worker} client processes per worker")
+        print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'efficiency':>10} {'errors':>7}")
+        for n_workers in args.workers:
+            rps, errors = run_step(env, n_workers, args.path, args.duration, args.clients_per_worker)
+            if baseline is None:
+                baseline = rps / n_workers
+            speedup = rps / baseline
+            print(f"{n_workers:>8} {rps:>10.1f} {speedup:>8.2f} {speedup / n_workers:>10.0%} {errors:>7}")
+    finally:
+        gateway.send_signal(signal.SIGTERM)
+        gateway.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,8 +16,10 @@ drop table if exists orders_products cascade;
 drop table if exists Inventory cascade;
 drop table if exists warehouses cascade;
 drop table if exists warehouse_products cascade;
+drop table if exists reorder_points cascade;
 drop table if exists shipments cascade;
 drop table if exists shipment_items cascade;
+drop table if exists shipment_events cascade;
 drop table if exists world_messages cascade;
 drop table if exists ups_messages cascade;
 drop table if exists reviews cascade;
@@ -139,6 +141,20 @@ CREATE TABLE warehouse_products (
     UNIQUE (warehouse_id, product_id)
 );
 
+-- Reorder points for automatic replenishment
+CREATE TABLE reorder_points (
+    id SERIAL PRIMARY KEY,
+    warehouse_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    reorder_point INTEGER NOT NULL,
+    target_level INTEGER NOT NULL,
+    active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (warehouse_id, product_id),
+    CHECK (reorder_point >= 0 AND target_level >= reorder_point)
+);
+
 -- Shipments table
 CREATE TABLE shipments (
     shipment_id SERIAL PRIMARY KEY,
@@ -154,6 +170,8 @@ CREATE TABLE shipments (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 );
 
+CREATE INDEX idx_shipments_order_status ON shipments (order_id, status);
+
 -- Shipment Items (products in shipment)
 CREATE TABLE shipment_items (
     item_id SERIAL PRIMARY KEY,
@@ -164,6 +182,17 @@ CREATE TABLE shipment_items (
     UNIQUE (shipment_id, product_id)
 );
 
+-- Shipment lifecycle events (append-only)
+CREATE TABLE shipment_events (
+    id SERIAL PRIMARY KEY,
+    shipment_id INTEGER NOT NULL REFERENCES shipments(shipment_id),
+    event VARCHAR(20) NOT NULL,
+    truck_id BIGINT,
+    occurred_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_shipment_events_shipment ON shipment_events (shipment_id, occurred_at);
+
 -- World Messages table (for world simulator communication)
 CREATE TABLE world_messages (
     id SERIAL PRIMARY KEY,
@@ -0,0 +1,18 @@
+# Production serving profile: preforked gunicorn workers behind one world gateway.
+# Web workers reach the world through WORLD_GATEWAY_URL (see `flask world-gateway`);
+# without it every worker would open its own world socket.
+import os
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8080')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+# Each worker builds its own app (and DB connection pool) after the fork
+preload_app = False
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
@@ -1,9 +1,15 @@
 import os
-import random
+import io
+import re
+import csv
 import sys
+import time
+import random
+import argparse
+import multiprocessing
 from datetime import datetime, timedelta
 from faker import Faker
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, func, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError, OperationalError, IntegrityError
 
@@ -881,8 +887,407 @@ def create_reviews(users, products, n_reviews_to_create):
     return final_count
 
 
+# --- Bulk Generation Mode ---
+# python set_database.py --bulk --seed 7 --users 200000 --orders 2000000 --workers 8
+#
+# Every row is generated inside a fixed-size chunk from an RNG seeded with
+# (seed, phase, chunk), and primary keys are assigned from ranges reserved up
+# front, so the output is identical whatever --workers is. Chunks of the same
+# phase group run in parallel processes. PostgreSQL (psycopg2) is fed with
+# COPY FROM STDIN; other databases get executemany batches.
+
+BULK_ANCHOR = datetime(2025, 1, 1)
+BULK_SHIPMENT_STATUSES = ['packing', 'packed', 'loading', 'loaded', 'delivering', 'delivered']
+BULK_BASE_CATEGORIES = [
+    'Electronics', 'Computers', 'Smart Home', 'Automotive', 'Baby', 'Beauty', 'Health',
+    'Household', 'Kitchen', 'Industrial', 'Luggage', 'Music', 'Pet Supplies', 'Software',
+    'Sports', 'Outdoors', 'Tools', 'Toys & Games', 'Video Games', 'Books'
+]
+BULK_PRODUCT_KINDS = ['Device', 'Kit', 'System', 'Gadget', 'Tool', 'Accessory', 'Set']
+
+_bulk = {}  # per-process state: the plan and this process's engine
+
+
+def build_bulk_plan(args):
+    """Reserve id ranges and precompute everything the chunk workers share."""
+    from werkzeug.security import generate_password_hash
+
+    User, ProductCategory, Product = db_models['User'], db_models['ProductCategory'], db_models['Product']
+    Warehouse, Order, Shipment = db_models['Warehouse'], db_models['Order'], db_models['Shipment']
+
+    def next_id(column):
+        return (session.query(func.max(column)).scalar() or 0) + 1
+
+    bases = {
+        'user': next_id(User.user_id),
+        'category': next_id(ProductCategory.category_id),
+        'product': next_id(Product.product_id),
+        'warehouse': next_id(Warehouse.warehouse_id),
+        'order': next_id(Order.order_id),
+        'shipment': next_id(Shipment.shipment_id),
+    }
+
+    pool_fake = Faker()
+    pool_fake.seed_instance(args.seed)
+    price_rng = random.Random(f"{args.seed}:prices")
+    prices = [
+        max(0.99, min(round(price_rng.paretovariate(1.5) * price_rng.uniform(5, 50), 2), 5000.0))
+        for _ in range(args.products)
+    ]
+
+    return {
+        'seed': args.seed,
+        'n_sellers': args.sellers,
+        'n_buyers': args.users,
+        'n_categories': args.categories,
+        'n_products': args.products,
+        'n_warehouses': args.warehouses,
+        'n_orders': args.orders,
+        'n_reviews': args.reviews,
+        'max_items': args.max_items,
+        'listings_per_product': min(args.listings_per_product, args.sellers),
+        'warehouses_per_product': min(args.warehouses_per_product, args.warehouses),
+        'max_inventory': MAX_INITIAL_INVENTORY,
+        'shipment_ratio': args.shipment_ratio,
+        'chunk_size': args.chunk_size,
+        'bases': bases,
+        # One hash for every generated account (password: "password"); PBKDF2 per row dominates otherwise
+        'password_hash': generate_password_hash('password'),
+        'first_names': [pool_fake.first_name() for _ in range(500)],
+        'last_names': [pool_fake.last_name() for _ in range(500)],
+        'addresses': [pool_fake.address().replace('\n', ', ') for _ in range(300)],
+        'words': [pool_fake.word() for _ in range(400)],
+        'prices': prices,
+    }
+
+
+def _bulk_init(plan):
+    _bulk['plan'] = plan
+    _bulk['engine'] = create_engine(DATABASE_URL)
+
+
+def _bulk_rng(phase, chunk):
+    return random.Random(f"{_bulk['plan']['seed']}:{phase}:{chunk}")
+
+
+def _bulk_timestamp(rng):
+    return BULK_ANCHOR - timedelta(seconds=rng.randrange(365 * 86400))
+
+
+def _bulk_write(conn, model, columns, rows):
+    if not rows:
+        return 0
+    table = model.__table__
+    if conn.dialect.name == 'postgresql' and conn.dialect.driver == 'psycopg2':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = conn.connection.cursor()
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.close()
+    else:
+        conn.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+    return len(rows)
+
+
+def _bulk_users(conn, chunk, start, count):
+    plan, rng = _bulk['plan'], _bulk_rng('users', chunk)
+    rows = []
+    for k in range(start, start + count):
+        user_id = plan['bases']['user'] + k
+        is_seller = k < plan['n_sellers']
+        first, last = rng.choice(plan['first_names']), rng.choice(plan['last_names'])
+        email = re.sub(r'[^a-z0-9.]', '', f"{first}.{last}".lower()) + f".{user_id}@example.com"
+        balance = round(rng.uniform(500.0, 10000.0) if is_seller else rng.uniform(50.0, 2000.0), 2)
+        created = _bulk_timestamp(rng)
+        rows.append((user_id, email, first, last, rng.choice(plan['addresses']), plan['password_hash'],
+                     balance, is_seller, created, created))
+    columns = ('user_id', 'email', 'first_name', 'last_name', 'address', 'password',
+               'current_balance', 'is_seller', 'created_at', 'updated_at')
+    return {'accounts': _bulk_write(conn, db_models['User'], columns, rows)}
+
+
+def _bulk_categories(conn, chunk, start, count):
+    plan, rng = _bulk['plan'], _bulk_rng('categories', chunk)
+    rows = []
+    for k in range(start, start + count):
+        category_id = plan['bases']['category'] + k
+        rows.append((category_id, f"{rng.choice(BULK_BASE_CATEGORIES)} {category_id}", _bulk_timestamp(rng)))
+    columns = ('category_id', 'category_name', 'created_at')
+    return {'products_categories': _bulk_write(conn, db_models['ProductCategory'], columns, rows)}
+
+
+def _bulk_warehouses(conn, chunk, start, count):
+    plan, rng = _bulk['plan'], _bulk_rng('warehouses', chunk)
+    rows = []
+    for k in range(start, start + count):
+        created = _bulk_timestamp(rng)
+        rows.append((plan['bases']['warehouse'] + k, rng.randint(0, 100), rng.randint(0, 100), True, created, created))
+    columns = ('warehouse_id', 'x', 'y', 'active', 'created_at', 'updated_at')
+    return {'warehouses': _bulk_write(conn, db_models['Warehouse'], columns, rows)}
+
+
+def _bulk_products(conn, chunk, start, count):
+    plan, rng = _bulk['plan'], _bulk_rng('products', chunk)
+    bases, words = plan['bases'], plan['words']
+    rows = []
+    for k in range(start, start + count):
+        product_id = bases['product'] + k
+        name = f"{rng.choice(words).capitalize()} {rng.choice(words).capitalize()} {rng.choice(BULK_PRODUCT_KINDS)} {product_id}"
+        created = _bulk_timestamp(rng)
+        rows.append((
+            product_id,
+            bases['category'] + k % plan['n_categories'],
+            name[:100],
+            ' '.join(rng.sample(words, 16)).capitalize() + '.',
+            f"https://picsum.photos/seed/{product_id}/400/300",
+            plan['prices'][k],
+            bases['user'] + k % plan['n_sellers'],
+            created,
+            created
+        ))
+    columns = ('product_id', 'category_id', 'product_name', 'description', 'image', 'price',
+               'owner_id', 'created_at', 'updated_at')
+    return {'products': _bulk_write(conn, db_models['Product'], columns, rows)}
+
+
+def _bulk_listings(conn, chunk, start, count):
+    """Seller listings (Inventory) and warehouse stock (WarehouseProduct) for a product range."""
+    plan, rng = _bulk['plan'], _bulk_rng('listings', chunk)
+    bases = plan['bases']
+    listing_rows, stock_rows = [], []
+    for k in range(start, start + count):
+        product_id = bases['product'] + k
+        owner_id = bases['user'] + k % plan['n_sellers']
+        created = _bulk_timestamp(rng)
+        # Seller j of product k is (k + j) % n_sellers, so j == 0 is the owner and order
+        # generation can pick a valid listing without looking anything up
+        for j in range(plan['listings_per_product']):
+            listing_rows.append((
+                bases['user'] + (k + j) % plan['n_sellers'],
+                product_id,
+                rng.randint(0, 500),
+                round(plan['prices'][k] * rng.uniform(0.9, 1.2), 2),
+                owner_id,
+                bases['warehouse'] + (k + j) % plan['n_warehouses'],
+                created,
+                created
+            ))
+        for j in range(plan['warehouses_per_product']):
+            stock_rows.append((
+                bases['warehouse'] + (k + j) % plan['n_warehouses'],
+                product_id,
+                rng.randint(0, plan['max_inventory']),
+                created,
+                created
+            ))
+    return {
+        'inventory': _bulk_write(conn, db_models['Inventory'], (
+            'seller_id', 'product_id', 'quantity', 'unit_price', 'owner_id', 'warehouse_id', 'created_at', 'updated_at'
+        ), listing_rows),
+        'warehouse_products': _bulk_write(conn, db_models['WarehouseProduct'], (
+            'warehouse_id', 'product_id', 'quantity', 'created_at', 'updated_at'
+        ), stock_rows),
+    }
+
+
+def _bulk_orders(conn, chunk, start, count):
+    """Orders with their lines, plus a shipment (and shipment items) for most of them."""
+    plan, rng = _bulk['plan'], _bulk_rng('orders', chunk)
+    bases, prices = plan['bases'], plan['prices']
+    n_products, n_sellers = plan['n_products'], plan['n_sellers']
+    buyer_base = bases['user'] + n_sellers
+    order_rows, line_rows, shipment_rows, item_rows = [], [], [], []
+
+    for k in range(start, start + count):
+        order_id = bases['order'] + k
+        ordered_at = _bulk_timestamp(rng)
+        product_indexes = rng.sample(range(n_products), min(rng.randint(1, plan['max_items']), n_products))
+
+        status = None
+        if rng.random() < plan['shipment_ratio']:
+            status = rng.choice(BULK_SHIPMENT_STATUSES)
+        fulfilled = status == 'delivered'
+        line_status = 'Fulfilled' if fulfilled else 'Unfulfilled'
+        fulfilled_at = ordered_at + timedelta(days=rng.randint(1, 7)) if fulfilled else None
+
+        total, units = 0.0, 0
+        for p in product_indexes:
+            quantity = rng.randint(1, 5)
+            seller_id = bases['user'] + (p + rng.randrange(plan['listings_per_product'])) % n_sellers
+            total += quantity * prices[p]
+            units += quantity
+            line_rows.append((order_id, bases['product'] + p, quantity, prices[p], seller_id, line_status, fulfilled_at))
+
+        order_rows.append((order_id, buyer_base + rng.randrange(plan['n_buyers']), round(total, 2), ordered_at,
+                           units, 'Fulfilled' if fulfilled else 'Unfulfilled'))
+
+        if status:
+            shipment_id = bases['shipment'] + k
+            shipment_rows.append((
+                shipment_id, order_id, bases['warehouse'] + rng.randrange(plan['n_warehouses']),
+                rng.randint(1, 1000) if status != 'packing' else None, f"1Z{order_id:012d}",
+                rng.randint(0, 100), rng.randint(0, 100), status, ordered_at, fulfilled_at or ordered_at
+            ))
+            for line in line_rows[-len(product_indexes):]:
+                item_rows.append((shipment_id, line[1], line[2], ordered_at))
+
+    return {
+        'orders': _bulk_write(conn, db_models['Order'], (
+            'order_id', 'buyer_id', 'total_amount', 'order_date', 'num_products', 'order_status'
+        ), order_rows),
+        'orders_products': _bulk_write(conn, db_models['OrderProduct'], (
+            'order_id', 'product_id', 'quantity', 'price', 'seller_id', 'status', 'fulfillment_date'
+        ), line_rows),
+        'shipments': _bulk_write(conn, db_models['Shipment'], (
+            'shipment_id', 'order_id', 'warehouse_id', 'truck_id', 'ups_tracking_id',
+            'destination_x', 'destination_y', 'status', 'created_at', 'updated_at'
+        ), shipment_rows),
+        'shipment_items': _bulk_write(conn, db_models['ShipmentItem'], (
+            'shipment_id', 'product_id', 'quantity', 'created_at'
+        ), item_rows),
+    }
+
+
+def _bulk_reviews(conn, chunk, start, count):
+    plan, rng = _bulk['plan'], _bulk_rng('reviews', chunk)
+    bases, words = plan['bases'], plan['words']
+    buyer_base = bases['user'] + plan['n_sellers']
+    rows = []
+    for _ in range(count):
+        product_id, seller_id = None, None
+        if rng.random() < 0.8:
+            product_id = bases['product'] + rng.randrange(plan['n_products'])
+        else:
+            seller_id = bases['user'] + rng.randrange(plan['n_sellers'])
+        rows.append((
+            buyer_base + rng.randrange(plan['n_buyers']), product_id, seller_id,
+            rng.choices([1, 2, 3, 4, 5], weights=[5, 5, 15, 35, 40])[0],
+            ' '.join(rng.sample(words, 10)).capitalize() + '.',
+            _bulk_timestamp(rng)
+        ))
+    columns = ('user_id', 'product_id', 'seller_id', 'rating', 'comment', 'review_date')
+    return {'reviews': _bulk_write(conn, db_models['Review'], columns, rows)}
+
+
+BULK_PHASES = {
+    'users': _bulk_users,
+    'categories': _bulk_categories,
+    'warehouses': _bulk_warehouses,
+    'products': _bulk_products,
+    'listings': _bulk_listings,
+    'orders': _bulk_orders,
+    'reviews': _bulk_reviews,
+}
+
+
+def _bulk_run_chunk(task):
+    phase, chunk, start, count = task
+    with _bulk['engine'].begin() as conn:
+        return phase, BULK_PHASES[phase](conn, chunk, start, count)
+
+
+def _bulk_tasks(phase, total, chunk_size):
+    return [(phase, i, start, min(chunk_size, total - start)) for i, start in enumerate(range(0, total, chunk_size))]
+
+
+def _bulk_reset_sequences():
+    if engine.dialect.name != 'postgresql':
+        return
+    serial_columns = [
+        ('accounts', 'user_id'), ('products_categories', 'category_id'), ('products', 'product_id'),
+        ('warehouses', 'warehouse_id'), ('orders', 'order_id'), ('shipments', 'shipment_id'),
+    ]
+    with engine.begin() as conn:
+        for table, column in serial_columns:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                f"COALESCE((SELECT MAX({column}) FROM {table}), 1))"
+            ))
+
+
+def run_bulk(args):
+    imported_db.metadata.create_all(engine)
+    workers = args.workers
+    if engine.dialect.name == 'sqlite' and workers > 1:
+        print("SQLite allows a single writer; running bulk mode with 1 worker.")
+        workers = 1
+
+    plan = build_bulk_plan(args)
+    session.close()
+    print(f"Bulk seeding with seed {args.seed}, {workers} worker(s), chunks of {args.chunk_size}; id bases: {plan['bases']}")
+
+    # Phases in one group have no foreign keys between them and run side by side
+    phase_groups = [
+        [('users', args.sellers + args.users), ('categories', args.categories), ('warehouses', args.warehouses)],
+        [('products', args.products)],
+        [('listings', args.products)],
+        [('orders', args.orders), ('reviews', args.reviews)],
+    ]
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_bulk_init, initargs=(plan,))
+    else:
+        _bulk_init(plan)
+
+    totals = {}
+    started = time.perf_counter()
+    try:
+        for group in phase_groups:
+            group_started = time.perf_counter()
+            tasks = [task for phase, total in group for task in _bulk_tasks(phase, total, args.chunk_size)]
+            results = pool.imap_unordered(_bulk_run_chunk, tasks) if pool else map(_bulk_run_chunk, tasks)
+            group_rows = 0
+            for phase, counts in results:
+                for table, n in counts.items():
+                    totals[table] = totals.get(table, 0) + n
+                    group_rows += n
+            elapsed = time.perf_counter() - group_started
+            names = ', '.join(phase for phase, _ in group)
+            print(f"  {names}: {group_rows} rows in {elapsed:.1f}s ({group_rows / max(elapsed, 1e-9):.0f} rows/s)")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    _bulk_reset_sequences()
+    elapsed = time.perf_counter() - started
+    print(f"Bulk seeding finished in {elapsed:.1f}s:")
+    for table, n in totals.items():
+        print(f"  {table}: {n}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed the mini_amazon database with fake data.")
+    parser.add_argument('--force', action='store_true', help="seed even if the database already looks populated")
+    parser.add_argument('--bulk', action='store_true', help="high-volume mode (COPY/executemany, parallel, seeded)")
+    bulk = parser.add_argument_group('bulk mode')
+    bulk.add_argument('--seed', type=int, default=42)
+    bulk.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    bulk.add_argument('--chunk-size', type=int, default=20000)
+    bulk.add_argument('--users', type=int, default=10000, help="buyers")
+    bulk.add_argument('--sellers', type=int, default=500)
+    bulk.add_argument('--categories', type=int, default=50)
+    bulk.add_argument('--products', type=int, default=20000)
+    bulk.add_argument('--warehouses', type=int, default=20)
+    bulk.add_argument('--orders', type=int, default=100000)
+    bulk.add_argument('--max-items', type=int, default=MAX_ITEMS_PER_ORDER * 2 - 1, help="order lines per order: 1..N")
+    bulk.add_argument('--reviews', type=int, default=50000)
+    bulk.add_argument('--listings-per-product', type=int, default=MIN_SELLERS_PER_PRODUCT + 1)
+    bulk.add_argument('--warehouses-per-product', type=int, default=3)
+    bulk.add_argument('--shipment-ratio', type=float, default=0.85)
+    return parser.parse_args(argv)
+
+
 # --- Main Execution Logic ---
 if __name__ == "__main__":
+    args = parse_args()
+    if args.bulk:
+        run_bulk(args)
+        engine.dispose()
+        sys.exit(0)
+
     print("Starting database seeding...")
 
     user_count = session.query(func.count(db_models['User'].user_id)).scalar()
@@ -903,7 +1308,7 @@ if __name__ == "__main__":
         inventory_count > product_count * (MIN_SELLERS_PER_PRODUCT * 0.5) # Check if seller inventory seems somewhat populated
     )
 
-    if len(sys.argv) > 1 and sys.argv[1] == '--force':
+    if args.force:
          print("Force flag detected. Proceeding with seeding anyway...")
          skip_seeding = False
     elif skip_seeding: